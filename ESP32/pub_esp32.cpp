@@ -2,6 +2,8 @@
 #include <WiFi.h> // ไลบรารีสำหรับ Wi-Fi
 #include <PubSubClient.h> // ไลบรารีสำหรับ MQTT
 #include "DHT.h"
+#include <sys/time.h>
+#include <time.h>
 
 // --- 1. กำหนดค่า Wi-Fi ---
 const char* ssid = "internet"; // ชื่อ Wi-Fi 
@@ -11,13 +13,27 @@ const char* password = "12345789"; // รหัสผ่าน Wi-Fi
 // IP Address ของ Raspberry Pi (MQTT Broker)
 const char* mqtt_server = ""; // ***IP ของ Raspberry Pi ***
 const int mqtt_port = 1883;
-const char* mqtt_client_id = "ESP32_Sensor_Publisher";
+const char* mqtt_client_id = "ESP32_Sensor_Publisher"; // ต้องไม่ซ้ำกันถ้ามีหลาย ESP32
+const char* node_id = "esp32"; // ชื่อ node (ต้องไม่ซ้ำกันในโรงเรือน)
 
 // Topic สำหรับส่งข้อมูล
 const char* mqtt_topic_co2 = "iot/esp/co2";
 const char* mqtt_topic_humidity = "iot/esp/humidity";
 const char* mqtt_topic_soil = "iot/esp/soil";
-const char* mqtt_topic_all = "iot/esp/data"; // Topic สำหรับส่งข้อมูลรวม (CSV)
+String mqtt_topic_all = String("iot/esp/") + node_id + "/data"; // Topic สำหรับส่งข้อมูลรวม (CSV)
+
+// --- เวลา + ลำดับ message (ให้ subscriber วัด latency / หา message ที่หาย) ---
+// CSV: co2,humidity,soil,seq,ts   (ts = epoch วินาทีตอนอ่าน sensor, ว่างถ้ายังไม่ได้เวลาจาก NTP)
+const char* ntp_server = "pool.ntp.org";
+unsigned long msg_seq = 0;
+
+// epoch วินาที (ทศนิยม ms) หรือ 0 ถ้านาฬิกายังไม่ sync
+double epoch_now() {
+  struct timeval tv;
+  gettimeofday(&tv, NULL);
+  if (tv.tv_sec < 1600000000) return 0;  // ยังไม่ได้เวลาจาก NTP (ยังเป็นปี 1970)
+  return tv.tv_sec + tv.tv_usec / 1000000.0;
+}
 
 // --- 3. การกำหนดค่าเซ็นเซอร์ (เหมือนเดิม) ---
 // MQ135
@@ -31,6 +47,26 @@ DHT dht(DHTPIN, DHTTYPE);
 // Soil HW-390
 #define Soil_PIN 32
 
+// --- Report-by-exception ---
+// ส่งเมื่อค่าใดค่าหนึ่งเปลี่ยนเกิน deadband หรือไม่ได้ส่งมานานเกิน MAX_SILENCE_MS (heartbeat)
+const float CO2_DEADBAND = 10.0;   // ADC raw
+const float HUM_DEADBAND = 1.0;    // %
+const float SOIL_DEADBAND = 20.0;  // ADC raw
+const unsigned long MAX_SILENCE_MS = 60000;
+
+float last_sent_co2 = NAN;
+float last_sent_hum = NAN;
+float last_sent_soil = NAN;
+unsigned long last_sent_at = 0;
+
+bool should_publish(float co2, float hum, float soil) {
+  if (isnan(last_sent_co2)) return true;  // ยังไม่เคยส่ง
+  if (millis() - last_sent_at >= MAX_SILENCE_MS) return true;
+  return fabs(co2 - last_sent_co2) > CO2_DEADBAND ||
+         fabs(hum - last_sent_hum) > HUM_DEADBAND ||
+         fabs(soil - last_sent_soil) > SOIL_DEADBAND;
+}
+
 // --- 4. การสร้าง Object สำหรับ Wi-Fi และ MQTT ---
 WiFiClient espClient;
 PubSubClient client(espClient);
@@ -84,6 +120,7 @@ void setup()
   setup_wifi();
 
   client.setServer(mqtt_server, mqtt_port);
+  configTime(0, 0, ntp_server);  // UTC, sync เบื้องหลัง
 
   pinMode(Soil_PIN, INPUT);
   analogReadResolution(12);
@@ -108,17 +145,26 @@ void loop()
   int mq135Value = analogRead(MQ135_PIN);
   float humidity = dht.readHumidity();
   int SoilValue = analogRead(Soil_PIN);
+  double read_ts = epoch_now();
 
   // ตรวจสอบค่า DHT (humidity)
   if (isnan(humidity)) {
     Serial.println("DHT11 Error: ไม่สามารถอ่านค่าได้, ไม่ส่งค่านี้");
+  } else if (!should_publish(mq135Value, humidity, SoilValue)) {
+    Serial.println("ค่าไม่เปลี่ยนเกิน deadband, ไม่ส่ง");
   } else {
     // -------- 2. สร้าง String สำหรับส่ง (CSV) --------
-    // รูปแบบ CSV: CO2_Value,Humidity,Soil_Value
-    String payload = String(mq135Value) + "," + String(humidity) + "," + String(SoilValue);
+    // รูปแบบ CSV: CO2_Value,Humidity,Soil_Value,seq,ts
+    String payload = String(mq135Value) + "," + String(humidity) + "," + String(SoilValue) +
+                     "," + String(msg_seq) + "," + (read_ts > 0 ? String(read_ts, 3) : String(""));
     
     // -------- 3. เผยแพร่ (Publish) ข้อมูล --------
-    client.publish(mqtt_topic_all, payload.c_str());
+    client.publish(mqtt_topic_all.c_str(), payload.c_str());
+    msg_seq++;
+    last_sent_co2 = mq135Value;
+    last_sent_hum = humidity;
+    last_sent_soil = SoilValue;
+    last_sent_at = millis();
     Serial.print("Published to ");
     Serial.print(mqtt_topic_all);
     Serial.print(": ");
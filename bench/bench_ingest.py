@@ -0,0 +1,229 @@
+# bench_ingest.py
+# วัดว่า subscriber_main_on_pi.py / Dashboard.py รับข้อมูลได้กี่ msg/s ก่อนจะตามไม่ทัน
+#
+#   ต้องมี mosquitto รันอยู่ (localhost:1883)
+#
+#   # subscriber 1 process, 50 ESP32 @1Hz + 10 Pi @0.5Hz
+#   python bench/bench_ingest.py --esp 50 --pi 10 --duration 60
+#
+#   # shared subscription: เทียบ throughput 1 / 2 / 4 process
+#   python bench/bench_ingest.py --procs 1,2,4 --esp 200 --esp-rate 20 --duration 30
+#
+#   # Dashboard (วัด lag จาก /api/live)
+#   python bench/bench_ingest.py --target dashboard --esp 50 --pi 10
+#
+# รายงาน: ingest rate ที่รับได้จริง, end-to-end lag (p50/p95/p99/max), RSS ของ process ที่ทดสอบ
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import load_gen
+from fake_influx import PROBE_MOD_MS, probe_now_ms, start_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..", "raspberryPI__camera")
+
+
+def rss_kib(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(q / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def lag_summary(lags):
+    if not lags:
+        return {"n": 0}
+    return {
+        "n": len(lags),
+        "p50_ms": percentile(lags, 50),
+        "p95_ms": percentile(lags, 95),
+        "p99_ms": percentile(lags, 99),
+        "max_ms": max(lags),
+        "mean_ms": statistics.fmean(lags),
+    }
+
+
+def spawn_targets(args, influx_port, workdir, n):
+    env = dict(os.environ, INFLUX_URL=f"http://127.0.0.1:{influx_port}")
+    procs = []
+    for i in range(n):
+        if args.target == "subscriber":
+            cmd = [sys.executable, os.path.join(APP_DIR, "subscriber_main_on_pi.py"),
+                   "--quiet", "--no-relay", "--workers", str(args.workers)]
+            if n > 1:
+                cmd += ["--share-group", args.share_group]
+        else:
+            cmd = [sys.executable, os.path.join(APP_DIR, "Dashboard.py")]
+        log = open(os.path.join(workdir, f"{args.target}-{i}.log"), "w")
+        procs.append(subprocess.Popen(cmd, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT))
+    return procs
+
+
+def poll_dashboard(url, stop, lags):
+    """Dashboard ไม่เขียน Influx -> วัด lag จาก probe ใน /api/live แทน"""
+    last = None
+    while not stop.is_set():
+        try:
+            with urllib.request.urlopen(url, timeout=2) as r:
+                d = json.loads(r.read())
+            probe = d.get("esp_soil")
+            if probe is not None and probe != last:
+                last = probe
+                lag = (probe_now_ms() - float(probe)) % PROBE_MOD_MS
+                if lag < 3_600_000:
+                    lags.append(lag)
+        except Exception:
+            pass
+        time.sleep(0.05)
+
+
+def run_once(args, n_procs):
+    server, stats = start_server("127.0.0.1", args.influx_port)
+    workdir = tempfile.mkdtemp(prefix="iot-bench-")
+    procs = spawn_targets(args, args.influx_port, workdir, n_procs)
+
+    try:
+        time.sleep(args.startup)
+        for p in procs:
+            if p.poll() is not None:
+                raise SystemExit(f"{args.target} exited early, see logs in {workdir}")
+
+        rss_start = [rss_kib(p.pid) for p in procs]
+        rss_samples = []
+        dash_lags = []
+        stop = threading.Event()
+        if args.target == "dashboard":
+            threading.Thread(target=poll_dashboard, args=(args.dashboard_url, stop, dash_lags), daemon=True).start()
+
+        # warmup ไม่นับ
+        if args.warmup > 0:
+            warm = argparse.Namespace(**vars(args))
+            warm.duration = args.warmup
+            load_gen.run(warm)
+            time.sleep(1.0)
+        stats.reset()
+        stats.take_lags()
+        dash_lags.clear()
+
+        result = {}
+
+        def publish():
+            result.update(load_gen.run(args))
+
+        pub = threading.Thread(target=publish, daemon=True)
+        t0 = time.monotonic()
+        pub.start()
+        while pub.is_alive():
+            pub.join(1.0)
+            rss_samples.append(sum(r or 0 for r in (rss_kib(p.pid) for p in procs)))
+        elapsed = time.monotonic() - t0
+        points_in_window = stats.snapshot()["points"]
+
+        # รอ subscriber flush (batch) แล้วดูว่าค้างอยู่เท่าไร
+        time.sleep(args.drain)
+        stop.set()
+
+        sent = result.get("esp", 0) + result.get("pi", 0) + result.get("camera", 0)
+        snap = stats.snapshot()
+        lags = stats.take_lags() if args.target == "subscriber" else list(dash_lags)
+        rss_end = [rss_kib(p.pid) for p in procs]
+
+        report = {
+            "target": args.target,
+            "procs": n_procs,
+            "sent_msgs": sent,
+            "sent_rate": sent / result.get("elapsed_s", elapsed),
+            "lag": lag_summary(lags),
+            "rss_start_kib": sum(r or 0 for r in rss_start),
+            "rss_end_kib": sum(r or 0 for r in rss_end),
+            "rss_peak_kib": max(rss_samples) if rss_samples else None,
+        }
+        report["rss_growth_kib"] = report["rss_end_kib"] - report["rss_start_kib"]
+        if args.target == "subscriber":
+            report["influx_points"] = snap["points"]
+            report["influx_writes"] = snap["writes"]
+            # นับเฉพาะที่เขียนเสร็จภายในช่วงเวลาที่ publish (ไม่รวมช่วง drain)
+            report["ingest_rate"] = points_in_window / elapsed
+            report["backlog_msgs"] = max(0, result.get("esp", 0) + result.get("pi", 0) - snap["points"])
+        return report
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        server.shutdown()
+        server.server_close()
+
+
+def print_report(r):
+    lag = r["lag"]
+    line = f"[{r['target']} x{r['procs']}] sent {r['sent_rate']:.0f} msg/s"
+    if "ingest_rate" in r:
+        line += f" | ingested {r['ingest_rate']:.0f} pts/s, backlog {r['backlog_msgs']}"
+    if lag.get("n"):
+        line += (f" | lag p50 {lag['p50_ms']:.0f} ms p95 {lag['p95_ms']:.0f} ms"
+                 f" p99 {lag['p99_ms']:.0f} ms max {lag['max_ms']:.0f} ms")
+    line += f" | RSS {r['rss_start_kib'] / 1024:.1f} -> {r['rss_end_kib'] / 1024:.1f} MiB"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest throughput benchmark for the subscriber / dashboard")
+    load_gen.add_arguments(parser)
+    parser.add_argument("--target", choices=("subscriber", "dashboard"), default="subscriber")
+    parser.add_argument("--procs", default="1", help="comma separated process counts, e.g. 1,2,4 (subscriber only)")
+    parser.add_argument("--workers", type=int, default=4, help="ingest workers per subscriber process")
+    parser.add_argument("--share-group", default="bench")
+    parser.add_argument("--influx-port", type=int, default=18086)
+    parser.add_argument("--dashboard-url", default="http://127.0.0.1:5001/api/live")
+    parser.add_argument("--startup", type=float, default=3.0, help="seconds to wait for the target to start")
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--drain", type=float, default=3.0, help="seconds to wait for batches after publishing stops")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    counts = [int(x) for x in args.procs.split(",") if x.strip()]
+    if args.target == "dashboard":
+        counts = [1]
+
+    reports = []
+    for n in counts:
+        r = run_once(args, n)
+        print_report(r)
+        reports.append(r)
+
+    if len(reports) > 1 and reports[0].get("ingest_rate"):
+        base = reports[0]["ingest_rate"]
+        for r in reports[1:]:
+            print(f"x{r['procs']}: {r['ingest_rate'] / base:.2f}x of x{reports[0]['procs']}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+# bench_micro.py
+# micro-benchmark ของ hot path ใน entry point ทั้ง 4 ตัว บน fake hardware (hw_shim.py)
+# ไม่ต้องมี Pi / เซนเซอร์ / กล้อง / InfluxDB / mosquitto
+#
+#   python bench/bench_micro.py                                  # ทุก case
+#   python bench/bench_micro.py -k dashboard                     # เฉพาะ case ที่ชื่อมีคำนี้
+#                                                                # (ชื่อกลุ่ม / "<กลุ่ม>.xxx" = ไม่ setup กลุ่มอื่นเลย)
+#   python bench/bench_micro.py --save bench/baseline.json       # เก็บเป็น baseline
+#   python bench/bench_micro.py --compare bench/baseline.json    # exit 1 ถ้าช้ากว่า baseline เกิน --threshold
+#
+# แต่ละ case: หาจำนวนครั้งต่อรอบให้ใช้เวลา >= --min-time แล้ววัด --rounds รอบ (ปิด gc ระหว่างวัดแบบ timeit)
+# รายงาน median / min ต่อครั้ง เทียบ baseline ด้วย median
+# ค่าขึ้นกับเครื่อง: เทียบกับ baseline ที่วัดบนเครื่องเดียวกันเท่านั้น (ดู "meta" ใน JSON)
+# กลุ่มที่ import ไม่ได้ (เช่นไม่มี opencv-python -> camera) ถูกข้าม กลุ่มอื่นยังวัดได้
+#
+# แยกจาก tests/ (pytest): tests ตรวจความถูกต้องทุกครั้ง ส่วนไฟล์นี้รันเมื่อต้องการวัด
+# และเทียบ baseline.json ที่ commit ไว้ได้โดยไม่ต้องมี plugin (pytest-benchmark) เพิ่ม
+import argparse
+import base64
+import datetime
+import gc
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from hw_shim import HardwareShim
+
+CAM_JPEG_BYTES = 60_000   # เท่ากับ load_gen.py --cam-bytes
+BATCH_ROWS     = 50       # BATCH_INTERVAL 5 s / BATCH_LIGHT_PERIOD 0.1 s
+HISTORY_NODE_S = 3 * 3600 # ข้อมูลใน ring buffer ของ Dashboard (1 Hz) ให้ range=1h ตอบจาก RAM
+
+
+class Msg:
+    """Just enough of paho's MQTTMessage for on_message()."""
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class StaticSampler:
+    """SensorSampler.latest() with a fixed value read 'just now'."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def latest(self):
+        return self.value, time.time()
+
+
+# ---------------- payloads (เหมือนที่ publisher จริงส่ง) ----------------
+def pi_message(seq):
+    now = time.time()
+    return {
+        "pi": {"temperature": 23.1, "temperature_ts": now - 0.5, "light": 412.5, "light_ts": now - 0.2,
+               "probes": {"28-0316a2792fff": 23.1, "28-0316a27a1eff": 24.5}, "probes_ts": now - 0.5},
+        "seq": seq, "sent_ts": now,
+    }
+
+
+def pi_payload(seq):
+    return json.dumps(pi_message(seq)).encode()
+
+
+def batch_payload(encode_batch, seq):
+    now = time.time()
+    rows = [(now - 5 + i * 0.1, {"light": 400.0 + i}) for i in range(BATCH_ROWS)]
+    rows[0][1]["temperature"] = 23.1
+    return encode_batch(rows, seq=seq, sent_ts=now)
+
+
+def esp_payload(seq):
+    return f"612,58.00,1843,{seq},{time.time():.3f}".encode()
+
+
+def camera_message(jpg, seq):
+    """What publisher_camera puts on the in-process bus (edge_runtime.py): JPEG bytes, no JSON."""
+    now = time.time()
+    return {"camera": {"chili_count": 7, "fps": 5.0, "width": 640, "height": 480},
+            "jpg": jpg, "seq": seq, "ts": now, "sent_ts": now}
+
+
+def camera_payload(img_b64, seq):
+    now = time.time()
+    return json.dumps({
+        "camera": {"chili_count": 7, "fps": 5.0, "width": 640, "height": 480},
+        "image": img_b64, "seq": seq, "ts": now, "sent_ts": now,
+    }).encode()
+
+
+# ---------------- cases ต่อ entry point ----------------
+def pi_cases(shim):
+    pi = shim.load("pub_sensor_on_pi")
+    probe = pi.probe_files[pi.primary_probe]
+    samplers = {"probes": StaticSampler({"28-0316a2792fff": 23.1, "28-0316a27a1eff": 24.5}),
+                "light": StaticSampler(412.5)}
+    report_filter = pi.ReportFilter(pi.DEADBAND, pi.MAX_SILENCE, pi.SMOOTHING)
+    now = time.time()
+    rows = [(now + i * 0.1, {"light": 400.0 + i % 7}) for i in range(BATCH_ROWS)]
+    seq = itertools.count()
+    return [
+        ("pi.read_temp", pi.read_temp),
+        ("pi.read_temp[path]", lambda: pi.read_temp(probe)),
+        ("pi.read_light", pi.read_light),
+        ("pi.build_payload+json", lambda: json.dumps(pi.build_payload(samplers))),
+        ("pi.build_payload[deadband]", lambda: pi.build_payload(samplers, report_filter)),
+        (f"pi.encode_batch[{BATCH_ROWS} rows]", lambda: pi.encode_batch(rows, seq=next(seq))),
+    ]
+
+
+def subscriber_cases(shim):
+    from sample_batch import encode_batch
+
+    sub = shim.load("subscriber_main_on_pi")
+    sub.LOG_MESSAGES = False
+    sub.open_influx()           # fake_influx ของ shim
+    sub.init_camera_db()
+    sub.RELAY_LOCK_PATH = os.path.join(shim.workdir, "relay.lock")
+    sub.try_acquire_relay()     # relay ขับ fake GPIO
+    sub.start_rollups()
+    img_b64 = base64.b64encode(os.urandom(CAM_JPEG_BYTES)).decode("ascii")
+    jpg = os.urandom(CAM_JPEG_BYTES)
+    seq = itertools.count()
+
+    def fused_only(fn):
+        # --no-raw-points: แค่ fused record + rollup ไม่เขียน point ต่อ node
+        def run():
+            sub.WRITE_RAW_POINTS = False
+            try:
+                fn()
+            finally:
+                sub.WRITE_RAW_POINTS = True
+        return run
+
+    return [
+        ("subscriber.handle_message[pi]", lambda: sub.handle_message("pi", "bench-pi", pi_payload(next(seq)))),
+        ("subscriber.handle_message[pi_batch]",
+         lambda: sub.handle_message("pi_batch", "bench-pi", batch_payload(encode_batch, next(seq)))),
+        ("subscriber.handle_message[esp]", lambda: sub.handle_message("esp", "bench-esp", esp_payload(next(seq)))),
+        ("subscriber.handle_message[camera]",
+         lambda: sub.handle_message("camera", "camera", camera_payload(img_b64, next(seq)))),
+        ("subscriber.handle_message[pi, fused only]",
+         fused_only(lambda: sub.handle_message("pi", "bench-pi", pi_payload(next(seq))))),
+        ("subscriber.handle_message[esp, fused only]",
+         fused_only(lambda: sub.handle_message("esp", "bench-esp", esp_payload(next(seq))))),
+        # edge_runtime.py: object จาก in-process bus (ไม่มี JSON / base64)
+        ("subscriber.handle_message[pi, bus object]", lambda: sub.handle_message("pi", "bench-pi", pi_message(next(seq)))),
+        ("subscriber.handle_message[camera, bus object]",
+         lambda: sub.handle_message("camera", "camera", camera_message(jpg, next(seq)))),
+        ("subscriber.save_camera_image", lambda: sub.save_camera_image(jpg, 640, 480, 5.0, 7, time.time())),
+    ]
+
+
+def dashboard_cases(shim):
+    from history_cache import HistoryCache
+    from node_topics import MQTT_TOPIC_CAMERA, esp_topic, pi_batch_topic, pi_topic
+    from ring_buffer import SeriesStore
+    from sample_batch import encode_batch
+
+    dash = shim.load("Dashboard")
+    client = dash.app.test_client()
+    gzip_headers = {"Accept-Encoding": "gzip"}
+
+    # ring buffer มีข้อมูล HISTORY_NODE_S ล่าสุด -> range ที่สั้นกว่านี้ตอบจาก RAM, ยาวกว่าถาม (fake) Influx
+    # แยกจาก store ที่ on_message เขียน ไม่ให้จำนวน sample ขึ้นกับว่า case อื่นรันไปกี่รอบ
+    history_store = SeriesStore(dash.RING_CAPACITY)
+    now = time.time()
+    ts = np.arange(now - HISTORY_NODE_S, now, 1.0)
+    for node, fields in (("bench-pi", ("temperature", "light")), ("bench-esp", ("humidity", "co2", "soil"))):
+        for i, field in enumerate(fields):
+            history_store.extend(node, field, ts, 100 + 10 * np.sin(ts / 600 + i))
+
+    def new_cache():
+        return HistoryCache(dash.fetch_history, min_refresh_s=dash.HISTORY_CACHE_MIN_REFRESH_S,
+                            reprime_s=dash.HISTORY_CACHE_REPRIME_S, max_idle_s=dash.HISTORY_CACHE_MAX_IDLE_S,
+                            max_bytes=dash.HISTORY_CACHE_MAX_BYTES)
+
+    def history(query, cold):
+        # cold = cache ใหม่ทุกครั้ง (request แรกของ key: query เต็มช่วง + LTTB), ไม่งั้นใช้ cache เดิมต่อ
+        cache = new_cache()
+
+        def run():
+            dash.series_store = history_store
+            dash.history_cache = new_cache() if cold else cache
+            resp = client.get(query, headers=gzip_headers)
+            if resp.status_code != 200 or resp.headers.get("Content-Encoding") != "gzip":
+                raise RuntimeError(f"{query}: {resp.status_code} {resp.get_data()[:200]!r}")
+        return run
+
+    img_b64 = base64.b64encode(os.urandom(CAM_JPEG_BYTES)).decode("ascii")
+    jpg = os.urandom(CAM_JPEG_BYTES)
+    seq = itertools.count()
+    live_store = dash.series_store
+    on_message = dash.on_message
+
+    def message(topic, payload):
+        dash.series_store = live_store
+        on_message(None, None, Msg(topic, payload))
+
+    def bus_message(topic, obj):
+        dash.series_store = live_store
+        dash.handle_message(topic, obj, time.time())
+
+    return [
+        ("dashboard.on_message[pi]", lambda: message(pi_topic("bench-pi"), pi_payload(next(seq)))),
+        ("dashboard.on_message[pi_batch]",
+         lambda: message(pi_batch_topic("bench-pi"), batch_payload(encode_batch, next(seq)))),
+        ("dashboard.on_message[esp]", lambda: message(esp_topic("bench-esp"), esp_payload(next(seq)))),
+        ("dashboard.on_message[camera]", lambda: message(MQTT_TOPIC_CAMERA, camera_payload(img_b64, next(seq)))),
+        ("dashboard.handle_message[pi, bus object]", lambda: bus_message(pi_topic("bench-pi"), pi_message(next(seq)))),
+        ("dashboard.handle_message[camera, bus object]",
+         lambda: bus_message(MQTT_TOPIC_CAMERA, camera_message(jpg, next(seq)))),
+        ("dashboard.api_live", lambda: client.get("/api/live")),
+        ("dashboard.api_history[1h memory, cold]", history("/api/history?range=1h", cold=True)),
+        ("dashboard.api_history[1h memory, cached]", history("/api/history?range=1h", cold=False)),
+        ("dashboard.api_history[24h influx, cold]", history("/api/history?range=24h", cold=True)),
+        ("dashboard.api_history[24h influx, cached]", history("/api/history?range=24h", cold=False)),
+        ("dashboard.api_history[30d rollup, cold]", history("/api/history?range=30d", cold=True)),
+    ]
+
+
+def camera_cases(shim):
+    import cv2
+
+    cam = shim.load("publisher_camera")
+    picam = cam.Picamera2()
+    picam.configure(picam.create_preview_configuration(main={"format": "XRGB8888", "size": (640, 480)}))
+    frame = picam.capture_array()
+    annotated, _ = cam.process_img(frame)
+    ok, jpg = cv2.imencode(".jpg", annotated, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
+    jpg = jpg.tobytes()
+    frames = cam.generate_frames()   # capture -> YOLO (stub) -> overlay -> JPEG ต่อเฟรม
+
+    def payload():
+        return json.dumps({
+            "camera": {"chili_count": 7, "fps": 5.0, "width": 640, "height": 480},
+            "image": base64.b64encode(jpg).decode("ascii"), "seq": 0, "ts": time.time(), "sent_ts": time.time(),
+        })
+
+    return [
+        ("camera.capture_array", picam.capture_array),
+        ("camera.process_img[stub model]", lambda: cam.process_img(frame)),
+        ("camera.imencode[jpeg q85]", lambda: cv2.imencode(".jpg", annotated, [int(cv2.IMWRITE_JPEG_QUALITY), 85])),
+        ("camera.mqtt_payload", payload),
+        ("camera.generate_frames[1 frame]", lambda: next(frames)),
+    ]
+
+
+GROUPS = (
+    ("pi", pi_cases),
+    ("subscriber", subscriber_cases),
+    ("dashboard", dashboard_cases),
+    ("camera", camera_cases),
+)
+
+
+def group_may_match(group, pattern):
+    """Case names are "<group>.<case>": False when `pattern` cannot match any case of the group."""
+    head, dot, _ = pattern.partition(".")
+    if dot:
+        return group.endswith(head)
+    if any(pattern in g + "." for g, _ in GROUPS):
+        return pattern in group + "."    # -k <ชื่อกลุ่ม>
+    return True
+
+
+# ---------------- timing ----------------
+def time_loop(fn, n):
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return time.perf_counter() - t0
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def measure(fn, min_time, rounds):
+    fn()   # warm-up (lazy init เช่น BH1750 start, import ภายใน)
+    n = 1
+    while True:
+        t = time_loop(fn, n)
+        if t >= min_time:
+            break
+        n = max(n * 2, int(n * min_time / max(t, 1e-9) * 1.1))
+    per_call = [time_loop(fn, n) / n for _ in range(rounds)]
+    return {
+        "median_us": round(statistics.median(per_call) * 1e6, 3),
+        "min_us": round(min(per_call) * 1e6, 3),
+        "stdev_us": round(statistics.pstdev(per_call) * 1e6, 3),
+        "iterations": n,
+        "rounds": rounds,
+    }
+
+
+def machine_meta():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def fmt_us(us):
+    if us >= 1000:
+        return f"{us / 1000:9.2f} ms"
+    return f"{us:9.2f} us"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the entry points on fake hardware")
+    parser.add_argument("-k", "--filter", default="", help="run only cases whose name contains this")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--save", help="write results (+ machine info) to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.3,
+                        help="median slower than baseline by more than this factor = regression")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f).get("results", {})
+
+    shim = HardwareShim()
+    results = {}
+    regressions = []
+    try:
+        for group, build in GROUPS:
+            if not group_may_match(group, args.filter):
+                continue
+            try:
+                cases = build(shim)
+            except ImportError as e:
+                print(f"skipping {group} cases: {e}", flush=True)
+                continue
+            for name, fn in cases:
+                if args.filter not in name:
+                    continue
+                r = results[name] = measure(fn, args.min_time, args.rounds)
+                line = f"{name:45s} {fmt_us(r['median_us'])}  (min {fmt_us(r['min_us']).strip()}, " \
+                       f"{1e6 / r['median_us']:,.0f} ops/s)"
+                base = baseline.get(name)
+                if base:
+                    ratio = r["median_us"] / base["median_us"]
+                    line += f"  x{ratio:.2f} vs baseline"
+                    if ratio > args.threshold:
+                        line += "  REGRESSION"
+                        regressions.append(name)
+                print(line, flush=True)
+    finally:
+        shim.close()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"meta": machine_meta(), "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"saved {len(results)} results to {args.save}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) over x{args.threshold}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
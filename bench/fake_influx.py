@@ -0,0 +1,225 @@
+# fake_influx.py
+# InfluxDB stand-in สำหรับ benchmark: รับ /api/v2/write แล้วนับ point (ไม่เก็บข้อมูล)
+# /api/v2/query ตอบ annotated CSV สังเคราะห์ (sine ตามเวลา) ตาม field / range / every ใน Flux
+# รูปแบบเดียวกับผลของ pivot ที่ Dashboard ใช้ -> วัด /api/history ได้โดยไม่มี Influx จริง
+#
+#   python bench/fake_influx.py --port 8086
+#
+# ถ้า field "probe" ของ load generator (light ของ Pi, soil ของ ESP32) เป็นเวลาส่ง (ms)
+# จะคำนวณ end-to-end lag = เวลาที่ write มาถึง - เวลาที่ publisher ส่ง
+import argparse
+import gzip
+import json
+import math
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROBE_FIELDS = ("light=", "soil=")
+PROBE_MOD_MS = 1_000_000_000  # load_gen ส่ง now_ms % PROBE_MOD_MS
+
+QUERY_RAW_STEP_S = 2          # ไม่มี aggregateWindow = ค่าดิบทุก 2 s (เหมือน Pi)
+QUERY_MAX_ROWS   = 50_000
+
+# field -> (ค่ากลาง, amplitude, คาบ s)
+SYNTHETIC_FIELDS = {
+    "temperature": (25.0, 4.0, 86_400),
+    "humidity": (65.0, 15.0, 86_400),
+    "co2": (600.0, 200.0, 3_600),
+    "light": (400.0, 400.0, 86_400),
+    "soil": (1800.0, 300.0, 7_200),
+}
+
+_FIELD_RE = re.compile(r'r\._field == "([^"]+)"')
+_START_REL_RE = re.compile(r"range\(start: -(\d+)s\)")
+_START_ABS_RE = re.compile(r"range\(start: time\(v: (\d+)\)")
+_STOP_ABS_RE = re.compile(r"stop: time\(v: (\d+)\)")
+_EVERY_RE = re.compile(r"every: (\d+)s")
+
+
+def probe_now_ms():
+    return int(time.time() * 1000) % PROBE_MOD_MS
+
+
+class WriteStats:
+    """Counters shared between the HTTP handler threads and the bench runner."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.points = 0
+            self.writes = 0
+            self.bytes = 0
+            self.by_measurement = {}
+            self.lags_ms = []
+
+    def add_body(self, body):
+        now_ms = probe_now_ms()
+        lines = [ln for ln in body.split(b"\n") if ln]
+        lags = []
+        per_meas = {}
+
+        for ln in lines:
+            meas = ln.split(b",", 1)[0].split(b" ", 1)[0].decode("utf-8", "replace")
+            per_meas[meas] = per_meas.get(meas, 0) + 1
+
+            text = ln.decode("utf-8", "replace")
+            for key in PROBE_FIELDS:
+                pos = text.find(key)
+                if pos == -1:
+                    continue
+                raw = text[pos + len(key):].split(",", 1)[0].split(" ", 1)[0]
+                try:
+                    sent_ms = float(raw)
+                except ValueError:
+                    continue
+                lag = (now_ms - sent_ms) % PROBE_MOD_MS
+                if lag < 3_600_000:  # ค่า sensor จริงจะไม่ใช่ timestamp -> ตัดทิ้ง
+                    lags.append(lag)
+                break
+
+        with self.lock:
+            self.writes += 1
+            self.points += len(lines)
+            self.bytes += len(body)
+            for meas, n in per_meas.items():
+                self.by_measurement[meas] = self.by_measurement.get(meas, 0) + n
+            self.lags_ms.extend(lags)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "points": self.points,
+                "writes": self.writes,
+                "bytes": self.bytes,
+                "by_measurement": dict(self.by_measurement),
+                "lag_samples": len(self.lags_ms),
+            }
+
+    def take_lags(self):
+        with self.lock:
+            lags, self.lags_ms = self.lags_ms, []
+        return lags
+
+
+def synthetic_value(field, t):
+    mid, amp, period = SYNTHETIC_FIELDS.get(field, (100.0, 10.0, 3_600))
+    return round(mid + amp * math.sin(2 * math.pi * t / period), 3)
+
+
+def synthetic_query_csv(flux, now=None):
+    """
+    Annotated CSV for a pivoted history query: one row per `every` (or raw step)
+    from the range start until the range stop (default now), one column per r._field in the query.
+    """
+    now = time.time() if now is None else now
+    fields = list(dict.fromkeys(_FIELD_RE.findall(flux)))
+    if not fields:
+        return b""
+
+    m = _START_ABS_RE.search(flux)
+    if m:
+        start = int(m.group(1)) / 1e9
+    else:
+        m = _START_REL_RE.search(flux)
+        start = now - (int(m.group(1)) if m else 3600)
+    m = _STOP_ABS_RE.search(flux)
+    stop = min(int(m.group(1)) / 1e9, now) if m else now
+    inclusive = m is None or stop == now   # stop ของ Flux ไม่รวมตัวเอง
+    m = _EVERY_RE.search(flux)
+    step = int(m.group(1)) if m else QUERY_RAW_STEP_S
+    step = max(step, (stop - start) / QUERY_MAX_ROWS)
+
+    n = len(fields)
+    out = [
+        "#datatype,string,long,dateTime:RFC3339" + ",double" * n,
+        "#group,false,false,false" + ",false" * n,
+        "#default,_result,," + "," * n,
+        ",result,table,_time," + ",".join(fields),
+    ]
+    t = math.ceil(start / step) * step
+    while t < stop or (inclusive and t == stop):
+        stamp = datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        out.append(f",,0,{stamp}," + ",".join(str(synthetic_value(f, t)) for f in fields))
+        t += step
+    return ("\r\n".join(out) + "\r\n\r\n").encode()
+
+
+def make_handler(stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, code, body=b"", ctype="application/json"):
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            if self.path.startswith("/api/v2/write"):
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                stats.add_body(body)
+                self._reply(204)
+            elif self.path.startswith("/api/v2/query"):
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                try:
+                    flux = json.loads(body).get("query", "")
+                except ValueError:
+                    flux = body.decode("utf-8", "replace")
+                self._reply(200, synthetic_query_csv(flux), "text/csv; charset=utf-8")
+            else:
+                self._reply(404)
+
+        def do_GET(self):
+            if self.path.startswith("/health") or self.path.startswith("/ping"):
+                self._reply(200, b'{"status":"pass"}')
+            elif self.path.startswith("/stats"):
+                self._reply(200, json.dumps(stats.snapshot()).encode())
+            else:
+                self._reply(404)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def start_server(host="127.0.0.1", port=8086):
+    """Start the fake endpoint in a daemon thread, return (server, stats)."""
+    stats = WriteStats()
+    server = ThreadingHTTPServer((host, port), make_handler(stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-influx", daemon=True).start()
+    return server, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake InfluxDB write / query endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8086)
+    args = parser.parse_args()
+
+    server, stats = start_server(args.host, args.port)
+    print(f"Fake InfluxDB on http://{args.host}:{args.port} (GET /stats for counters)")
+    try:
+        while True:
+            time.sleep(5)
+            snap = stats.snapshot()
+            print(f"points={snap['points']} writes={snap['writes']} {snap['by_measurement']}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
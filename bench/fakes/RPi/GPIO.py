@@ -0,0 +1,82 @@
+# RPi.GPIO stand-in (bench / off-Pi): เก็บระดับของแต่ละ pin ไว้ใน dict แทนการสั่งฮาร์ดแวร์
+BCM = 11
+BOARD = 10
+OUT = 0
+IN = 1
+HIGH = 1
+LOW = 0
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+
+pins = {}        # pin -> HIGH/LOW
+directions = {}  # pin -> IN/OUT
+writes = 0       # จำนวนครั้งที่ output() ถูกเรียก (ดูว่า relay ถูกสั่งบ่อยแค่ไหน)
+_mode = None
+
+
+def setmode(mode):
+    global _mode
+    _mode = mode
+
+
+def getmode():
+    return _mode
+
+
+def setwarnings(flag):
+    pass
+
+
+def setup(pin, direction, pull_up_down=PUD_OFF, initial=LOW):
+    if _mode is None:
+        raise RuntimeError("Please set pin numbering mode using GPIO.setmode(GPIO.BOARD) or GPIO.setmode(GPIO.BCM)")
+    directions[pin] = direction
+    pins.setdefault(pin, initial if direction == OUT else (HIGH if pull_up_down == PUD_UP else LOW))
+
+
+def output(pin, value):
+    global writes
+    if directions.get(pin) != OUT:
+        raise RuntimeError("The GPIO channel has not been set up as an OUTPUT")
+    pins[pin] = HIGH if value else LOW
+    writes += 1
+
+
+def input(pin):
+    if pin not in directions:
+        raise RuntimeError("You must setup() the GPIO channel first")
+    return pins.get(pin, LOW)
+
+
+def cleanup(pin=None):
+    global _mode
+    if pin is None:
+        pins.clear()
+        directions.clear()
+        _mode = None
+    else:
+        for p in (pin if isinstance(pin, (list, tuple)) else (pin,)):
+            pins.pop(p, None)
+            directions.pop(p, None)
+
+
+class PWM:
+    def __init__(self, pin, frequency):
+        self.pin = pin
+        self.frequency = frequency
+        self.duty = 0.0
+        self.running = False
+
+    def start(self, duty):
+        self.duty = duty
+        self.running = True
+
+    def ChangeDutyCycle(self, duty):
+        self.duty = duty
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def stop(self):
+        self.running = False
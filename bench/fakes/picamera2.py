@@ -0,0 +1,44 @@
+# picamera2 stand-in (bench / off-Pi): capture_array() คืนภาพ XRGB8888 ขนาดตาม config
+# ภาพเป็น gradient ที่เลื่อนทีละเฟรม (JPEG ที่ได้มีขนาดใกล้ภาพจริงกว่าภาพสีเดียว)
+import numpy as np
+
+
+class Picamera2:
+    def __init__(self, camera_num=0):
+        self.size = (640, 480)
+        self.started = False
+        self.frames = 0
+        self._base = None
+
+    def create_preview_configuration(self, main=None, **kwargs):
+        return {"main": dict(main or {"format": "XRGB8888", "size": self.size})}
+
+    create_still_configuration = create_preview_configuration
+    create_video_configuration = create_preview_configuration
+
+    def configure(self, config):
+        self.size = tuple(config["main"].get("size", self.size))
+        self._base = None
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.started = False
+
+    def close(self):
+        self.stop()
+
+    def capture_array(self, name="main"):
+        w, h = self.size
+        if self._base is None:
+            x = np.linspace(0, 255, w, dtype=np.float32)
+            y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+            img = np.zeros((h, w, 4), np.uint8)
+            img[..., 0] = x
+            img[..., 1] = y
+            img[..., 2] = (x + y) / 2
+            img[..., 3] = 255
+            self._base = img
+        self.frames += 1
+        return np.roll(self._base, self.frames % w, axis=1)
@@ -0,0 +1,31 @@
+# ultralytics stand-in (bench / off-Pi): YOLO ที่ไม่ infer จริง
+# คืน detection ตาม YOLO.detections (ค่าคงที่) -> วัดเวลาส่วนอื่นของ pipeline โดยไม่รวมโมเดล
+class Boxes:
+    def __init__(self, n):
+        self.cls = [0.0] * n
+        self.conf = [0.9] * n
+
+    def __len__(self):
+        return len(self.cls)
+
+
+class Results:
+    def __init__(self, img, n):
+        self.orig_img = img
+        self.boxes = Boxes(n)
+
+    def plot(self, conf=True, **kwargs):
+        return self.orig_img.copy()
+
+
+class YOLO:
+    detections = 3
+
+    def __init__(self, model="yolov8n.pt", task=None, verbose=False):
+        self.model = model
+        self.names = {0: "chili"}
+
+    def __call__(self, source, **kwargs):
+        return [Results(source, self.detections)]
+
+    predict = __call__
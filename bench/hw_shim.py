@@ -0,0 +1,97 @@
+# hw_shim.py
+# โหลด entry point ทั้ง 4 ตัวบนเครื่องที่ไม่ใช่ Pi (ไม่ต้องมีเซนเซอร์ / กล้อง / Influx / broker)
+#
+#   GPIO, SMBus (BH1750), Picamera2, YOLO  -> bench/fakes/ (อยู่หน้า sys.path แทนของจริง)
+#   1-Wire sysfs (DS18B20)                 -> โฟลเดอร์ใน temp dir (W1_BASE_DIR)
+#   InfluxDB write / query                 -> fake_influx.py บน port ว่าง (INFLUX_URL)
+#   MQTT                                   -> port ที่ไม่มีใครฟัง (connect ล้มเหลวทันที)
+#
+#   shim = HardwareShim()
+#   pi = shim.load("pub_sensor_on_pi")
+#   ...
+#   shim.close()
+#
+# ไฟล์ที่ entry point สร้าง (camera_frames.db, spool, relay lock) อยู่ใน temp dir ของ shim
+import importlib
+import os
+import shutil
+import socket
+import sys
+import tempfile
+
+from fake_influx import start_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(HERE, "..", "raspberryPI__camera"))
+FAKES_DIR = os.path.join(HERE, "fakes")
+
+# ROM id -> °C ของ DS18B20 จำลอง
+DEFAULT_PROBES = {"28-0316a2792fff": 23.125, "28-0316a27a1eff": 24.5}
+
+
+def w1_slave_text(temp_c):
+    milli = int(round(temp_c * 1000))
+    return f"72 01 4b 46 7f ff 0e 10 57 : crc=57 YES\n72 01 4b 46 7f ff 0e 10 57 t={milli}\n"
+
+
+def make_w1_tree(root, probes):
+    """Lay out /sys/bus/w1/devices: one 28-* folder per probe + a bus master with bulk read."""
+    os.makedirs(root, exist_ok=True)
+    for rom, temp_c in probes.items():
+        os.makedirs(os.path.join(root, rom), exist_ok=True)
+        with open(os.path.join(root, rom, "w1_slave"), "w") as f:
+            f.write(w1_slave_text(temp_c))
+    master = os.path.join(root, "w1_bus_master1")
+    os.makedirs(master, exist_ok=True)
+    with open(os.path.join(master, "therm_bulk_read"), "w") as f:
+        f.write("1\n")
+    return root
+
+
+def closed_port():
+    """A local TCP port nobody listens on (MQTT connect is refused right away)."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class HardwareShim:
+    def __init__(self, probes=None):
+        self.workdir = tempfile.mkdtemp(prefix="iot-bench-")
+        self.w1_dir = make_w1_tree(os.path.join(self.workdir, "w1"), DEFAULT_PROBES if probes is None else probes)
+        self.influx_server, self.influx_stats = start_server("127.0.0.1", 0)
+        self.influx_url = "http://127.0.0.1:%d" % self.influx_server.server_address[1]
+        self.modules = {}
+
+        os.environ.update({
+            "W1_BASE_DIR": self.w1_dir,
+            "INFLUX_URL": self.influx_url,
+            "MQTT_BROKER": "127.0.0.1",
+            "MQTT_PORT": str(closed_port()),
+            "DASHBOARD_ROLE": "standalone",
+        })
+        for path in (APP_DIR, FAKES_DIR):
+            if path in sys.path:
+                sys.path.remove(path)
+            sys.path.insert(0, path)
+
+        self._old_cwd = os.getcwd()
+        os.chdir(self.workdir)
+
+    def load(self, name):
+        """Import one entry point (once); modprobe calls at import time are skipped."""
+        if name in self.modules:
+            return self.modules[name]
+        system = os.system
+        os.system = lambda cmd: 0
+        try:
+            module = importlib.import_module(name)
+        finally:
+            os.system = system
+        self.modules[name] = module
+        return module
+
+    def close(self):
+        self.influx_server.shutdown()
+        os.chdir(self._old_cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
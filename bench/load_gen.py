@@ -0,0 +1,187 @@
+# load_gen.py
+# จำลอง publisher หลายตัวพร้อมกัน เพื่อวัดว่า subscriber / Dashboard รับไหวกี่ msg/s
+#
+#   N ESP32 -> iot/esp/<id>/data   CSV  "co2,humidity,soil,seq,ts"
+#   M Pi    -> iot/pi/<id>/data    JSON {"pi": {"temperature", "light"}, "seq", "sent_ts"}
+#   K cam   -> iot/camera          JSON {"camera": {...}, "image": <base64>, "seq", "ts", "sent_ts"}
+#
+#   python bench/load_gen.py --esp 50 --esp-rate 1 --pi 10 --pi-rate 0.5 --cam 1 --duration 60
+#
+# ค่า soil (ESP32) และ light (Pi) คือเวลาส่งเป็น ms (probe) เพื่อให้ปลายทางคำนวณ lag ได้
+import argparse
+import base64
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "raspberryPI__camera"))
+from node_topics import MQTT_TOPIC_CAMERA, esp_topic, pi_topic  # noqa: E402
+
+PROBE_MOD_MS = 1_000_000_000
+
+
+def probe_ms():
+    return int(time.time() * 1000) % PROBE_MOD_MS
+
+
+def esp_payload(i, pad):
+    co2 = 400 + (i * 7) % 400
+    return f"{co2},{55 + i % 20}.0,{probe_ms()},{i},{time.time():.3f}" + " " * pad
+
+
+def pi_payload(i, pad):
+    data = {"pi": {"temperature": 22.0 + (i % 30) / 10.0, "light": probe_ms()},
+            "seq": i, "sent_ts": time.time()}
+    if pad:
+        data["pad"] = "x" * pad
+    return json.dumps(data)
+
+
+def camera_payload(img_b64, i):
+    now = time.time()
+    return json.dumps({
+        "camera": {"chili_count": i % 12, "fps": 5.0, "width": 640, "height": 480},
+        "image": img_b64,
+        "seq": i,
+        "ts": now,
+        "sent_ts": now,
+    })
+
+
+class Publisher:
+    """One emulated device: kind, topic, period (s)."""
+    __slots__ = ("kind", "node_id", "topic", "period", "sent")
+
+    def __init__(self, kind, node_id, topic, period):
+        self.kind = kind
+        self.node_id = node_id
+        self.topic = topic
+        self.period = period
+        self.sent = 0
+
+
+def build_publishers(args):
+    pubs = []
+    for i in range(args.esp):
+        node = f"{args.prefix}esp{i:03d}"
+        pubs.append(Publisher("esp", node, esp_topic(node), 1.0 / args.esp_rate))
+    for i in range(args.pi):
+        node = f"{args.prefix}pi{i:03d}"
+        pubs.append(Publisher("pi", node, pi_topic(node), 1.0 / args.pi_rate))
+    for i in range(args.cam):
+        pubs.append(Publisher("camera", f"cam{i:03d}", MQTT_TOPIC_CAMERA, 1.0 / args.cam_rate))
+    return pubs
+
+
+def run_connection(pubs, args, img_b64, stop_at, counters, lock):
+    client = mqtt.Client()
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+
+    # กระจายเวลาเริ่มของแต่ละ device ไม่ให้ส่งพร้อมกันเป็นก้อน
+    start = time.monotonic()
+    heap = []
+    for idx, p in enumerate(pubs):
+        offset = p.period * (idx / max(len(pubs), 1))
+        heap.append((start + offset, idx))
+    heapq.heapify(heap)
+
+    sent = {"esp": 0, "pi": 0, "camera": 0}
+    sent_bytes = 0
+    try:
+        while heap:
+            due, idx = heap[0]
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            if due > now:
+                time.sleep(min(due - now, stop_at - now))
+                continue
+
+            heapq.heapreplace(heap, (due + pubs[idx].period, idx))
+            p = pubs[idx]
+            if p.kind == "esp":
+                payload = esp_payload(p.sent, args.esp_pad)
+            elif p.kind == "pi":
+                payload = pi_payload(p.sent, args.pi_pad)
+            else:
+                payload = camera_payload(img_b64, p.sent)
+
+            client.publish(p.topic, payload, qos=args.qos)
+            p.sent += 1
+            sent[p.kind] += 1
+            sent_bytes += len(payload)
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        with lock:
+            for k, v in sent.items():
+                counters[k] = counters.get(k, 0) + v
+            counters["bytes"] = counters.get("bytes", 0) + sent_bytes
+
+
+def run(args):
+    """Publish for args.duration seconds and return the number of messages sent per kind."""
+    pubs = build_publishers(args)
+    if not pubs:
+        raise SystemExit("nothing to publish (use --esp / --pi / --cam)")
+
+    img_b64 = base64.b64encode(os.urandom(args.cam_bytes)).decode("ascii")
+
+    conns = max(1, min(args.connections, len(pubs)))
+    groups = [pubs[i::conns] for i in range(conns)]
+
+    counters = {}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=run_connection, args=(g, args, img_b64, stop_at, counters, lock), daemon=True)
+        for g in groups
+    ]
+    t0 = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    counters["elapsed_s"] = time.monotonic() - t0
+    return counters
+
+
+def add_arguments(parser):
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--qos", type=int, default=0, choices=(0, 1))
+    parser.add_argument("--esp", type=int, default=10, help="number of ESP32 CSV publishers")
+    parser.add_argument("--esp-rate", type=float, default=1.0, help="messages/s per ESP32")
+    parser.add_argument("--esp-pad", type=int, default=0, help="extra bytes per ESP32 payload")
+    parser.add_argument("--pi", type=int, default=2, help="number of Pi JSON publishers")
+    parser.add_argument("--pi-rate", type=float, default=0.5, help="messages/s per Pi")
+    parser.add_argument("--pi-pad", type=int, default=0, help="extra bytes per Pi payload")
+    parser.add_argument("--cam", type=int, default=0, help="number of camera publishers")
+    parser.add_argument("--cam-rate", type=float, default=0.1, help="messages/s per camera")
+    parser.add_argument("--cam-bytes", type=int, default=60_000, help="JPEG size before base64")
+    parser.add_argument("--connections", type=int, default=4, help="MQTT connections to spread publishers over")
+    parser.add_argument("--prefix", default="bench-", help="node id prefix")
+    parser.add_argument("--duration", type=float, default=30.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT load generator (ESP32 / Pi / camera)")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    counters = run(args)
+    elapsed = counters["elapsed_s"]
+    total = counters.get("esp", 0) + counters.get("pi", 0) + counters.get("camera", 0)
+    print(f"sent {total} msgs in {elapsed:.1f}s ({total / elapsed:.0f} msg/s, "
+          f"{counters.get('bytes', 0) / elapsed / 1024:.0f} KiB/s) "
+          f"esp={counters.get('esp', 0)} pi={counters.get('pi', 0)} camera={counters.get('camera', 0)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,28 @@
-from flask import Flask, jsonify, render_template_string
+from flask import Flask, Response, jsonify, render_template_string, request
 from influxdb_client import InfluxDBClient
 import paho.mqtt.client as mqtt
+import base64
+import gzip
 import json
+import os
+import re
+import sqlite3
 import threading
-from datetime import datetime
+import time
+import zlib
+from datetime import datetime, timezone
+
+from camera_gallery import FrameGallery, normalize_time
+from chili_trend import CHILI_PERCENTILES, chili_trend
+from edge_bus import EspReading, PiBatch, parse_esp_csv
+from export import EXPORT_FORMATS, image_export, iter_export_bytes, parse_time, sensor_export
+from history_cache import HistoryCache
+from latency import LatencyRecorder
+from live_state import SharedLiveState
+from node_topics import MQTT_TOPIC_METRICS, SUBSCRIBE_TOPICS, parse_topic
+from profiling import Profiler, register_admin_routes
+from ring_buffer import SeriesStore
+from sample_batch import batch_meta, decode_batch
 
 app = Flask(__name__)
 
@@ -11,65 +30,234 @@ app = Flask(__name__)
 # ⚙️ CONFIGURATION
 # ==========================================
 PI_IP         = "10.243.6.104"       # IP ของ Raspberry Pi
-INFLUX_URL    = f"http://{PI_IP}:8086"
+INFLUX_URL    = os.environ.get("INFLUX_URL", f"http://{PI_IP}:8086")
 INFLUX_TOKEN  = ""
 INFLUX_ORG    = "Student"
 INFLUX_BUCKET = "iot_data"
 
-MQTT_BROKER   = "localhost"          # ถ้า run บน Pi ใช้ localhost, ถ้า run บน PC ใส่ IP Pi
-MQTT_PORT     = 1883
+# ภาพที่ subscriber_main_on_pi.py เก็บไว้ (เปิดแบบ read-only สำหรับ Gallery)
+CAMERA_DB_PATH = "camera_frames.db"
+GALLERY_PAGE_SIZE   = 48
+GALLERY_MAX_PAGE    = 200
+THUMB_WIDTH         = 240
+THUMB_CACHE_BYTES   = 16 * 1024 * 1024
+
+MQTT_BROKER   = os.environ.get("MQTT_BROKER", "localhost")   # ถ้า run บน Pi ใช้ localhost, ถ้า run บน PC ใส่ IP Pi
+MQTT_PORT     = int(os.environ.get("MQTT_PORT", 1883))
+
+# บทบาทของ process (ตั้งผ่าน env เพราะ gunicorn import module นี้เอง)
+#   standalone  MQTT + เว็บใน process เดียว (แบบเดิม)
+#   ingest      รับ MQTT อย่างเดียว เขียนค่าล่าสุด + ภาพลง shared memory (live_state.py)
+#   web         ไม่ต่อ MQTT อ่านจาก shared memory -> รันหลาย worker ได้โดยไม่ subscribe ซ้ำ
+#   edge        ไม่ต่อ MQTT รับ message จาก in-process bus ของ edge_runtime.py (ตั้งให้เอง)
+#     DASHBOARD_ROLE=ingest python Dashboard.py
+#     DASHBOARD_ROLE=web gunicorn -w 4 -k gthread --threads 16 -b 0.0.0.0:5001 Dashboard:app
+DASHBOARD_ROLE  = os.environ.get("DASHBOARD_ROLE", "standalone")
+LIVE_SHM_NAME   = "iot_dashboard_live"
+LIVE_SHM_POLL_S = 0.05               # web: ตรวจ seq ของ shared memory ทุก 50 ms
+
+# latency ของ Dashboard เอง (broker / decode / push) + snapshot ที่ process อื่นส่งมาทาง iot/metrics/<proc>
+# ดูรวมกันที่ /api/metrics (latency.py)
+METRICS_MAX_AGE_S     = 300.0        # process ที่เงียบนานกว่านี้ไม่แสดง (ตายไปแล้ว)
+METRICS_SHARE_PERIOD  = 5.0          # ingest: เขียน metrics ลง shared memory ทุก 5 s
 
 # ==========================================
 # 💾 GLOBAL VARIABLES (สำหรับ Live Data)
 # ==========================================
 # ตัวแปรนี้จะถูกอัปเดตทันทีที่ MQTT ส่งข้อมูลมา
 current_data = {
-    "pi_temp": None, "pi_light": None, "pi_update": "-",
-    "esp_co2": None, "esp_hum": None, "esp_soil": None, "esp_update": "-",
-    "cam_img": None, "cam_count": 0, "cam_fps": 0, "cam_update": "-"
+    "pi_temp": None, "pi_light": None, "pi_update": "-", "pi_node": None,
+    "esp_co2": None, "esp_hum": None, "esp_soil": None, "esp_update": "-", "esp_node": None,
+    "cam_seq": 0, "cam_count": 0, "cam_fps": 0, "cam_update": "-"
 }
 
+# ประวัติล่าสุดทุก node × field ใน RAM (ring_buffer.py) ตอบ /api/history ช่วงล่าสุดแทน Influx
+# 86,400 samples ต่อ series = 24 ชม. ที่ 1 Hz (Pi ส่งทุก 2 s -> 48 ชม.)
+RING_CAPACITY = 86_400
+series_store = SeriesStore(RING_CAPACITY)
+
+recorder = LatencyRecorder("dashboard")
+process_metrics = {}   # proc -> snapshot ล่าสุดจาก iot/metrics/<proc>
+
+# ภาพล่าสุดจากกล้อง เก็บเป็น JPEG bytes (decode base64 ครั้งเดียวตอนรับ)
+# ส่งผ่าน /api/camera/latest.jpg พร้อม ETag, /api/live ไม่ต้องแบกรูปอีก
+latest_frame = None   # (seq, etag, jpg_bytes)
+
+# ==========================================
+# 📢 LIVE PUSH (Server-Sent Events)
+# ==========================================
+# on_message ส่ง diff ให้ทุก client ที่เปิด /api/stream อยู่
+# แต่ละ client มีกล่อง pending ของตัวเอง: diff ที่มาถี่ ๆ จะถูกรวม (field เดียวกันเก็บค่าล่าสุด)
+# แล้วส่งออกไม่ถี่กว่า SSE_MIN_INTERVAL -> client ช้าไม่ถ่วง MQTT thread และไม่มีคิวบวม
+SSE_MIN_INTERVAL = 0.1   # วินาที ระหว่าง event ต่อ client
+SSE_KEEPALIVE    = 15.0  # ส่ง comment กัน proxy ตัด connection ตอนไม่มีข้อมูล
+
+class LiveClient:
+    __slots__ = ("cond", "pending", "rx_ts", "captured")
+
+    def __init__(self, snapshot):
+        self.cond = threading.Condition()
+        self.pending = dict(snapshot)   # event แรก = ค่าทั้งหมด
+        self.rx_ts = None               # เวลารับ / เวลาอ่าน sensor ของ diff ที่เก่าที่สุดใน pending
+        self.captured = None
+
+class LiveHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = set()
+
+    def subscribe(self):
+        client = LiveClient(current_data)
+        with self._lock:
+            self._clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def publish(self, changes, rx_ts=None, captured=None):
+        with self._lock:
+            clients = list(self._clients)
+        for c in clients:
+            with c.cond:
+                c.pending.update(changes)
+                if c.rx_ts is None:
+                    c.rx_ts = rx_ts
+                if c.captured is None:
+                    c.captured = captured
+                c.cond.notify()
+
+    def events(self, client):
+        """Generator of SSE frames for one client (coalesced + rate-limited)."""
+        last_sent = 0.0
+        try:
+            while True:
+                with client.cond:
+                    if not client.pending:
+                        client.cond.wait(timeout=SSE_KEEPALIVE)
+                    if not client.pending:
+                        diff = None
+                    else:
+                        # รอให้ครบช่วง rate limit ระหว่างนั้น diff ใหม่จะรวมเข้ามาเอง
+                        due = last_sent + SSE_MIN_INTERVAL
+                        while time.monotonic() < due:
+                            client.cond.wait(timeout=due - time.monotonic())
+                        diff, client.pending = client.pending, {}
+                        rx_ts, captured = client.rx_ts, client.captured
+                        client.rx_ts = client.captured = None
+
+                if diff is None:
+                    yield ": keepalive\n\n"
+                else:
+                    last_sent = time.monotonic()
+                    yield f"data: {json.dumps(diff)}\n\n"
+                    recorder.observe_since("push", rx_ts)
+                    recorder.observe_since("end_to_end", captured)
+        finally:
+            self.unsubscribe(client)
+
+live_hub = LiveHub()
+
 # ==========================================
 # 📡 MQTT SUBSCRIBER SETUP
 # ==========================================
 def on_connect(client, userdata, flags, rc):
     print(f"✅ MQTT Connected with result code {rc}")
-    client.subscribe("/iot/data")
-    client.subscribe("iot/esp/data")
-    client.subscribe("iot/camera")
+    for topic in SUBSCRIBE_TOPICS + (MQTT_TOPIC_METRICS,):
+        client.subscribe(topic)
+
+def time_label(ts):
+    return datetime.fromtimestamp(ts).strftime("%H:%M:%S")
 
 def on_message(client, userdata, msg):
-    global current_data
-    topic = msg.topic
-    payload = msg.payload
-    now_str = datetime.now().strftime("%H:%M:%S")
+    handle_message(msg.topic, msg.payload, time.time())
+
+def handle_message(topic, payload, rx_ts):
+    """payload = MQTT bytes or an already decoded edge_bus message (edge_runtime.py)."""
+    global latest_frame
+    captured = None   # เวลาอ่าน sensor / ถ่ายภาพจาก payload (label "อัปเดตล่าสุด" ใช้เวลานี้)
+    kind, node_id = parse_topic(topic)
+    changes = {}
 
     try:
-        if topic == "/iot/data":
-            data = json.loads(payload.decode()).get("pi", {})
-            current_data["pi_temp"] = data.get("temperature")
-            current_data["pi_light"] = data.get("light")
-            current_data["pi_update"] = now_str
+        if kind == "metrics":
+            process_metrics[node_id] = payload if isinstance(payload, dict) else json.loads(payload.decode())
+            return
+
+        if kind == "pi":
+            raw = payload if isinstance(payload, dict) else json.loads(payload.decode())
+            recorder.received(f"pi/{node_id}", raw.get("seq"), raw.get("sent_ts"), rx_ts)
+            data = raw.get("pi", {})
+            # deadband-compressed: field ที่ไม่มี = ค่าเดิม
+            if "temperature" in data:
+                changes["pi_temp"] = data["temperature"]
+            if "light" in data:
+                changes["pi_light"] = data["light"]
+            for field in ("temperature", "light"):
+                if field in data:
+                    series_store.append(node_id, field, data.get(f"{field}_ts") or rx_ts, data[field])
+            captured = max((data[f"{f}_ts"] for f in ("temperature", "light") if data.get(f"{f}_ts")), default=None)
+            changes["pi_update"] = time_label(captured or rx_ts)
+            changes["pi_node"] = node_id
             
-        elif topic == "iot/esp/data":
-            # CSV format: co2,humidity,soil
-            parts = payload.decode().strip().split(",")
-            if len(parts) >= 3:
-                current_data["esp_co2"] = float(parts[0])
-                current_data["esp_hum"] = float(parts[1])
-                current_data["esp_soil"] = float(parts[2])
-                current_data["esp_update"] = now_str
-
-        elif topic == "iot/camera":
-            data = json.loads(payload.decode())
+        elif kind == "pi_batch":
+            # binary batch: ใช้ค่าล่าสุดของแต่ละ field
+            if isinstance(payload, PiBatch):
+                fields, rows, seq, sent_ts = payload
+            else:
+                fields, rows = decode_batch(payload)
+                seq, sent_ts = batch_meta(payload)
+            recorder.received(f"pi_batch/{node_id}", seq, sent_ts, rx_ts)
+            for name, key in (("temperature", "pi_temp"), ("light", "pi_light")):
+                if name not in fields:
+                    continue
+                i = fields.index(name)
+                present = [(ts, values[i]) for ts, values in rows if values[i] is not None]
+                if present:
+                    changes[key] = present[-1][1]
+                    series_store.extend(node_id, name, [p[0] for p in present], [p[1] for p in present])
+            captured = rows[-1][0] if rows else None
+            changes["pi_update"] = time_label(captured or rx_ts)
+            changes["pi_node"] = node_id
+
+        elif kind == "esp":
+            # CSV format: co2,humidity,soil[,seq[,ts]]
+            reading = payload if isinstance(payload, EspReading) else parse_esp_csv(payload)
+            changes["esp_co2"], changes["esp_hum"], changes["esp_soil"], seq, captured = reading
+            recorder.received(f"esp/{node_id}", seq, captured, rx_ts)
+            for field, key in (("co2", "esp_co2"), ("humidity", "esp_hum"), ("soil", "esp_soil")):
+                series_store.append(node_id, field, captured or rx_ts, changes[key])
+            changes["esp_update"] = time_label(captured or rx_ts)
+            changes["esp_node"] = node_id
+
+        elif kind == "camera":
+            data = payload if isinstance(payload, dict) else json.loads(payload.decode())
+            recorder.received("camera", data.get("seq"), data.get("sent_ts"), rx_ts)
+            captured = data.get("ts")
             cam = data.get("camera", {})
-            current_data["cam_img"] = data.get("image") # Base64 string
-            current_data["cam_count"] = cam.get("chili_count", 0)
-            current_data["cam_fps"] = cam.get("fps", 0)
-            current_data["cam_update"] = now_str
+            jpg = data.get("jpg")   # edge_bus: decode แล้ว
+            img_b64 = data.get("image") or data.get("img")
+            if jpg is None and img_b64:
+                jpg = base64.b64decode(img_b64)
+            if jpg:
+                seq = current_data["cam_seq"] + 1
+                latest_frame = (seq, f"{seq}-{zlib.crc32(jpg):08x}", jpg)
+                if live_shm is not None:
+                    live_shm.write_frame(seq, jpg)
+                changes["cam_seq"] = seq
+            changes["cam_count"] = cam.get("chili_count", 0)
+            changes["cam_fps"] = cam.get("fps", 0)
+            changes["cam_update"] = time_label(captured or rx_ts)
 
     except Exception as e:
-        print(f"❌ MQTT Error ({topic}): {e}")
+        print(f"❌ Message Error ({topic}): {e}")
+
+    if changes:
+        current_data.update(changes)
+        if live_shm is not None:
+            live_shm.write_state(current_data)
+        live_hub.publish(changes, rx_ts, captured)
 
 # รัน MQTT ใน Background Thread ไม่ให้บล็อก Flask
 def start_mqtt():
@@ -82,7 +270,77 @@ def start_mqtt():
     except Exception as e:
         print(f"❌ MQTT Connection Failed: {e}")
 
-threading.Thread(target=start_mqtt, daemon=True).start()
+# ==========================================
+# 🧩 SHARED LIVE STATE (ingest / web)
+# ==========================================
+live_shm = None
+_mirror_lock = threading.Lock()
+_mirror_pid = None
+
+def mirror_shared_state():
+    """web: คัดลอกค่าจาก shared memory มาไว้ใน current_data / latest_frame แล้ว push diff ให้ SSE"""
+    global live_shm, latest_frame
+    last_version = None
+    while True:
+        if live_shm is None:
+            try:
+                live_shm = SharedLiveState(LIVE_SHM_NAME)
+            except FileNotFoundError:
+                time.sleep(1.0)   # ingest ยังไม่เริ่ม
+                continue
+
+        version = live_shm.state_version()
+        if version != last_version and not version & 1:
+            data = live_shm.read_state()
+            if data is not None:
+                last_version = version
+                frame = live_shm.read_frame()
+                if frame is not None:
+                    latest_frame = frame
+                changes = {k: v for k, v in data.items() if current_data.get(k) != v}
+                if changes:
+                    current_data.update(changes)
+                    # push ของ web worker = เห็นค่าใน shared memory -> ส่ง SSE (เวลารับ MQTT อยู่ใน ingest)
+                    live_hub.publish(changes, time.time())
+        time.sleep(LIVE_SHM_POLL_S)
+
+@app.before_request
+def ensure_live_mirror():
+    # เริ่มใน worker แต่ละตัวตอน request แรก (thread ที่เริ่มก่อน fork ไม่ตามไปใน worker)
+    global _mirror_pid
+    if DASHBOARD_ROLE != "web" or _mirror_pid == os.getpid():
+        return
+    with _mirror_lock:
+        if _mirror_pid != os.getpid():
+            _mirror_pid = os.getpid()
+            threading.Thread(target=mirror_shared_state, name="live-shm", daemon=True).start()
+
+def collect_metrics():
+    """Latency snapshot of this process + every process still sending iot/metrics/<proc>."""
+    now = time.time()
+    return {
+        "dashboard": recorder.snapshot(),
+        "processes": {proc: snap for proc, snap in list(process_metrics.items())
+                      if now - snap.get("at", 0) <= METRICS_MAX_AGE_S},
+    }
+
+def share_metrics_loop():
+    """ingest: เขียน metrics ลง shared memory ให้ web worker ตอบ /api/metrics"""
+    while True:
+        try:
+            live_shm.write_metrics(collect_metrics())
+        except ValueError as e:
+            print(f"❌ Metrics not shared: {e}")
+        time.sleep(METRICS_SHARE_PERIOD)
+
+if DASHBOARD_ROLE == "ingest":
+    live_shm = SharedLiveState(LIVE_SHM_NAME, create=True)
+    live_shm.write_state(current_data)
+    threading.Thread(target=share_metrics_loop, name="metrics-shm", daemon=True).start()
+elif DASHBOARD_ROLE == "standalone":
+    threading.Thread(target=start_mqtt, daemon=True).start()
+elif DASHBOARD_ROLE not in ("web", "edge"):
+    raise SystemExit(f"unknown DASHBOARD_ROLE: {DASHBOARD_ROLE}")
 
 # ==========================================
 # 🗄️ INFLUXDB SETUP (สำหรับ History Data)
@@ -99,34 +357,387 @@ def api_live():
     """ส่งข้อมูลล่าสุดที่เก็บไว้ใน RAM (จาก MQTT)"""
     return jsonify(current_data)
 
-@app.route('/api/history')
-def api_history():
-    """ดึงข้อมูลย้อนหลัง 1 ชม. จาก InfluxDB"""
-    query = f'''
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events: ค่าทั้งหมด 1 ครั้ง แล้วตามด้วยเฉพาะ field ที่เปลี่ยน"""
+    client = live_hub.subscribe()
+    resp = Response(live_hub.events(client), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+@app.route('/api/metrics')
+def api_metrics():
+    """latency ต่อ hop (histogram) + seq ที่หายต่อ node ของ Dashboard และ process อื่น ๆ"""
+    if DASHBOARD_ROLE != "web":
+        return json_response(collect_metrics())
+    shared = (live_shm.read_metrics() if live_shm is not None else None) or {}
+    return json_response({
+        "dashboard": shared.get("dashboard"),   # ingest process (รับ MQTT)
+        "web": recorder.snapshot(),             # worker นี้ (push)
+        "processes": shared.get("processes", {}),
+    })
+
+@app.route('/api/camera/latest.jpg')
+def api_camera_latest():
+    """ภาพล่าสุดจากกล้อง (ตอบ 304 ถ้า browser มีภาพนี้อยู่แล้ว)"""
+    frame = latest_frame
+    if frame is None:
+        return Response(status=404)
+
+    seq, etag, jpg = frame
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(jpg, mimetype="image/jpeg")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Frame-Seq"] = str(seq)
+    return resp
+
+gallery = FrameGallery(CAMERA_DB_PATH, thumb_cache_bytes=THUMB_CACHE_BYTES)
+
+@app.route('/api/camera/frames')
+def api_camera_frames():
+    """
+    รายการภาพใน camera_frames.db ใหม่ -> เก่า (ไม่ส่งตัวรูป)
+    ?limit=48&before=<id>&start=<iso>&end=<iso>&min_chili=<n>
+    หน้าถัดไป: ส่ง before=<next> ที่ได้จากหน้าก่อน
+    """
+    try:
+        limit = max(1, min(int(request.args.get("limit", GALLERY_PAGE_SIZE)), GALLERY_MAX_PAGE))
+        before = request.args.get("before", type=int)
+        start = request.args.get("start")
+        end = request.args.get("end")
+        start = normalize_time(start) if start else None
+        end = normalize_time(end) if end else None
+        min_chili = request.args.get("min_chili", type=int)
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+
+    try:
+        frames, next_before = gallery.list_frames(before, limit, start, end, min_chili)
+    except sqlite3.Error as e:
+        return json_response({"error": str(e)}, status=503)
+    return json_response({"frames": frames, "next": next_before})
+
+def immutable_headers(resp, etag):
+    # ภาพที่เก็บแล้วไม่เปลี่ยน -> browser cache ได้ตลอด
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
+
+@app.route('/api/camera/frames/<int:frame_id>.jpg')
+def api_camera_frame(frame_id):
+    """ภาพเต็ม อ่านจาก BLOB ทีละ chunk"""
+    etag = f"frame-{frame_id}"
+    if request.if_none_match.contains(etag):
+        return immutable_headers(Response(status=304), etag)
+    try:
+        info = gallery.frame_info(frame_id)
+    except sqlite3.Error as e:
+        return json_response({"error": str(e)}, status=503)
+    if info is None:
+        return Response(status=404)
+
+    resp = Response(gallery.iter_jpg(frame_id), mimetype="image/jpeg")
+    resp.headers["Content-Length"] = str(info[0])
+    return immutable_headers(resp, etag)
+
+@app.route('/api/camera/frames/<int:frame_id>/thumb.jpg')
+def api_camera_thumb(frame_id):
+    """thumbnail ?w=<px> (สร้างครั้งแรกแล้ว cache ไว้)"""
+    width = max(32, min(request.args.get("w", THUMB_WIDTH, type=int), 640))
+    etag = f"thumb-{frame_id}-{width}"
+    if request.if_none_match.contains(etag):
+        return immutable_headers(Response(status=304), etag)
+    try:
+        data = gallery.thumbnail(frame_id, width)
+    except ImportError:
+        return json_response({"error": "thumbnails need opencv-python"}, status=501)
+    except sqlite3.Error as e:
+        return json_response({"error": str(e)}, status=503)
+    if data is None:
+        return Response(status=404)
+    return immutable_headers(Response(data, mimetype="image/jpeg"), etag)
+
+# /api/history?range=30d&resolution=500&fields=temperature,co2&format=columnar
+#   range       ช่วงย้อนหลัง เช่น 15m, 6h, 7d (สูงสุด HISTORY_MAX_RANGE)
+#   resolution  จำนวนจุดสูงสุดต่อ field ที่จะส่งกลับ
+#   fields      field ที่ต้องการ (ค่าเริ่มต้น = ทั้งหมด)
+#   format      columnar (time + 1 array ต่อ field) หรือ rows (รูปแบบเดิม list ของ dict)
+#   since       (optional) epoch ms ของจุดสุดท้ายที่ client มี -> ส่งเฉพาะ row หลัง delta_from
+#               client ลบ row ของตัวเองที่ time > delta_from ก่อนต่อท้าย (window สุดท้ายอาจเปลี่ยน)
+# Influx ทำ aggregateWindow (mean) ให้เหลือ ~resolution × HISTORY_OVERSAMPLE จุดก่อน
+# แล้ว LTTB ใน Python ลดเหลือ resolution จุด (เก็บ peak ไว้ ไม่โดน mean เกลี่ยทิ้ง)
+# ทุก field ใช้แกนเวลาเดียวกัน (pivot) field ที่ไม่มีค่าในช่วงนั้น = null
+HISTORY_FIELDS         = ("temperature", "humidity", "co2", "light", "soil")
+HISTORY_DEFAULT_RANGE  = "1h"
+HISTORY_MAX_RANGE      = "90d"
+HISTORY_DEFAULT_POINTS = 500
+HISTORY_MAX_POINTS     = 5000
+HISTORY_OVERSAMPLE     = 4
+HISTORY_MIN_WINDOW_S   = 2        # window เล็กกว่านี้ = ใช้ค่าดิบ (Pi ส่งทุก ~2 s)
+GZIP_MIN_BYTES         = 1024
+
+# cache ของ /api/history (history_cache.py) ?since=<ms> = ขอเฉพาะส่วนที่ใหม่กว่า
+HISTORY_CACHE_MIN_REFRESH_S = 5.0                  # query Influx ต่อ key ไม่ถี่กว่านี้
+HISTORY_CACHE_REPRIME_S     = 300.0                # query เต็มช่วงใหม่เป็นระยะ
+HISTORY_CACHE_MAX_IDLE_S    = 600.0                # key ที่ไม่มีใครขอนานเกินนี้ถูกทิ้ง
+HISTORY_CACHE_MAX_BYTES     = 32 * 1024 * 1024
+
+# ช่วงยาวกว่า 1 วันอ่านจาก rollup ที่ subscriber_main_on_pi.py เขียนไว้ (ค่าเฉลี่ยใช้ชื่อ field เดิม)
+# เลือก rollup ที่ใหญ่ที่สุดที่ไม่หยาบกว่า window ของ query
+# ข้อมูลก่อนเปิดใช้ rollup จะไม่มีใน measurement นี้ -> ตั้ง False ถ้ายังต้องการดูข้อมูลเก่า
+HISTORY_USE_ROLLUPS        = True
+HISTORY_ROLLUP_MIN_RANGE_S = 86400
+HISTORY_ROLLUPS            = (("mqtt_data_1h", 3600), ("mqtt_data_1m", 60))
+
+# ช่วงสั้นอ่านค่าดิบจาก measurement นี้
+# "mqtt_fused" = record ต่อโซนทุก 10 s ของ subscriber (ทุก field อยู่ใน point เดียว, ต้องใช้เมื่อรัน --no-raw-points)
+HISTORY_RAW_MEASUREMENT    = "mqtt_data"
+
+# key แบบเดิมของ format=rows
+LEGACY_HISTORY_KEYS = {"temperature": "temp", "humidity": "hum"}
+
+_DURATION_RE = re.compile(r"^(\d+)([smhdw])$")
+_DURATION_UNIT_S = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+def parse_duration(text):
+    """'15m' / '6h' / '30d' -> seconds"""
+    m = _DURATION_RE.match(text.strip())
+    if not m or int(m.group(1)) == 0:
+        raise ValueError(f"invalid duration: {text!r}")
+    return int(m.group(1)) * _DURATION_UNIT_S[m.group(2)]
+
+def json_response(obj, status=200):
+    """JSON แบบ compact, gzip ให้ถ้า client รับได้และ body ใหญ่พอ"""
+    body = json.dumps(obj, separators=(",", ":")).encode("utf-8")
+    resp = Response(body, status=status, mimetype="application/json")
+    resp.vary.add("Accept-Encoding")
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in request.accept_encodings:
+        resp.set_data(gzip.compress(body, compresslevel=5))
+        resp.headers["Content-Encoding"] = "gzip"
+    return resp
+
+def history_window_s(range_s, points):
+    """ขนาด aggregateWindow (วินาที) หรือ 0 = ไม่ aggregate"""
+    window = range_s // (points * HISTORY_OVERSAMPLE)
+    return window if window >= HISTORY_MIN_WINDOW_S else 0
+
+def history_measurement(range_s, window_s):
+    if HISTORY_USE_ROLLUPS and range_s > HISTORY_ROLLUP_MIN_RANGE_S:
+        for measurement, rollup_s in HISTORY_ROLLUPS:
+            if window_s >= rollup_s:
+                return measurement
+    return HISTORY_RAW_MEASUREMENT
+
+def build_history_query(range_s, fields, window_s, start_ms=None):
+    field_filter = " or ".join(f'r._field == "{f}"' for f in fields)
+    measurement = history_measurement(range_s, window_s)
+    start = f"time(v: {start_ms * 1_000_000})" if start_ms is not None else f"-{range_s}s"
+    # รวมทุก node ของ field เดียวกันเป็นเส้นเดียว (เหมือนกราฟเดิม)
+    aggregate = ""
+    if window_s:
+        aggregate = f'|> aggregateWindow(every: {window_s}s, fn: mean, createEmpty: false)'
+    return f'''
     from(bucket: "{INFLUX_BUCKET}")
-      |> range(start: -1h)
-      |> filter(fn: (r) => r._measurement == "mqtt_data")
-      |> filter(fn: (r) => r._field == "temperature" or r._field == "humidity" or r._field == "co2" or r._field == "light" or r._field == "soil")
+      |> range(start: {start})
+      |> filter(fn: (r) => r._measurement == "{measurement}")
+      |> filter(fn: (r) => {field_filter})
+      |> group(columns: ["_field"])
+      {aggregate}
+      |> keep(columns: ["_time", "_field", "_value"])
+      |> group()
       |> pivot(rowKey:["_time"], columnKey:["_field"], valueColumn:"_value")
-      |> keep(columns: ["_time", "temperature", "humidity", "co2", "light", "soil"])
+      |> sort(columns: ["_time"])
     '''
+
+def fetch_history(range_s, fields, window_s, start_ms=None):
+    """
+    Returns (times_ms, {field: values}) before LTTB.
+    ช่วงที่อยู่ใน RAM ครบ (series_store) ไม่ต้องถาม Influx, Influx ล่ม -> ใช้เท่าที่มีใน RAM
+    """
+    now = time.time()
+    start = start_ms / 1000.0 if start_ms is not None else now - range_s
+    covered = series_store.covered_since()
+    if covered is not None and start >= covered:
+        return memory_history(fields, start, now, window_s)
     try:
-        tables = query_api.query(org=INFLUX_ORG, query=query)
-        data = []
-        for table in tables:
-            for record in table.records:
-                data.append({
-                    "time": record.get_time().isoformat(),
-                    "temp": record.values.get("temperature"),
-                    "hum": record.values.get("humidity"),
-                    "co2": record.values.get("co2"),
-                    "light": record.values.get("light"),
-                    "soil": record.values.get("soil")
-                })
-        return jsonify(data)
+        return influx_history(range_s, fields, window_s, start_ms)
+    except Exception as e:
+        if covered is None:
+            raise
+        print(f"⚠️ InfluxDB history failed, serving from memory: {e}")
+        return memory_history(fields, start, now, window_s)
+
+def memory_history(fields, start, end, window_s):
+    times, columns = series_store.table(fields, start, end, window_s)
+    return (times * 1000).astype("int64").tolist(), columns
+
+def influx_history(range_s, fields, window_s, start_ms=None):
+    query = build_history_query(range_s, fields, window_s, start_ms)
+    tables = query_api.query(org=INFLUX_ORG, query=query)
+
+    times = []
+    columns = {f: [] for f in fields}
+    for table in tables:
+        for record in table.records:
+            times.append(int(record.get_time().timestamp() * 1000))
+            for f in fields:
+                columns[f].append(record.values.get(f))
+    return times, columns
+
+history_cache = HistoryCache(
+    fetch_history,
+    min_refresh_s=HISTORY_CACHE_MIN_REFRESH_S,
+    reprime_s=HISTORY_CACHE_REPRIME_S,
+    max_idle_s=HISTORY_CACHE_MAX_IDLE_S,
+    max_bytes=HISTORY_CACHE_MAX_BYTES,
+)
+
+@app.route('/api/history')
+def api_history():
+    """ดึงข้อมูลย้อนหลังจาก InfluxDB (downsample ฝั่ง server)"""
+    try:
+        range_text = request.args.get("range", HISTORY_DEFAULT_RANGE)
+        range_s = parse_duration(range_text)
+        if range_s > parse_duration(HISTORY_MAX_RANGE):
+            raise ValueError(f"range larger than {HISTORY_MAX_RANGE}")
+        points = int(request.args.get("resolution", HISTORY_DEFAULT_POINTS))
+        points = max(10, min(points, HISTORY_MAX_POINTS))
+        fields = [f for f in request.args.get("fields", ",".join(HISTORY_FIELDS)).split(",") if f]
+        unknown = [f for f in fields if f not in HISTORY_FIELDS]
+        if unknown or not fields:
+            raise ValueError(f"unknown fields: {','.join(unknown)}")
+        fmt = request.args.get("format", "columnar")
+        if fmt not in ("columnar", "rows"):
+            raise ValueError(f"unknown format: {fmt}")
+        since = request.args.get("since")
+        since = int(since) if since else None
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+
+    window_s = history_window_s(range_s, points)
+    try:
+        times, columns, delta_from, _ = history_cache.get(range_s, fields, points, window_s, since)
     except Exception as e:
         return jsonify({"error": str(e)})
 
+    if fmt == "rows":
+        data = []
+        for i, t in enumerate(times):
+            row = {"time": datetime.fromtimestamp(t / 1000, tz=timezone.utc).isoformat()}
+            for f in fields:
+                row[LEGACY_HISTORY_KEYS.get(f, f)] = columns[f][i]
+            data.append(row)
+        return json_response(data)
+
+    body = {
+        "range": range_text,
+        "window_s": window_s,
+        "points": len(times),
+        "time": times,
+        "fields": columns,
+    }
+    if delta_from is not None:
+        body["delta_from"] = delta_from
+    return json_response(body)
+
+# ==========================================
+# 🌶️ CHILI TREND (chili_trend.py)
+# ==========================================
+# /api/chili/trend?range=7d&bucket=hour|day&tz=<นาที>  จำนวนพริกต่อชั่วโมง / วัน + percentile
+# อ่านตาราง chili_hourly ที่ subscriber อัปเดตพร้อมบันทึกภาพ (ไม่แตะตาราง images)
+# tz = offset ของเวลาท้องถิ่นจาก UTC เป็นนาที (ไทย = 420) ใช้ตัดวัน
+CHILI_TREND_DEFAULT_RANGE = "7d"
+CHILI_TREND_MAX_RANGE     = "365d"
+CHILI_TREND_BUCKETS       = {"hour": 3600, "day": 86400}
+
+@app.route('/api/chili/trend')
+def api_chili_trend():
+    try:
+        range_s = parse_duration(request.args.get("range", CHILI_TREND_DEFAULT_RANGE))
+        if range_s > parse_duration(CHILI_TREND_MAX_RANGE):
+            raise ValueError(f"range larger than {CHILI_TREND_MAX_RANGE}")
+        bucket = request.args.get("bucket", "hour")
+        if bucket not in CHILI_TREND_BUCKETS:
+            raise ValueError(f"unknown bucket: {bucket}")
+        tz_offset_s = int(request.args.get("tz", 0)) * 60
+        if abs(tz_offset_s) > 14 * 3600:
+            raise ValueError("tz out of range")
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+
+    now = time.time()
+    try:
+        conn = sqlite3.connect(f"file:{CAMERA_DB_PATH}?mode=ro", uri=True, timeout=5)
+        try:
+            trend = chili_trend(conn, now - range_s, now, CHILI_TREND_BUCKETS[bucket], tz_offset_s)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        return json_response({"error": str(e)}, status=503)
+
+    trend["time"] = [t * 1000 for t in trend["time"]]
+    trend["bucket"] = bucket
+    trend["percentiles"] = list(CHILI_PERCENTILES)
+    return json_response(trend)
+
+# ==========================================
+# 📦 EXPORT (Parquet / Arrow IPC)
+# ==========================================
+# /api/export?source=sensors|images&start=7d&end=<iso>&format=parquet|arrow&columns=time,node,co2&measurement=raw
+# ไฟล์เดียว stream กลับทีละ record batch (memory คงที่ ไม่ว่าช่วงจะยาวแค่ไหน), ต้องติดตั้ง pyarrow
+# แบ่งไฟล์ตามชั่วโมง / วัน / เดือน ใช้ CLI: python export.py sensors --start 30d --out exports --partition day
+EXPORT_MAX_CONCURRENT = 1     # ต่อ process: export หนัก ๆ พร้อมกันหลายตัวจะแย่ง Influx / SD card กับการรับข้อมูล
+EXPORT_MIMETYPES = {"parquet": "application/vnd.apache.parquet", "arrow": "application/vnd.apache.arrow.stream"}
+
+export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+
+@app.route('/api/export')
+def api_export():
+    """ส่งออก sensor history (Influx) หรือ metadata ของภาพ (camera_frames.db) เป็นไฟล์"""
+    try:
+        source = request.args.get("source", "sensors")
+        fmt = request.args.get("format", "parquet")
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"unknown format: {fmt}")
+        start = parse_time(request.args.get("start", HISTORY_DEFAULT_RANGE))
+        end = request.args.get("end")
+        end = parse_time(end) if end else datetime.now(timezone.utc)
+        columns = request.args.get("columns")
+        columns = [c for c in columns.split(",") if c] if columns else None
+        if source == "sensors":
+            schema, batches = sensor_export(query_api, INFLUX_ORG, INFLUX_BUCKET, start, end,
+                                            request.args.get("measurement", "raw"), columns)
+        elif source == "images":
+            schema, batches = image_export(CAMERA_DB_PATH, start, end, columns)
+        else:
+            raise ValueError(f"unknown source: {source}")
+    except ImportError:
+        return json_response({"error": "export needs pyarrow"}, status=501)
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+
+    if not export_slots.acquire(blocking=False):
+        return json_response({"error": "another export is running"}, status=429)
+
+    def stream():
+        try:
+            yield from iter_export_bytes(batches, schema, fmt)
+        except Exception as e:
+            # header ส่งไปแล้ว -> ไฟล์ที่ได้ไม่สมบูรณ์ (Parquet ไม่มี footer / Arrow ไม่มี end-of-stream)
+            print(f"⚠️ Export {source} failed: {e}")
+
+    ext = "parquet" if fmt == "parquet" else "arrow"
+    name = f"{source}-{start:%Y%m%dT%H%M%S}-{end:%Y%m%dT%H%M%S}.{ext}"
+    resp = Response(stream(), mimetype=EXPORT_MIMETYPES[fmt])
+    resp.call_on_close(export_slots.release)
+    resp.headers["Content-Disposition"] = f'attachment; filename="{name}"'
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
 @app.route('/')
 def index():
     return render_template_string('''
@@ -161,6 +772,13 @@ def index():
             /* HISTORY CHART STYLES */
             .charts-grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(400px, 1fr)); gap: 20px; }
             .chart-box { background: #1e293b; padding: 15px; border-radius: 12px; }
+
+            /* GALLERY STYLES */
+            .gallery-filter { display: flex; gap: 10px; align-items: center; margin-bottom: 15px; flex-wrap: wrap; }
+            .gallery-filter input { padding: 6px; border-radius: 5px; border: none; }
+            .gallery-grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(240px, 1fr)); gap: 12px; }
+            .frame { background: #1e293b; border-radius: 8px; padding: 6px; font-size: 0.85em; color: #94a3b8; }
+            .frame img { width: 100%; border-radius: 6px; display: block; }
         </style>
     </head>
     <body>
@@ -170,6 +788,7 @@ def index():
         <div class="tabs">
             <button class="tab-btn active" onclick="openTab('live', this)">🔴 Live Monitor</button>
             <button class="tab-btn" onclick="openTab('history', this)">📊 History Graph</button>
+            <button class="tab-btn" onclick="openTab('gallery', this)">🖼️ Gallery</button>
         </div>
 
         <div id="live" class="tab-content active">
@@ -198,6 +817,13 @@ def index():
 
         <div id="history" class="tab-content">
             <div style="text-align:right; margin-bottom:10px;">
+                <select id="hist-range" onchange="loadHistory()" style="padding:7px; border-radius:5px;">
+                    <option value="1h" selected>1 hour</option>
+                    <option value="6h">6 hours</option>
+                    <option value="24h">24 hours</option>
+                    <option value="7d">7 days</option>
+                    <option value="30d">30 days</option>
+                </select>
                 <button onclick="loadHistory()" style="background:#38bdf8; border:none; padding:8px 15px; border-radius:5px; cursor:pointer;">🔄 Refresh Graphs</button>
             </div>
             <div class="charts-grid">
@@ -206,6 +832,28 @@ def index():
                 <div class="chart-box"><canvas id="cCO2"></canvas></div>
                 <div class="chart-box"><canvas id="cLight"></canvas></div>
                 <div class="chart-box"><canvas id="cSoil"></canvas></div>
+                <div class="chart-box">
+                    <div style="text-align:right;">
+                        <select id="chili-bucket" onchange="loadChiliTrend()" style="padding:4px; border-radius:5px;">
+                            <option value="hour" selected>per hour</option>
+                            <option value="day">per day</option>
+                        </select>
+                    </div>
+                    <canvas id="cChili"></canvas>
+                </div>
+            </div>
+        </div>
+
+        <div id="gallery" class="tab-content">
+            <div class="gallery-filter">
+                <label>From <input type="datetime-local" id="gal-start"></label>
+                <label>To <input type="datetime-local" id="gal-end"></label>
+                <label>Chili ≥ <input type="number" id="gal-chili" min="0" style="width:60px;"></label>
+                <button onclick="loadGallery(true)" style="background:#38bdf8; border:none; padding:8px 15px; border-radius:5px; cursor:pointer;">🔍 Search</button>
+            </div>
+            <div id="gallery-grid" class="gallery-grid"></div>
+            <div style="text-align:center; margin:15px;">
+                <button id="gal-more" onclick="loadGallery(false)" style="display:none; background:#334155; color:#f1f5f9; border:none; padding:8px 15px; border-radius:5px; cursor:pointer;">Load more</button>
             </div>
         </div>
 
@@ -218,30 +866,58 @@ def index():
                 btn.classList.add('active');
                 
                 if(tabName === 'history') loadHistory(); // Auto load history when tab clicked
+                if(tabName === 'gallery' && galleryNext === undefined) loadGallery(true);
             }
 
             // --- 1. LIVE DATA LOGIC ---
+            // รับ diff จาก /api/stream (SSE) ถ้า browser ไม่รองรับหรือ stream ใช้ไม่ได้ค่อยกลับไป poll /api/live
+            const live = {};
+            let lastCamSeq = 0;
+            let pollTimer = null;
+
+            function renderLive(d) {
+                // Sensors
+                document.getElementById('pi-temp').innerText  = d.pi_temp ? d.pi_temp.toFixed(1) + ' °C' : '-';
+                document.getElementById('pi-light').innerText = d.pi_light ? d.pi_light.toFixed(0) + ' Lux' : '-';
+                document.getElementById('esp-co2').innerText  = d.esp_co2 ? d.esp_co2.toFixed(0) + ' ppm' : '-';
+                document.getElementById('esp-hum').innerText  = d.esp_hum ? d.esp_hum.toFixed(1) + ' %' : '-';
+                document.getElementById('esp-soil').innerText = d.esp_soil ? d.esp_soil.toFixed(1) + ' %' : '-';
+                document.getElementById('last-update').innerText = d.esp_update;
+
+                // Camera: โหลดรูปใหม่เฉพาะเมื่อมีเฟรมใหม่
+                if(d.cam_seq && d.cam_seq !== lastCamSeq) {
+                    lastCamSeq = d.cam_seq;
+                    document.getElementById('cam-img').src = '/api/camera/latest.jpg?seq=' + d.cam_seq;
+                }
+                document.getElementById('cam-count').innerText = d.cam_count;
+                document.getElementById('cam-fps').innerText = (d.cam_fps || 0).toFixed(1);
+            }
+
             async function updateLive() {
                 try {
                     const res = await fetch('/api/live');
-                    const d = await res.json();
-
-                    // Sensors
-                    document.getElementById('pi-temp').innerText  = d.pi_temp ? d.pi_temp.toFixed(1) + ' °C' : '-';
-                    document.getElementById('pi-light').innerText = d.pi_light ? d.pi_light.toFixed(0) + ' Lux' : '-';
-                    document.getElementById('esp-co2').innerText  = d.esp_co2 ? d.esp_co2.toFixed(0) + ' ppm' : '-';
-                    document.getElementById('esp-hum').innerText  = d.esp_hum ? d.esp_hum.toFixed(1) + ' %' : '-';
-                    document.getElementById('esp-soil').innerText = d.esp_soil ? d.esp_soil.toFixed(1) + ' %' : '-';
-                    document.getElementById('last-update').innerText = d.esp_update;
+                    renderLive(Object.assign(live, await res.json()));
+                } catch(e) { console.error("Live fetch error", e); }
+            }
 
-                    // Camera
-                    if(d.cam_img) document.getElementById('cam-img').src = "data:image/jpeg;base64," + d.cam_img;
-                    document.getElementById('cam-count').innerText = d.cam_count;
-                    document.getElementById('cam-fps').innerText = d.cam_fps.toFixed(1);
+            function startPolling() {
+                if(pollTimer) return;
+                updateLive();
+                pollTimer = setInterval(updateLive, 1000); // Call every 1 second
+            }
 
-                } catch(e) { console.error("Live fetch error", e); }
+            function startStream() {
+                if(!window.EventSource) return startPolling();
+                const es = new EventSource('/api/stream');
+                let opened = false;
+                es.onopen = () => { opened = true; };
+                es.onmessage = (e) => renderLive(Object.assign(live, JSON.parse(e.data)));
+                es.onerror = () => {
+                    // เคยต่อได้ -> ให้ EventSource reconnect เอง, ต่อไม่ได้ตั้งแต่แรก -> poll แทน
+                    if(!opened) { es.close(); startPolling(); }
+                };
             }
-            setInterval(updateLive, 1000); // Call every 1 second
+            startStream();
 
             // --- 2. HISTORY CHART LOGIC ---
             let charts = {};
@@ -249,11 +925,19 @@ def index():
             function initChart(id, label, color, unit) {
                 return new Chart(document.getElementById(id), {
                     type: 'line',
-                    data: { labels: [], datasets: [{ label: label, data: [], borderColor: color, backgroundColor: color+'20', fill: true, tension: 0.3 }] },
-                    options: { responsive: true, scales: { y: { title: { display:true, text: unit } } } }
+                    data: { labels: [], datasets: [{ label: label, data: [], borderColor: color, backgroundColor: color+'20', fill: true, tension: 0.3, pointRadius: 0, spanGaps: true }] },
+                    options: { responsive: true, animation: false, scales: { y: { title: { display:true, text: unit } } } }
                 });
             }
 
+            const HISTORY_POINTS = 500;
+            let hist = null;   // ข้อมูลที่โหลดแล้ว {range, time, fields}
+
+            function rangeMs(range) {
+                const unit = {s: 1e3, m: 6e4, h: 36e5, d: 864e5, w: 6048e5}[range.slice(-1)];
+                return parseInt(range) * unit;
+            }
+
             async function loadHistory() {
                 // Init charts if not exists
                 if(Object.keys(charts).length === 0) {
@@ -265,11 +949,32 @@ def index():
                 }
 
                 try {
-                    const res = await fetch('/api/history');
+                    const range = document.getElementById('hist-range').value;
+                    // ช่วงเดิม -> ขอเฉพาะส่วนใหม่ (since), เปลี่ยนช่วง -> โหลดใหม่ทั้งหมด
+                    const delta = hist && hist.range === range && hist.time.length > 0;
+                    let url = '/api/history?range=' + range + '&resolution=' + HISTORY_POINTS;
+                    if(delta) url += '&since=' + hist.time[hist.time.length - 1];
+                    const res = await fetch(url);
                     const data = await res.json();
                     if(data.error) return alert("DB Error: " + data.error);
 
-                    const times = data.map(d => new Date(d.time).toLocaleTimeString([], {hour:'2-digit', minute:'2-digit'}));
+                    if(delta) {
+                        // ลบ row หลัง delta_from (window สุดท้ายอาจถูกคำนวณใหม่) แล้วต่อท้าย, ตัดที่เก่ากว่าช่วงทิ้ง
+                        const oldest = Date.now() - rangeMs(range);
+                        const keep = hist.time.map((t, i) => i).filter(i => hist.time[i] <= data.delta_from && hist.time[i] >= oldest);
+                        hist.time = keep.map(i => hist.time[i]).concat(data.time);
+                        for(const f in hist.fields) {
+                            hist.fields[f] = keep.map(i => hist.fields[f][i]).concat(data.fields[f]);
+                        }
+                    } else {
+                        hist = { range: range, time: data.time, fields: data.fields };
+                    }
+
+                    // ช่วงยาวกว่า 1 วันแสดงวันที่ด้วย
+                    const longRange = /[dw]$/.test(range);
+                    const fmt = longRange ? {month:'short', day:'numeric', hour:'2-digit', minute:'2-digit'}
+                                          : {hour:'2-digit', minute:'2-digit'};
+                    const times = hist.time.map(t => new Date(t).toLocaleString([], fmt));
                     
                     const update = (key, raw) => {
                         charts[key].data.labels = times;
@@ -277,18 +982,107 @@ def index():
                         charts[key].update();
                     };
 
-                    update('temp', data.map(d => d.temp));
-                    update('hum', data.map(d => d.hum));
-                    update('co2', data.map(d => d.co2));
-                    update('light', data.map(d => d.light));
-                    update('soil', data.map(d => d.soil));
+                    update('temp', hist.fields.temperature);
+                    update('hum', hist.fields.humidity);
+                    update('co2', hist.fields.co2);
+                    update('light', hist.fields.light);
+                    update('soil', hist.fields.soil);
                     
                 } catch(e) { console.error("History fetch error", e); }
+                loadChiliTrend();
+            }
+
+            // จำนวนพริกจาก /api/chili/trend: median + แถบ p25-p75 / p10-p90 + ค่าเฉลี่ย
+            let chiliChart = null;
+
+            async function loadChiliTrend() {
+                if(!chiliChart) {
+                    const band = (label, color, fill) => ({ label: label, data: [], borderColor: 'transparent',
+                        backgroundColor: color, fill: fill, pointRadius: 0, tension: 0.2 });
+                    chiliChart = new Chart(document.getElementById('cChili'), {
+                        type: 'line',
+                        data: { labels: [], datasets: [
+                            band('p90', 'transparent', false),
+                            band('p10-p90', '#ef444425', '-1'),
+                            band('p75', 'transparent', false),
+                            band('p25-p75', '#ef444455', '-1'),
+                            { label: 'Median', data: [], borderColor: '#ef4444', pointRadius: 0, tension: 0.2 },
+                            { label: 'Mean', data: [], borderColor: '#fbbf24', borderDash: [4, 4], pointRadius: 0, tension: 0.2 },
+                        ] },
+                        options: { responsive: true, animation: false,
+                            plugins: { legend: { labels: { filter: (item) => !/^p\\d+$/.test(item.text) } } },
+                            scales: { y: { beginAtZero: true, title: { display: true, text: 'Chili / frame' } } } }
+                    });
+                }
+                try {
+                    let range = document.getElementById('hist-range').value;
+                    const bucket = document.getElementById('chili-bucket').value;
+                    if(bucket === 'day' && !/[dw]$/.test(range)) range = '7d';   // ช่วงสั้นกว่าวันดูรายวันไม่มีความหมาย
+                    const res = await fetch('/api/chili/trend?range=' + range + '&bucket=' + bucket +
+                                            '&tz=' + (-new Date().getTimezoneOffset()));
+                    const data = await res.json();
+                    if(data.error) return console.error("Chili trend error", data.error);
+
+                    const fmt = bucket === 'day' ? {month:'short', day:'numeric'}
+                                                 : {month:'short', day:'numeric', hour:'2-digit'};
+                    chiliChart.data.labels = data.time.map(t => new Date(t).toLocaleString([], fmt));
+                    const series = [data.p90, data.p10, data.p75, data.p25, data.p50, data.mean];
+                    series.forEach((s, i) => { chiliChart.data.datasets[i].data = s; });
+                    chiliChart.update();
+                } catch(e) { console.error("Chili trend fetch error", e); }
+            }
+            // --- 3. GALLERY LOGIC ---
+            // แบ่งหน้าแบบ keyset: ขอหน้าถัดไปด้วย before=<id สุดท้ายที่ได้>
+            let galleryNext = undefined;   // undefined = ยังไม่เคยโหลด, null = หมดแล้ว
+
+            async function loadGallery(reset) {
+                const grid = document.getElementById('gallery-grid');
+                if(reset) { grid.innerHTML = ''; galleryNext = undefined; }
+
+                const params = new URLSearchParams();
+                const start = document.getElementById('gal-start').value;
+                const end = document.getElementById('gal-end').value;
+                const chili = document.getElementById('gal-chili').value;
+                if(start) params.set('start', new Date(start).toISOString());
+                if(end) params.set('end', new Date(end).toISOString());
+                if(chili) params.set('min_chili', chili);
+                if(galleryNext) params.set('before', galleryNext);
+
+                try {
+                    const res = await fetch('/api/camera/frames?' + params);
+                    const data = await res.json();
+                    if(data.error) return alert("Gallery Error: " + data.error);
+
+                    for(const f of data.frames) {
+                        const div = document.createElement('div');
+                        div.className = 'frame';
+                        div.innerHTML = '<a href="/api/camera/frames/' + f.id + '.jpg" target="_blank">' +
+                            '<img loading="lazy" src="/api/camera/frames/' + f.id + '/thumb.jpg"></a>' +
+                            new Date(f.created_at).toLocaleString() + ' | 🌶️ ' + f.chili_count;
+                        grid.appendChild(div);
+                    }
+                    galleryNext = data.next;
+                    document.getElementById('gal-more').style.display = data.next ? 'inline-block' : 'none';
+                } catch(e) { console.error("Gallery fetch error", e); }
             }
         </script>
     </body>
     </html>
     ''')
 
+# ==========================================
+# 🩺 PROFILING (profiling.py)
+# ==========================================
+# /admin/profile?seconds=30, /admin/memory, /admin/threads จาก localhost เท่านั้น (ทุก role ที่มีเว็บ)
+# python Dashboard.py (standalone / ingest) สั่งด้วย kill -USR1 / -USR2 ได้ด้วย
+# gunicorn ใช้ USR1 / USR2 เอง -> web worker ใช้ HTTP อย่างเดียว
+profiler = Profiler(f"dashboard-{DASHBOARD_ROLE}")
+register_admin_routes(app, profiler)
+
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=5001, debug=True)
+    profiler.install_signals()
+    if DASHBOARD_ROLE == "ingest":
+        print(f"📥 Ingest only: writing live state to shared memory '{LIVE_SHM_NAME}'")
+        start_mqtt()
+    else:
+        app.run(host="0.0.0.0", port=5001, debug=False, threaded=True)
@@ -0,0 +1,147 @@
+# anomaly.py
+# ตรวจ sensor ผิดปกติแบบ streaming: state ขนาดคงที่ต่อ node × field (ไม่เก็บ window, ไม่คำนวณย้อนหลัง)
+#
+#   range     ค่านอกช่วงที่ sensor วัดได้จริง หรือ NaN (ADC ติดขอบ: สายหลุด -> 0, อิ่มตัว -> 4095)   fault
+#   rate      |Δค่า| / Δt เกินที่เป็นไปได้ทางกายภาพ (glitch)                                 fault
+#   flatline  ค่าเดิมเป๊ะนานเกิน flat_s (sensor ค้าง / ESP32 ส่งค่า cache เดิม)               fault
+#   spike     |x - mean| / std > z โดย mean / variance แบบ Welford ที่ลืมค่าเก่าตามเวลา (EWMA, tau_s)
+#             ช่วงแรกเป็น Welford สะสมปกติจนจำนวน sample พอ แล้วค่อย ๆ เปลี่ยนเป็น exponential   event
+#
+# fault มีสถานะ: ออก event "start" ตอนเริ่ม และ "end" ตอนหาย ระหว่างนั้น faulted() = True
+# (subscriber ไม่ใช้ค่านั้นตัดสิน relay) spike เป็น event ครั้งเดียว ไม่กัน relay เพราะค่าที่กระโดดจริง
+# (เปิดประตู CO2 ขึ้น) ก็ดูเหมือน spike ได้
+#
+# limits = {field: (low, high, max_rate ต่อวินาที, flat_s, min_std)} None = ไม่ตรวจข้อนั้น
+# state ของ node หนึ่งถูกแก้จาก thread เดียว (ingest worker ของ node) เหมือน NodeState
+import math
+
+FAULT_KINDS = ("range", "rate", "flatline")
+RATE_MIN_DT_S = 1.0     # batch 10 Hz: Δt เล็กมาก noise 1 step ของ sensor ก็ดูเหมือนเปลี่ยนเร็ว
+
+
+class AnomalyEvent:
+    __slots__ = ("node_id", "zone", "field", "kind", "state", "value", "ts", "detail")
+
+    def __init__(self, node_id, zone, field, kind, state, value, ts, detail):
+        self.node_id = node_id
+        self.zone = zone
+        self.field = field
+        self.kind = kind
+        self.state = state        # "start" / "end" (fault), "event" (spike)
+        self.value = value
+        self.ts = ts
+        self.detail = detail
+
+    def to_dict(self):
+        return {
+            "node": self.node_id, "zone": self.zone, "field": self.field, "kind": self.kind,
+            "state": self.state, "value": self.value if math.isfinite(self.value) else None,
+            "ts": self.ts, **self.detail,
+        }
+
+
+class FieldState:
+    __slots__ = ("n", "mean", "var", "last_ts", "last_value", "flat_value", "flat_since",
+                 "faults", "last_spike")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.last_ts = None
+        self.last_value = None
+        self.flat_value = None
+        self.flat_since = None
+        self.faults = {}          # kind -> ts ที่เริ่ม
+        self.last_spike = None
+
+
+class AnomalyDetector:
+    """
+    add(node_id, zone, values, ts) checks one sample and calls emit(event) on every
+    fault start / end and spike; faulted(node_id, field) says whether to distrust the field.
+    """
+
+    def __init__(self, limits, emit, tau_s=900.0, z=6.0, warmup=30, spike_interval_s=60.0):
+        self.limits = limits
+        self.emit = emit
+        self.tau_s = tau_s
+        self.z = z
+        self.warmup = warmup
+        self.spike_interval_s = spike_interval_s
+        self._states = {}         # (node_id, field) -> FieldState
+        self.out_of_order = 0
+
+    def faulted(self, node_id, field):
+        state = self._states.get((node_id, field))
+        return state is not None and bool(state.faults)
+
+    def active_faults(self):
+        """{(node_id, field): [kind, ...]} of everything currently faulted."""
+        return {key: sorted(s.faults) for key, s in self._states.items() if s.faults}
+
+    def add(self, node_id, zone, values, ts):
+        """values: {field: value or None}; fields without limits are ignored."""
+        for field, value in values.items():
+            limits = self.limits.get(field)
+            if limits is None or value is None:
+                continue
+            key = (node_id, field)
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = FieldState()
+            self._check(state, node_id, zone, field, float(value), ts, limits)
+
+    def _check(self, s, node_id, zone, field, x, ts, limits):
+        if s.last_ts is not None and ts <= s.last_ts:
+            self.out_of_order += 1    # ส่งซ้ำ / มาช้า: Δt ใช้ไม่ได้
+            return
+        low, high, max_rate, flat_s, min_std = limits
+        active = {}
+
+        if not (low <= x <= high):    # NaN ก็ไม่ผ่าน
+            checked = ("range",)
+            active["range"] = {"low": low, "high": high}
+        else:
+            checked = FAULT_KINDS
+            if max_rate is not None and s.last_value is not None:
+                rate = abs(x - s.last_value) / max(ts - s.last_ts, RATE_MIN_DT_S)
+                if rate > max_rate:
+                    active["rate"] = {"rate": round(rate, 3), "max_rate": max_rate}
+
+            if flat_s is not None:
+                if x == s.flat_value:
+                    if ts - s.flat_since >= flat_s:
+                        active["flatline"] = {"flat_s": round(ts - s.flat_since, 1)}
+                else:
+                    s.flat_value, s.flat_since = x, ts
+
+            if s.n >= self.warmup:
+                std = max(math.sqrt(s.var), min_std or 0.0)
+                z = abs(x - s.mean) / std if std > 0 else 0.0
+                if z > self.z and (s.last_spike is None or ts - s.last_spike >= self.spike_interval_s):
+                    s.last_spike = ts
+                    self.emit(AnomalyEvent(node_id, zone, field, "spike", "event", x, ts, {
+                        "z": round(z, 2), "mean": round(s.mean, 3), "std": round(std, 3)}))
+
+            if "rate" not in active:
+                # Welford: alpha = 1/(n+1) ช่วงแรก (mean / variance สะสม), ต่อไป alpha ตามเวลา (ลืมค่าเก่า)
+                alpha = 1.0 / (s.n + 1)
+                if s.last_ts is not None:
+                    alpha = max(alpha, 1.0 - math.exp(-(ts - s.last_ts) / self.tau_s))
+                diff = x - s.mean
+                incr = alpha * diff
+                s.mean += incr
+                s.var = (1.0 - alpha) * (s.var + diff * incr)
+                s.n += 1
+            s.last_value = x
+        s.last_ts = ts
+
+        for kind in checked:
+            was = kind in s.faults
+            if kind in active and not was:
+                s.faults[kind] = ts
+                self.emit(AnomalyEvent(node_id, zone, field, kind, "start", x, ts, active[kind]))
+            elif was and kind not in active:
+                since = s.faults.pop(kind)
+                self.emit(AnomalyEvent(node_id, zone, field, kind, "end", x, ts, {"duration_s": round(ts - since, 1)}))
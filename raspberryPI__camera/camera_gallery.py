@@ -0,0 +1,173 @@
+# camera_gallery.py
+# อ่านภาพที่ subscriber เก็บไว้ใน camera_frames.db (ตาราง images) ให้ Dashboard แสดงเป็น gallery
+#
+# - แบ่งหน้าแบบ keyset (id < before ORDER BY id DESC) ไม่ใช้ OFFSET -> หน้าลึก ๆ ก็เร็วเท่าหน้าแรก
+# - list ไม่แตะคอลัมน์ jpg (อยู่ท้าย row, SQLite ไม่ต้องอ่าน overflow page ของรูป)
+# - รูปเต็มอ่านทีละ chunk ด้วย blobopen (incremental BLOB I/O) ไม่โหลดทั้ง row
+# - thumbnail สร้างตอนขอครั้งแรก (OpenCV) แล้วเก็บใน LRU ตามขนาด byte
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+BLOB_CHUNK = 64 * 1024
+
+
+def normalize_time(text):
+    """ISO-8601 from the client -> the UTC format stored in images.created_at."""
+    dt = datetime.fromisoformat(text.strip().replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).isoformat(timespec="seconds")
+
+
+class ThumbnailCache:
+    """LRU of encoded thumbnails, bounded by total bytes."""
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._items[key] = data
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self.bytes -= len(evicted)
+
+
+class FrameGallery:
+    def __init__(self, db_path, thumb_cache_bytes=8 * 1024 * 1024, thumb_quality=70):
+        self.db_path = db_path
+        self.thumb_quality = thumb_quality
+        self.thumbs = ThumbnailCache(thumb_cache_bytes)
+
+    def _connect(self):
+        # read-only: Dashboard ไม่มีสิทธิ์แก้ภาพที่ subscriber เก็บ
+        return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=5)
+
+    def list_frames(self, before=None, limit=50, start=None, end=None, min_chili=None):
+        """
+        Newest first. Returns (frames, next_before); pass next_before as `before`
+        to get the following page (None = no more frames).
+        """
+        where, args = [], []
+        if before is not None:
+            where.append("id < ?")
+            args.append(before)
+        if start is not None:
+            where.append("created_at >= ?")
+            args.append(start)
+        if end is not None:
+            where.append("created_at < ?")
+            args.append(end)
+        if min_chili is not None:
+            where.append("chili_count >= ?")
+            args.append(min_chili)
+
+        sql = "SELECT id, created_at, width, height, fps, chili_count, length(jpg) FROM images"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id DESC LIMIT ?"
+        args.append(limit + 1)
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, args).fetchall()
+        finally:
+            conn.close()
+
+        frames = [
+            {"id": r[0], "created_at": r[1], "width": r[2], "height": r[3],
+             "fps": r[4], "chili_count": r[5], "bytes": r[6]}
+            for r in rows[:limit]
+        ]
+        next_before = frames[-1]["id"] if len(rows) > limit else None
+        return frames, next_before
+
+    def frame_info(self, frame_id):
+        """(jpeg_bytes, width) or None if the frame does not exist."""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT length(jpg), width FROM images WHERE id = ?", (frame_id,)).fetchone()
+        finally:
+            conn.close()
+
+    def iter_jpg(self, frame_id, chunk=BLOB_CHUNK):
+        """Yield the JPEG in chunks without loading the whole row."""
+        conn = self._connect()
+        try:
+            if hasattr(conn, "blobopen"):
+                with conn.blobopen("images", "jpg", frame_id, readonly=True) as blob:
+                    while True:
+                        data = blob.read(chunk)
+                        if not data:
+                            break
+                        yield data
+            else:
+                # Python < 3.11 ไม่มี blobopen: อ่านทีละช่วงด้วย substr
+                offset = 1
+                while True:
+                    row = conn.execute(
+                        "SELECT substr(jpg, ?, ?) FROM images WHERE id = ?", (offset, chunk, frame_id)
+                    ).fetchone()
+                    if not row or not row[0]:
+                        break
+                    yield bytes(row[0])
+                    offset += chunk
+        finally:
+            conn.close()
+
+    def read_jpg(self, frame_id):
+        return b"".join(self.iter_jpg(frame_id))
+
+    def thumbnail(self, frame_id, width):
+        """JPEG thumbnail `width` px wide (cached), or None if the frame does not exist."""
+        key = (frame_id, width)
+        data = self.thumbs.get(key)
+        if data is not None:
+            return data
+
+        import cv2
+        import numpy as np
+
+        info = self.frame_info(frame_id)
+        if info is None:
+            return None
+        jpg = self.read_jpg(frame_id)
+        buf = np.frombuffer(jpg, np.uint8)
+
+        # ให้ libjpeg decode ที่ 1/2, 1/4, 1/8 เลย เร็วกว่า decode เต็มแล้วย่อมาก (สำคัญบน Pi)
+        src_w = info[1] or 0
+        flag = cv2.IMREAD_COLOR
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if src_w // factor >= width:
+                flag = reduced
+                break
+        img = cv2.imdecode(buf, flag)
+        if img is None:
+            return None
+
+        h, w = img.shape[:2]
+        if w > width:
+            img = cv2.resize(img, (width, max(1, h * width // w)), interpolation=cv2.INTER_AREA)
+        ok, enc = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, self.thumb_quality])
+        if not ok:
+            return None
+        data = enc.tobytes()
+        self.thumbs.put(key, data)
+        return data
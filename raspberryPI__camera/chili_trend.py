@@ -0,0 +1,137 @@
+# chili_trend.py
+# จำนวนพริกต่อชั่วโมงแบบ histogram ในตาราง chili_hourly (อยู่ใน camera_frames.db คู่กับตาราง images)
+#
+#   1 row ต่อชั่วโมง (hour = epoch s ต้นชั่วโมง, UTC): frames, total, min, max
+#   hist = จำนวนเฟรมต่อค่า chili_count 0 .. CHILI_HIST_BINS-1 (uint32 little-endian, bin สุดท้าย = ค่านั้นขึ้นไป)
+#
+# subscriber อัปเดต row ใน transaction เดียวกับ INSERT ภาพ -> ตรงกับตาราง images เสมอ (ภาพเก่าเติมด้วย backfill)
+# trend รายวัน = รวม histogram รายชั่วโมง, percentile คิดจาก histogram (chili_count เป็นจำนวนเต็ม -> ค่าตรง
+# ไม่ต้องประมาณ ยกเว้นค่าที่ตกใน bin สุดท้าย) 90 วัน = 2,160 row เล็ก ๆ ไม่แตะตาราง images / BLOB ภาพ
+import struct
+from array import array
+
+CHILI_HIST_BINS = 64
+CHILI_PERCENTILES = (10, 25, 50, 75, 90)
+
+_HIST_FORMAT = f"<{CHILI_HIST_BINS}I"
+
+
+def init_chili_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS chili_hourly (
+        hour INTEGER PRIMARY KEY,
+        frames INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        min INTEGER NOT NULL,
+        max INTEGER NOT NULL,
+        hist BLOB NOT NULL
+    )
+    """)
+
+
+def pack_hist(hist):
+    return struct.pack(_HIST_FORMAT, *hist)
+
+
+def unpack_hist(blob):
+    return array("I", struct.unpack(_HIST_FORMAT, blob))
+
+
+def record_chili_count(conn, ts, count):
+    """Add one frame (captured at epoch `ts`) to its hour; call inside the INSERT's transaction."""
+    if count is None:
+        return
+    count = max(0, int(count))
+    hour = int(ts) // 3600 * 3600
+    row = conn.execute("SELECT frames, total, min, max, hist FROM chili_hourly WHERE hour = ?", (hour,)).fetchone()
+    if row is None:
+        frames, total, lo, hi, hist = 0, 0, count, count, array("I", bytes(4 * CHILI_HIST_BINS))
+    else:
+        frames, total, lo, hi, hist = row[0], row[1], row[2], row[3], unpack_hist(row[4])
+    hist[min(count, CHILI_HIST_BINS - 1)] += 1
+    conn.execute(
+        "INSERT OR REPLACE INTO chili_hourly (hour, frames, total, min, max, hist) VALUES (?, ?, ?, ?, ?, ?)",
+        (hour, frames + 1, total + count, min(lo, count), max(hi, count), pack_hist(hist)),
+    )
+
+
+def backfill_chili_counts(conn):
+    """Rebuild chili_hourly from the images table (metadata columns only). Returns the number of hours."""
+    rows = conn.execute("""
+        SELECT CAST(strftime('%s', created_at) AS INTEGER) / 3600 * 3600 AS hour,
+               MAX(chili_count, 0), COUNT(*)
+        FROM images WHERE chili_count IS NOT NULL
+        GROUP BY hour, MAX(chili_count, 0)
+    """).fetchall()
+    hours = {}
+    for hour, count, n in rows:
+        h = hours.get(hour)
+        if h is None:
+            h = hours[hour] = [0, 0, count, count, array("I", bytes(4 * CHILI_HIST_BINS))]
+        h[0] += n
+        h[1] += count * n
+        h[2] = min(h[2], count)
+        h[3] = max(h[3], count)
+        h[4][min(count, CHILI_HIST_BINS - 1)] += n
+    conn.execute("DELETE FROM chili_hourly")
+    conn.executemany(
+        "INSERT INTO chili_hourly (hour, frames, total, min, max, hist) VALUES (?, ?, ?, ?, ?, ?)",
+        [(hour, f, t, lo, hi, pack_hist(hist)) for hour, (f, t, lo, hi, hist) in sorted(hours.items())],
+    )
+    return len(hours)
+
+
+def hist_percentile(hist, n, p):
+    """Nearest-rank p-th percentile of n values counted in hist."""
+    rank = max(1, -(-p * n // 100))   # ceil(p / 100 * n)
+    seen = 0
+    for value, c in enumerate(hist):
+        seen += c
+        if seen >= rank:
+            return value
+    return len(hist) - 1
+
+
+def chili_trend(conn, start_ts, end_ts, bucket_s=3600, tz_offset_s=0, percentiles=CHILI_PERCENTILES):
+    """
+    Count per bucket (3600 = hour, 86400 = day; days start at local midnight via tz_offset_s)
+    for hours in [start_ts, end_ts). Buckets without frames are left out.
+    Returns {"time": [bucket start, epoch s], "frames", "mean", "min", "max", "p<N>" for each N}.
+    """
+    rows = conn.execute(
+        "SELECT hour, frames, total, min, max, hist FROM chili_hourly WHERE hour >= ? AND hour < ? ORDER BY hour",
+        (int(start_ts) // 3600 * 3600, int(end_ts)),
+    ).fetchall()
+
+    out = {"time": [], "frames": [], "mean": [], "min": [], "max": []}
+    for p in percentiles:
+        out[f"p{p}"] = []
+
+    def emit(key, frames, total, lo, hi, hist):
+        out["time"].append(key * bucket_s - tz_offset_s)
+        out["frames"].append(frames)
+        out["mean"].append(round(total / frames, 3))
+        out["min"].append(lo)
+        out["max"].append(hi)
+        for p in percentiles:
+            out[f"p{p}"].append(hist_percentile(hist, frames, p))
+
+    current = None
+    for hour, frames, total, lo, hi, blob in rows:
+        key = (hour + tz_offset_s) // bucket_s
+        if current is not None and current[0] != key:
+            emit(*current)
+            current = None
+        if current is None:
+            current = [key, frames, total, lo, hi, unpack_hist(blob)]
+            continue
+        current[1] += frames
+        current[2] += total
+        current[3] = min(current[3], lo)
+        current[4] = max(current[4], hi)
+        for i, c in enumerate(unpack_hist(blob)):
+            if c:
+                current[5][i] += c
+    if current is not None:
+        emit(*current)
+    return out
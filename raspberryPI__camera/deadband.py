@@ -0,0 +1,91 @@
+# deadband.py
+# Report-by-exception: ส่งค่าเมื่อเปลี่ยนเกิน deadband หรือเงียบนานเกิน max_silence (heartbeat)
+from collections import deque
+from statistics import median
+
+
+class DeadbandFilter:
+    """
+    Deadband filter for one field, with optional smoothing.
+
+    smoothing: None, "median" (rolling median of `window` samples)
+               or "ewma" (exponential moving average with `alpha`)
+    """
+
+    def __init__(self, deadband, max_silence, smoothing=None, window=5, alpha=0.3):
+        if smoothing not in (None, "median", "ewma"):
+            raise ValueError(f"unknown smoothing: {smoothing}")
+        self.deadband = deadband
+        self.max_silence = max_silence
+        self.smoothing = smoothing
+        self.alpha = alpha
+        self._window = deque(maxlen=window)
+        self._ewma = None
+        self._last_value = None
+        self._last_at = None
+
+    def smooth(self, value):
+        if value is None or self.smoothing is None:
+            return value
+        if self.smoothing == "median":
+            self._window.append(value)
+            return median(self._window)
+        self._ewma = value if self._ewma is None else self._ewma + self.alpha * (value - self._ewma)
+        return self._ewma
+
+    def update(self, value, now):
+        """Feed one sample; return (should_report, value_to_report)."""
+        value = self.smooth(value)
+
+        if self._last_at is None:
+            report = True
+        elif value is None or self._last_value is None:
+            # เซนเซอร์หาย / กลับมา -> แจ้งทันทีครั้งเดียว
+            report = (value is None) != (self._last_value is None)
+        else:
+            report = abs(value - self._last_value) > self.deadband
+
+        if not report and now - self._last_at >= self.max_silence:
+            report = True  # heartbeat
+
+        if report:
+            self._last_value = value
+            self._last_at = now
+        return report, value
+
+
+class ReportFilter:
+    """Deadband filters for a set of fields, created on first use."""
+
+    def __init__(self, deadbands, max_silence, smoothing=None, default_deadband=0.0):
+        self.deadbands = dict(deadbands)
+        self.max_silence = max_silence
+        self.smoothing = dict(smoothing or {})
+        self.default_deadband = default_deadband
+        self._filters = {}
+
+    def _filter_for(self, field):
+        f = self._filters.get(field)
+        if f is None:
+            # probe:<rom> ใช้ค่าของ "probe"
+            key = field.split(":", 1)[0]
+            f = DeadbandFilter(
+                self.deadbands.get(field, self.deadbands.get(key, self.default_deadband)),
+                self.max_silence,
+                self.smoothing.get(field, self.smoothing.get(key)),
+            )
+            self._filters[field] = f
+        return f
+
+    def filter(self, values, now):
+        """Return only the fields of `values` that should be reported now."""
+        out = {}
+        for field, value in values.items():
+            report, v = self._filter_for(field).update(value, now)
+            if report:
+                out[field] = v
+        return out
+
+    def describe(self):
+        """Metadata for consumers: the stream is deadband-compressed."""
+        return {"mode": "deadband", "deadband": self.deadbands, "max_silence": self.max_silence}
@@ -0,0 +1,70 @@
+# downsample.py
+# Largest-Triangle-Three-Buckets (LTTB): ลดจำนวนจุดของกราฟโดยยังเก็บรูปร่าง (peak / dip) ไว้
+# ต่างจาก mean ตรงที่ไม่เกลี่ย spike ทิ้ง ใช้กับ /api/history ของ Dashboard
+#
+# Steinarsson, "Downsampling Time Series for Visual Representation" (2013)
+# ขยายให้หลาย field ใช้แกนเวลาร่วมกัน: พื้นที่สามเหลี่ยมของแต่ละ field (normalize ด้วยช่วงค่า)
+# ถูกรวมกัน แล้วเลือก row เดียวต่อ bucket -> ทุก field ได้จุดเวลาเดียวกัน
+
+
+def _scaled(values):
+    present = [v for v in values if v is not None]
+    if not present:
+        return None
+    lo, hi = min(present), max(present)
+    span = (hi - lo) or 1.0
+    return [None if v is None else (v - lo) / span for v in values]
+
+
+def _mean(values, start, end):
+    total, cnt = 0.0, 0
+    for v in values[start:end]:
+        if v is not None:
+            total += v
+            cnt += 1
+    return total / cnt if cnt else None
+
+
+def lttb_indices(xs, columns, threshold):
+    """
+    Row indices LTTB keeps from a table with time axis `xs` (sorted ascending)
+    and value `columns` (lists aligned with xs; None = no value).
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    cols = [c for c in (_scaled(col) for col in columns) if c is not None]
+    x0 = xs[0]
+    x_span = float(xs[-1] - x0) or 1.0
+    xs = [(x - x0) / x_span for x in xs]
+
+    keep = [0]
+    bucket = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # bucket ถัดไป -> จุดเฉลี่ยใช้เป็นยอดที่ 3 ของสามเหลี่ยม
+        nxt_start = int((i + 1) * bucket) + 1
+        nxt_end = min(int((i + 2) * bucket) + 1, n)
+        avg_x = sum(xs[nxt_start:nxt_end]) / (nxt_end - nxt_start)
+        avg_ys = [_mean(col, nxt_start, nxt_end) for col in cols]
+
+        # bucket ปัจจุบัน -> เลือก row ที่ผลรวมพื้นที่สามเหลี่ยมใหญ่สุด
+        start = int(i * bucket) + 1
+        end = int((i + 1) * bucket) + 1
+        ax = xs[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = 0.0
+            for col, avg_y in zip(cols, avg_ys):
+                ay, y = col[a], col[j]
+                if ay is None or y is None or avg_y is None:
+                    continue
+                area += abs((ax - avg_x) * (y - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        keep.append(best)
+        a = best
+
+    keep.append(n - 1)
+    return keep
@@ -0,0 +1,133 @@
+# edge_bus.py
+# pub/sub ภายใน process เดียวสำหรับ edge_runtime.py: topic เดียวกับ MQTT (node_topics.py) แต่ส่ง object
+# ไม่ต้อง json.dumps / base64 / json.loads ซ้ำในแต่ละตัวรับ
+#
+# message ของแต่ละ kind (ตัวรับห้ามแก้ object: ทุกตัวรับได้ object เดียวกัน)
+#   pi        dict รูปเดียวกับ JSON ของ pub_sensor_on_pi.py
+#   pi_batch  PiBatch (fields, rows, seq, sent_ts) รูปเดียวกับผลของ sample_batch.decode_batch
+#   esp       EspReading (co2, humidity, soil, seq, ts)
+#   camera    dict รูปเดียวกับ JSON ของ publisher_camera.py แต่มี "jpg" (bytes) แทน "image" (base64)
+#   metrics   dict (LatencyRecorder.snapshot())
+# decode_message / encode_message แปลงกับ payload MQTT (bridge ขาเข้า-ออก, archive)
+import base64
+import json
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from paho.mqtt.client import topic_matches_sub
+
+from sample_batch import batch_meta, decode_batch, encode_batch
+
+
+class PiBatch(NamedTuple):
+    fields: list
+    rows: list                 # [(ts, (v0, v1, ...)), ...] None = ไม่มีค่า
+    seq: Optional[int]
+    sent_ts: Optional[float]
+
+
+class EspReading(NamedTuple):
+    co2: float
+    humidity: float
+    soil: float
+    seq: Optional[int]
+    ts: Optional[float]        # None = ESP32 ยังไม่ได้เวลาจาก NTP
+
+
+def batch_message(rows, seq=0, sent_ts=None):
+    """rows as sample_batch.encode_batch takes them -> PiBatch (same columns, nothing packed)."""
+    names = set()
+    for _, values in rows:
+        names.update(values)
+    fields = sorted(names)
+    rows = sorted(rows, key=lambda r: r[0])
+    return PiBatch(fields, [(ts, tuple(values.get(f) for f in fields)) for ts, values in rows],
+                   seq, time.time() if sent_ts is None else sent_ts)
+
+
+def parse_esp_csv(payload_bytes):
+    """co2,humidity,soil[,seq[,ts]] -> EspReading; ValueError if malformed."""
+    parts = payload_bytes.decode("utf-8").strip().split(",")
+    if not 3 <= len(parts) <= 5:
+        raise ValueError(f"expected 3-5 CSV fields, got {len(parts)}")
+    return EspReading(
+        float(parts[0]), float(parts[1]), float(parts[2]),
+        int(parts[3]) if len(parts) > 3 and parts[3].strip() else None,
+        float(parts[4]) if len(parts) > 4 and parts[4].strip() else None,
+    )
+
+
+def decode_message(kind, payload_bytes):
+    """MQTT payload -> bus message of that kind (raises if the payload is malformed)."""
+    if kind == "pi" or kind == "metrics":
+        return json.loads(payload_bytes.decode("utf-8"))
+    if kind == "pi_batch":
+        fields, rows = decode_batch(payload_bytes)
+        return PiBatch(fields, rows, *batch_meta(payload_bytes))
+    if kind == "esp":
+        return parse_esp_csv(payload_bytes)
+    if kind == "camera":
+        data = json.loads(payload_bytes.decode("utf-8"))
+        img_b64 = data.pop("image", None) or data.pop("img", None)
+        if img_b64:
+            data["jpg"] = base64.b64decode(img_b64.strip(), validate=True)
+        return data
+    return payload_bytes
+
+
+def encode_message(kind, message):
+    """Bus message -> MQTT payload bytes (the format the publisher would have sent)."""
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        return message
+    if kind == "pi_batch":
+        rows = [(ts, {f: v for f, v in zip(message.fields, values) if v is not None})
+                for ts, values in message.rows]
+        return encode_batch(rows, fields=message.fields, seq=message.seq or 0, sent_ts=message.sent_ts)
+    if kind == "esp":
+        return ",".join("" if v is None else str(v) for v in message).encode("utf-8")
+    if kind == "camera":
+        data = {k: v for k, v in message.items() if k != "jpg"}
+        if message.get("jpg") is not None:
+            data["image"] = base64.b64encode(message["jpg"]).decode("ascii")
+        message = data
+    return json.dumps(message).encode("utf-8")
+
+
+class EdgeBus:
+    """
+    publish(topic, message) calls handler(topic, message, rx_ts) of every subscription
+    whose MQTT-style pattern (+ / #) matches, on the publisher's thread. Handlers must be
+    quick or hand off to their own queue (subscriber.dispatch does).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = []            # (pattern, handler)
+        self._routes = {}          # topic -> handlers (cache, ล้างเมื่อ subscribe เพิ่ม)
+        self.local_topics = set()  # topic ที่ component ใน process นี้ publish (bridge ไม่รับซ้ำจาก broker)
+        self.published = 0
+        self.errors = 0
+
+    def subscribe(self, pattern, handler):
+        with self._lock:
+            self._subs.append((pattern, handler))
+            self._routes = {}
+
+    def publish(self, topic, message, rx_ts=None, local=True):
+        """local=False: message came in from MQTT (edge_runtime.MqttBridge)."""
+        handlers = self._routes.get(topic)
+        if handlers is None:
+            with self._lock:
+                handlers = tuple(h for p, h in self._subs if topic_matches_sub(p, topic))
+                self._routes[topic] = handlers
+        if local and topic not in self.local_topics:
+            self.local_topics.add(topic)
+        rx_ts = time.time() if rx_ts is None else rx_ts
+        self.published += 1
+        for handler in handlers:
+            try:
+                handler(topic, message, rx_ts)
+            except Exception as e:
+                self.errors += 1
+                print(f"Bus handler error ({topic}):", e)
@@ -0,0 +1,191 @@
+# edge_runtime.py
+# รัน component ของ Pi ใน process เดียว (ทางเลือกแทนการรัน 4 process คุยกันผ่าน mosquitto ในเครื่อง)
+#
+#   sensors     pub_sensor_on_pi.main(bus)              อ่าน sensor -> bus (dict / PiBatch)
+#   camera      publisher_camera  (Flask :5000)         YOLO -> bus (dict + JPEG bytes)
+#   subscriber  subscriber_main_on_pi                   bus -> ingest workers -> Influx / SQLite / relay
+#   dashboard   Dashboard (Flask :5001, role "edge")    bus -> ค่าล่าสุด / ring buffer / SSE
+#
+# component คุยกันผ่าน EdgeBus (edge_bus.py): ส่ง object ตรง ๆ ไม่ serialize และไม่ผ่าน broker
+# Python interpreter / Influx client / library ชุดเดียว แต่ละ component ยังเป็นโมดูลเดิมที่รันแยกได้
+#
+# MQTT ใช้เฉพาะกับ node ภายนอก (ESP32, Pi ตัวอื่น, ESP32-CAM): MqttBridge subscribe topic เดิมทั้งหมด
+# decode ครั้งเดียวแล้วส่งเข้า bus ให้ทุกตัวรับ topic ที่ component ในเครื่องส่งเองถูกข้าม (ไม่รับซ้ำ)
+# --mqtt-out ส่ง message ของเครื่องนี้ออก broker ด้วย (Dashboard / archive บนเครื่องอื่น)
+# anomaly event ของ subscriber ออก MQTT ผ่าน bridge เหมือนเดิม
+#
+#   python edge_runtime.py                                        # ครบ 4 ตัว
+#   python edge_runtime.py --components sensors,subscriber,dashboard --quiet
+#   python edge_runtime.py --archive --no-rollups                 # option อื่นส่งต่อให้ subscriber
+import argparse
+import os
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from edge_bus import EdgeBus, decode_message, encode_message
+from latency import start_metrics_publisher
+from node_topics import MQTT_TOPIC_METRICS, SUBSCRIBE_TOPICS, metrics_topic, parse_topic
+from profiling import Profiler
+
+MQTT_BROKER  = os.environ.get("MQTT_BROKER", "localhost")
+MQTT_PORT    = int(os.environ.get("MQTT_PORT", 1883))
+MQTT_OUT_QOS = 1
+
+COMPONENTS     = ("sensors", "camera", "subscriber", "dashboard")
+CAMERA_PORT    = 5000
+DASHBOARD_PORT = 5001
+METRICS_PERIOD = 10.0
+
+
+class MqttBridge:
+    """Messages from external nodes onto the bus (decoded once); optionally local messages out."""
+
+    def __init__(self, bus, broker, port, topics, publish_local=False):
+        self.bus = bus
+        self.topics = topics
+        self.received = 0
+        self.echoes = 0
+        self.errors = 0
+        self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        # connect_async: component ในเครื่องทำงานต่อได้แม้ broker ยังไม่ขึ้น (paho ต่อใหม่ให้เอง)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.connect_async(broker, port, 60)
+        if publish_local:
+            bus.subscribe("#", self._forward)
+
+    def start(self):
+        self.client.loop_start()
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print("MQTT bridge connect failed:", rc)
+            return
+        print("MQTT bridge connected")
+        for topic in self.topics:
+            client.subscribe(topic)
+
+    def _on_message(self, client, userdata, msg):
+        rx_ts = time.time()
+        if msg.topic in self.bus.local_topics:
+            self.echoes += 1    # ของเครื่องนี้เอง (--mqtt-out) หรือ node_id ซ้ำกับ component ในเครื่อง
+            return
+        kind, _ = parse_topic(msg.topic)
+        if kind is None:
+            return
+        try:
+            message = decode_message(kind, msg.payload)
+        except Exception as e:
+            self.errors += 1
+            print(f"MQTT bridge decode error ({msg.topic}):", e)
+            return
+        self.received += 1
+        self.bus.publish(msg.topic, message, rx_ts, local=False)
+
+    def _forward(self, topic, message, rx_ts):
+        if topic not in self.bus.local_topics:
+            return              # มาจาก broker อยู่แล้ว
+        kind, _ = parse_topic(topic)
+        self.client.publish(topic, encode_message(kind, message), qos=MQTT_OUT_QOS)
+
+
+def serve(app, port, name):
+    """Flask development server on a daemon thread (same server the standalone scripts use)."""
+    threading.Thread(target=app.run, name=name, daemon=True,
+                     kwargs={"host": "0.0.0.0", "port": port, "threaded": True, "use_reloader": False}).start()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the Pi components in one process around an in-process bus",
+        epilog="Other options go to the subscriber (python subscriber_main_on_pi.py --help).")
+    parser.add_argument("--components", default=",".join(COMPONENTS),
+                        help=f"comma-separated subset of {','.join(COMPONENTS)} (default: all)")
+    parser.add_argument("--mqtt-out", action="store_true",
+                        help="also publish this Pi's sensor / camera / metrics messages to the broker")
+    parser.add_argument("--no-bridge", action="store_true",
+                        help="no MQTT at all: only the components in this process")
+    return parser.parse_known_args(argv)
+
+
+def start(argv=None):
+    """Start the selected components and the bridge. Returns (bus, bridge or None, subscriber module or None)."""
+    args, rest = parse_args(argv)
+    components = [c.strip() for c in args.components.split(",") if c.strip()]
+    unknown = sorted(set(components) - set(COMPONENTS))
+    if unknown:
+        raise SystemExit(f"unknown component(s): {', '.join(unknown)}")
+    if rest and "subscriber" not in components:
+        raise SystemExit(f"unrecognized arguments: {' '.join(rest)}")
+
+    bus = EdgeBus()
+    bridge = None
+    if not args.no_bridge:
+        bridge = MqttBridge(bus, MQTT_BROKER, MQTT_PORT, SUBSCRIBE_TOPICS + (MQTT_TOPIC_METRICS,), args.mqtt_out)
+
+    # ตัวรับลงทะเบียนก่อนตัวส่งเริ่ม: message แรกไม่หาย
+    sub = None
+    if "subscriber" in components:
+        import subscriber_main_on_pi as sub
+        sub_args = sub.parse_args(rest)
+        if sub_args.share_group:
+            raise SystemExit("--share-group needs separate subscriber processes")
+        if bridge is not None:
+            sub.mqtt_client = bridge.client      # anomaly event
+        sub.start_pipeline(sub_args)
+        for topic in SUBSCRIBE_TOPICS:
+            bus.subscribe(topic, sub.dispatch)
+        start_metrics_publisher(bus.publish, metrics_topic(sub.recorder.proc), sub.recorder,
+                                METRICS_PERIOD, serialize=False)
+
+    if "dashboard" in components:
+        os.environ["DASHBOARD_ROLE"] = "edge"    # Dashboard อ่านตอน import: ไม่ต่อ MQTT เอง
+        import Dashboard as dash
+        for topic in SUBSCRIBE_TOPICS + (MQTT_TOPIC_METRICS,):
+            bus.subscribe(topic, dash.handle_message)
+        serve(dash.app, DASHBOARD_PORT, "dashboard")
+
+    if "camera" in components:
+        import publisher_camera as cam
+        cam.publish_frame = lambda payload, jpg: bus.publish(cam.MQTT_TOPIC, {**payload, "jpg": jpg})
+        start_metrics_publisher(bus.publish, metrics_topic(cam.METRICS_PROC), cam.recorder,
+                                METRICS_PERIOD, serialize=False)
+        serve(cam.app, CAMERA_PORT, "camera")
+
+    if "sensors" in components:
+        import pub_sensor_on_pi as pi
+        threading.Thread(target=pi.main, args=(bus,), name="sensors", daemon=True).start()
+
+    if bridge is not None:
+        bridge.start()
+    print(f"Edge runtime: {', '.join(components)}"
+          + ("" if bridge is None else f" | MQTT bridge {MQTT_BROKER}:{MQTT_PORT}"
+             + (" (in + out)" if args.mqtt_out else " (external nodes in)")))
+    return bus, bridge, sub
+
+
+def main(argv=None):
+    # kill -USR1 / -USR2 <pid> ครอบคลุมทุก component (process เดียวกันทั้งหมด)
+    Profiler("edge").install_signals()
+    bus, bridge, sub = start(argv)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if bridge is not None:
+            bridge.stop()
+        if sub is not None:
+            sub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+# export.py
+# ส่งออกข้อมูลย้อนหลังเป็นไฟล์ Parquet / Arrow IPC (ใช้ train โมเดลพริก / วิเคราะห์ offline)
+#
+#   sensors  Influx (raw / fused / rollup / ds18b20) 1 row ต่อ เวลา × tag, 1 คอลัมน์ต่อ field
+#   images   metadata ของภาพใน camera_frames.db (ตาราง images) ไม่รวมตัวรูปเว้นแต่ขอคอลัมน์ jpg
+#
+# memory คงที่ไม่ขึ้นกับความยาวช่วงเวลา:
+#   - query Influx ทีละช่วง (chunk_s ของ measurement) อ่านผลแบบ stream (query_stream)
+#   - SQLite อ่านแบบ keyset (created_at, id) ทีละ batch
+#   - เขียนเป็น record batch ละไม่เกิน EXPORT_BATCH_ROWS row (1 batch = 1 row group ของ Parquet)
+#   ระหว่าง chunk หยุด EXPORT_CHUNK_PAUSE_S ให้ Influx บน Pi รับข้อมูลใหม่ได้ตามปกติ
+#
+# CLI (ต้องมี pyarrow):
+#   python export.py sensors --start 30d --out exports/sensors --partition day --columns time,node,temperature,co2
+#   python export.py images --start 2026-10-01 --end 2026-10-08 --out images.arrow --format arrow
+#   --partition none = ไฟล์เดียว (--out เป็นชื่อไฟล์), hour/day/month = โฟลเดอร์แบบ Hive
+#   (<out>/date=2026-10-19/part-0.parquet) เปิดด้วย pyarrow.dataset / pandas / DuckDB ได้ตรง ๆ
+# Dashboard: /api/export?source=sensors&start=7d&format=parquet (ไฟล์เดียว stream กลับทันที)
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+EXPORT_FORMATS        = ("parquet", "arrow")
+EXPORT_BATCH_ROWS     = 50_000
+EXPORT_JPG_BATCH_ROWS = 64           # ขอคอลัมน์ jpg -> batch เล็กลง (~100 KB ต่อรูป)
+EXPORT_CHUNK_PAUSE_S  = 0.05
+PARQUET_COMPRESSION   = "zstd"
+
+# ชื่อ -> (measurement, tag columns, ช่วงเวลาต่อ query)
+EXPORT_MEASUREMENTS = {
+    "raw":    ("mqtt_data", ("location", "node"), 3600),
+    "fused":  ("mqtt_fused", ("location",), 6 * 3600),
+    "1m":     ("mqtt_data_1m", ("location", "node"), 86400),
+    "1h":     ("mqtt_data_1h", ("location", "node"), 30 * 86400),
+    "probes": ("ds18b20", ("location", "node", "probe"), 3600),
+}
+SENSOR_FIELDS = ("temperature", "humidity", "co2", "light", "soil")
+DEFAULT_FIELDS = {
+    "raw": SENSOR_FIELDS,
+    "fused": SENSOR_FIELDS + ("chili_count", "max_age_s", "stale"),
+    "1m": tuple(f + s for f in SENSOR_FIELDS for s in ("", "_min", "_max", "_count")),
+    "1h": tuple(f + s for f in SENSOR_FIELDS for s in ("", "_min", "_max", "_count")),
+    "probes": ("temperature",),
+}
+STRING_FIELDS = ("stale",)
+
+# คอลัมน์ -> SQL ใน images (id, created_at มีเสมอ: ใช้แบ่งหน้า / partition)
+IMAGE_COLUMNS = {
+    "id": "id", "created_at": "created_at", "width": "width", "height": "height",
+    "fps": "fps", "chili_count": "chili_count", "bytes": "length(jpg)", "jpg": "jpg",
+}
+IMAGE_DEFAULT_COLUMNS = ("id", "created_at", "width", "height", "fps", "chili_count", "bytes")
+
+# partition -> (ชื่อโฟลเดอร์, strftime)
+EXPORT_PARTITIONS = {
+    "none": None,
+    "hour": ("hour", "%Y-%m-%dT%H"),
+    "day": ("date", "%Y-%m-%d"),
+    "month": ("month", "%Y-%m"),
+}
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_]+$")
+_AGO_RE = re.compile(r"^-?(\d+)([smhdw])$")
+_AGO_UNIT_S = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def load_pyarrow():
+    """pyarrow is only needed for export; ImportError tells the caller to install it."""
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+    import pyarrow.compute
+    return pyarrow
+
+
+def parse_time(text, now=None):
+    """'7d' / '-6h' (ago) or ISO-8601 (no zone = UTC) -> aware UTC datetime."""
+    now = datetime.now(timezone.utc) if now is None else now
+    text = text.strip()
+    m = _AGO_RE.match(text)
+    if m:
+        return now - timedelta(seconds=int(m.group(1)) * _AGO_UNIT_S[m.group(2)])
+    dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def split_columns(measurement, columns):
+    """columns=None -> defaults. Returns (tags, fields) to export for `measurement`."""
+    if measurement not in EXPORT_MEASUREMENTS:
+        raise ValueError(f"unknown measurement: {measurement}")
+    _, tags, _ = EXPORT_MEASUREMENTS[measurement]
+    if columns is None:
+        return list(tags), list(DEFAULT_FIELDS[measurement])
+    bad = [c for c in columns if not _NAME_RE.match(c)]
+    if bad:
+        raise ValueError(f"invalid column: {bad[0]!r}")
+    fields = [c for c in columns if c not in tags and c != "time"]
+    if not fields:
+        raise ValueError("no field columns selected")
+    return [t for t in tags if t in columns], fields
+
+
+def image_columns(columns):
+    if columns is None:
+        return list(IMAGE_DEFAULT_COLUMNS)
+    unknown = [c for c in columns if c not in IMAGE_COLUMNS]
+    if unknown:
+        raise ValueError(f"unknown image column: {unknown[0]}")
+    return ["id", "created_at"] + [c for c in columns if c not in ("id", "created_at")]
+
+
+# ---------------- sources ----------------
+def sensor_schema(pa, tags, fields):
+    types = [("time", pa.timestamp("us", tz="UTC"))]
+    types += [(t, pa.string()) for t in tags]
+    for f in fields:
+        if f in STRING_FIELDS:
+            types.append((f, pa.string()))
+        elif f.endswith("_count"):
+            types.append((f, pa.int64()))
+        else:
+            types.append((f, pa.float64()))
+    return pa.schema(types)
+
+
+def build_sensor_query(bucket, measurement, tags, fields, start, stop):
+    field_filter = " or ".join(f'r._field == "{f}"' for f in fields)
+    keep = ", ".join(f'"{c}"' for c in ["_time", *tags, *fields])
+    start_ns = int(start.timestamp() * 1e6) * 1000
+    stop_ns = int(stop.timestamp() * 1e6) * 1000
+    return f'''
+    from(bucket: "{bucket}")
+      |> range(start: time(v: {start_ns}), stop: time(v: {stop_ns}))
+      |> filter(fn: (r) => r._measurement == "{measurement}")
+      |> filter(fn: (r) => {field_filter})
+      |> pivot(rowKey:["_time"], columnKey:["_field"], valueColumn:"_value")
+      |> group()
+      |> keep(columns: [{keep}])
+      |> sort(columns: ["_time"])
+    '''
+
+
+def sensor_export(query_api, org, bucket, start, end, measurement="raw", columns=None,
+                  batch_rows=EXPORT_BATCH_ROWS, pause_s=EXPORT_CHUNK_PAUSE_S):
+    """
+    (schema, batches): pyarrow RecordBatches of [start, end) from Influx in time order,
+    one chunk query at a time. Columns are checked here, before anything is queried.
+    """
+    pa = load_pyarrow()
+    tags, fields = split_columns(measurement, columns)
+    name, _, chunk_s = EXPORT_MEASUREMENTS[measurement]
+    schema = sensor_schema(pa, tags, fields)
+    names = schema.names[1:]
+
+    def batch(rows):
+        cols = [pa.array([r[i] for r in rows], type=schema.field(i).type) for i in range(len(schema))]
+        return pa.RecordBatch.from_arrays(cols, schema=schema)
+
+    def batches():
+        rows = []
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_start + timedelta(seconds=chunk_s), end)
+            query = build_sensor_query(bucket, name, tags, fields, chunk_start, chunk_end)
+            for record in query_api.query_stream(org=org, query=query):
+                values = record.values
+                rows.append((record.get_time(), *(values.get(c) for c in names)))
+                if len(rows) >= batch_rows:
+                    yield batch(rows)
+                    rows = []
+            chunk_start = chunk_end
+            if pause_s and chunk_start < end:
+                time.sleep(pause_s)
+        if rows:
+            yield batch(rows)
+
+    return schema, batches()
+
+
+def image_schema(pa, columns):
+    types = {
+        "id": pa.int64(), "created_at": pa.timestamp("us", tz="UTC"), "width": pa.int32(),
+        "height": pa.int32(), "fps": pa.float64(), "chili_count": pa.int32(),
+        "bytes": pa.int64(), "jpg": pa.binary(),
+    }
+    return pa.schema([(c, types[c]) for c in columns])
+
+
+def image_export(db_path, start, end, columns=None, batch_rows=None):
+    """(schema, batches): the images table in [start, end) ordered by (created_at, id), read-only."""
+    pa = load_pyarrow()
+    columns = image_columns(columns)
+    schema = image_schema(pa, columns)
+    if batch_rows is None:
+        batch_rows = EXPORT_JPG_BATCH_ROWS if "jpg" in columns else EXPORT_BATCH_ROWS
+    select = ", ".join(IMAGE_COLUMNS[c] for c in columns)
+    sql = (f"SELECT {select} FROM images WHERE created_at >= ? AND created_at < ? "
+           "AND (created_at, id) > (?, ?) ORDER BY created_at, id LIMIT ?")
+    lo = start.isoformat(timespec="seconds")
+    hi = end.isoformat(timespec="seconds")
+
+    def batches():
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=5)
+        try:
+            after = ("", 0)
+            while True:
+                # query ใหม่ทุก batch -> ไม่ค้าง read transaction ไว้ระหว่าง yield (WAL checkpoint ของ subscriber ไม่ติด)
+                rows = conn.execute(sql, (lo, hi, *after, batch_rows)).fetchall()
+                if not rows:
+                    break
+                after = (rows[-1][1], rows[-1][0])
+                cols = list(zip(*rows))
+                cols[1] = [datetime.fromisoformat(t) for t in cols[1]]
+                yield pa.RecordBatch.from_arrays(
+                    [pa.array(c, type=schema.field(i).type) for i, c in enumerate(cols)], schema=schema)
+                if len(rows) < batch_rows:
+                    break
+        finally:
+            conn.close()
+
+    return schema, batches()
+
+
+# ---------------- writers ----------------
+class ExportWriter:
+    """One Parquet file or Arrow IPC stream; sink = path or binary file object."""
+
+    def __init__(self, sink, schema, fmt="parquet"):
+        pa = load_pyarrow()
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"unknown format: {fmt}")
+        if fmt == "parquet":
+            self._writer = pa.parquet.ParquetWriter(sink, schema, compression=PARQUET_COMPRESSION)
+        else:
+            self._writer = pa.ipc.new_stream(sink, schema)
+        self.fmt = fmt
+        self.rows = 0
+
+    def write(self, batch):
+        if batch.num_rows:
+            if self.fmt == "parquet":
+                self._writer.write_batch(batch, row_group_size=batch.num_rows)
+            else:
+                self._writer.write_batch(batch)
+            self.rows += batch.num_rows
+
+    def close(self):
+        self._writer.close()
+
+
+class ByteSink:
+    """Binary file object for the writers; drain() returns what was written since the last drain."""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def iter_export_bytes(batches, schema, fmt="parquet"):
+    """Encode batches into one file and yield its bytes as they are produced (HTTP streaming)."""
+    sink = ByteSink()
+    writer = ExportWriter(sink, schema, fmt)
+    for batch in batches:
+        writer.write(batch)
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+def write_partitioned(batches, schema, out_dir, time_column, partition="day", fmt="parquet"):
+    """
+    Write batches (time order) under out_dir/<key>=<value>/part-N.<ext>, one file open at a time.
+    Returns {path: rows}.
+    """
+    pa = load_pyarrow()
+    key_name, key_format = EXPORT_PARTITIONS[partition]
+    ext = "parquet" if fmt == "parquet" else "arrow"
+    written = {}
+    current_key, writer, path = None, None, None
+    try:
+        for batch in batches:
+            keys = pa.compute.strftime(batch.column(time_column), format=key_format)
+            for key in pa.compute.unique(keys).to_pylist():
+                part = batch.filter(pa.compute.equal(keys, key))
+                if key != current_key:
+                    if writer is not None:
+                        writer.close()
+                        written[path] = writer.rows
+                    folder = os.path.join(out_dir, f"{key_name}={key}")
+                    os.makedirs(folder, exist_ok=True)
+                    n = 0
+                    while os.path.exists(os.path.join(folder, f"part-{n}.{ext}")):
+                        n += 1
+                    path = os.path.join(folder, f"part-{n}.{ext}")
+                    writer = ExportWriter(path, schema, fmt)
+                    current_key = key
+                writer.write(part)
+    finally:
+        if writer is not None:
+            writer.close()
+            written[path] = writer.rows
+    return written
+
+
+def write_file(batches, schema, path, fmt="parquet"):
+    """Write every batch to one file, return {path: rows}."""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    writer = ExportWriter(path, schema, fmt)
+    try:
+        for batch in batches:
+            writer.write(batch)
+    finally:
+        writer.close()
+    return {path: writer.rows}
+
+
+# ---------------- CLI ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export sensor history / camera metadata to Parquet or Arrow")
+    parser.add_argument("source", choices=("sensors", "images"))
+    parser.add_argument("--start", required=True, help="ISO-8601 (UTC if no zone) or age like 30d")
+    parser.add_argument("--end", default=None, help="ISO-8601 or age (default: now)")
+    parser.add_argument("--out", required=True, help="file (--partition none) or directory")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="parquet")
+    parser.add_argument("--partition", choices=tuple(EXPORT_PARTITIONS), default="none")
+    parser.add_argument("--columns", default=None, help="comma-separated columns (default: all but jpg)")
+    parser.add_argument("--measurement", choices=tuple(EXPORT_MEASUREMENTS), default="raw",
+                        help="sensors: raw mqtt_data, fused records, 1m / 1h rollups or ds18b20 probes")
+    parser.add_argument("--influx-url", default=os.environ.get("INFLUX_URL", "http://localhost:8086"))
+    parser.add_argument("--influx-token", default=os.environ.get("INFLUX_TOKEN", ""))
+    parser.add_argument("--influx-org", default="Student")
+    parser.add_argument("--influx-bucket", default="iot_data")
+    parser.add_argument("--db", default="camera_frames.db", help="camera SQLite database")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        load_pyarrow()
+    except ImportError:
+        sys.exit("export needs pyarrow: pip install pyarrow")
+    start = parse_time(args.start)
+    end = parse_time(args.end) if args.end else datetime.now(timezone.utc)
+    columns = [c for c in args.columns.split(",") if c] if args.columns else None
+
+    client = None
+    if args.source == "sensors":
+        from influxdb_client import InfluxDBClient
+
+        client = InfluxDBClient(url=args.influx_url, token=args.influx_token, org=args.influx_org, timeout=300_000)
+        schema, batches = sensor_export(client.query_api(), args.influx_org, args.influx_bucket,
+                                        start, end, args.measurement, columns)
+        time_column = "time"
+    else:
+        schema, batches = image_export(args.db, start, end, columns)
+        time_column = "created_at"
+
+    started = time.time()
+    try:
+        if args.partition == "none":
+            written = write_file(batches, schema, args.out, args.format)
+        else:
+            written = write_partitioned(batches, schema, args.out, time_column, args.partition, args.format)
+    finally:
+        if client is not None:
+            client.close()
+    for path, rows in written.items():
+        print(f"{path}: {rows} rows")
+    print(f"Exported {sum(written.values())} rows to {len(written)} file(s) in {time.time() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
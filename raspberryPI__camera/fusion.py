@@ -0,0 +1,132 @@
+# fusion.py
+# as-of join ของหลาย stream (Pi / ESP32 / กล้อง) ในโซนเดียวกัน -> fused record 1 อันต่อเวลา
+#
+# ที่เวลา T แต่ละ field ใช้ sample ล่าสุดที่ ts <= T (as-of) ของทุก source ในโซน:
+#   อายุ T - ts <= tolerance_s  -> fresh ใช้ค่าได้ (หลาย source = หลายค่า, record.values() ใช้ค่าเฉลี่ย)
+#   เก่ากว่านั้น                 -> stale ไม่ใช้ค่า แต่บอกไว้ใน record.stale (field -> อายุ s)
+# ผู้ส่งใช้ report-by-exception (deadband) -> ไม่มี sample ใหม่ = ค่าเดิม
+# tolerance ต้องมากกว่า heartbeat (max silence) ของผู้ส่ง ไม่งั้นค่าที่นิ่งจะกลายเป็น stale
+#
+# flush() ออก record ทุก interval_s (T = ขอบ interval) หลัง T + grace_s (รอ sample ที่มาช้าเล็กน้อย)
+# sample ที่มาหลัง record ของเวลานั้นออกไปแล้วไม่ถูกนับย้อนหลัง (นับใน late)
+# history=False: เก็บแค่ sample ล่าสุดต่อ source × field (ไม่มีใคร flush, ใช้แค่ asof() ของ relay)
+import bisect
+import math
+import threading
+import time
+
+
+class FusedRecord:
+    """
+    inputs = {field: [(source, value, ts), ...]} fresh samples only,
+    stale  = {field: age_s} for fields whose newest sample is older than the tolerance.
+    """
+    __slots__ = ("zone", "ts", "inputs", "stale")
+
+    def __init__(self, zone, ts):
+        self.zone = zone
+        self.ts = ts
+        self.inputs = {}
+        self.stale = {}
+
+    def values(self):
+        """{field: mean of the fresh inputs}"""
+        return {f: sum(v for _, v, _ in ins) / len(ins) for f, ins in self.inputs.items()}
+
+    def max_age(self):
+        """Age (s) of the oldest fresh input."""
+        return max((self.ts - t for ins in self.inputs.values() for _, _, t in ins), default=0.0)
+
+
+class FusionJoiner:
+    """
+    emit(record) is called from flush() once per zone every interval_s.
+    asof(zone) gives the record as of now (relay decisions).
+    """
+
+    def __init__(self, interval_s, tolerance_s, emit, grace_s=5.0, max_samples=4096):
+        self.interval_s = interval_s
+        self.tolerance_s = tolerance_s
+        self.emit = emit
+        self.grace_s = grace_s
+        self.max_samples = max_samples # ต่อ source × field; ปกติ flush() ตัดตามเวลา, นี่กันโตถ้าไม่มีใคร flush
+        self.history = True
+        self._series = {}              # zone -> {(source, field): [(ts, value), ...] เรียงตาม ts}
+        self._next_tick = {}           # zone -> T ถัดไปที่ยังไม่ได้ emit
+        self._lock = threading.Lock()
+        self.late = 0
+
+    def add(self, zone, source, values, ts):
+        """values: {field: float or None}; ts = sample time (epoch s)."""
+        with self._lock:
+            series = self._series.setdefault(zone, {})
+            if zone not in self._next_tick:
+                self._next_tick[zone] = (ts // self.interval_s + 1) * self.interval_s
+            elif ts <= self._next_tick[zone] - self.interval_s:
+                self.late += 1
+            for field, value in values.items():
+                if value is None:
+                    continue
+                samples = series.get((source, field))
+                if samples is None:
+                    samples = series[(source, field)] = []
+                if not samples or ts >= samples[-1][0]:
+                    samples.append((ts, float(value)))
+                else:
+                    bisect.insort(samples, (ts, float(value)))
+                if not self.history:
+                    del samples[:-1]
+                elif len(samples) > self.max_samples:
+                    del samples[0]
+
+    def _asof(self, zone, at, now=None, fields=None):
+        """at=None: newest sample of each series, age measured from `now` (clock skew -> age 0)."""
+        record = FusedRecord(zone, at if at is not None else now)
+        for (source, field), samples in self._series.get(zone, {}).items():
+            if fields is not None and field not in fields:
+                continue
+            if at is None:
+                ts, value = samples[-1]
+            else:
+                i = bisect.bisect_right(samples, (at, math.inf))
+                if i == 0:
+                    continue
+                ts, value = samples[i - 1]
+            age = max(0.0, record.ts - ts)
+            if age <= self.tolerance_s:
+                record.inputs.setdefault(field, []).append((source, value, ts))
+            elif age < record.stale.get(field, math.inf):
+                record.stale[field] = age
+        for field in record.inputs:
+            record.stale.pop(field, None)   # source อื่นยังสด
+        return record
+
+    def asof(self, zone, at=None, fields=None):
+        """Fused record of `zone` at time `at` (None = latest samples, ages from now), optionally only `fields`."""
+        with self._lock:
+            return self._asof(zone, at, time.time(), fields)
+
+    def flush(self, now=None, force=False):
+        """Emit the records whose time has passed by grace_s; force=True emits up to now (shutdown)."""
+        now = time.time() if now is None else now
+        until = now if force else now - self.grace_s
+        ready = []
+        with self._lock:
+            for zone, series in self._series.items():
+                tick = self._next_tick[zone]
+                while tick <= until:
+                    record = self._asof(zone, tick)
+                    if record.inputs:
+                        ready.append(record)
+                    tick += self.interval_s
+                self._next_tick[zone] = tick
+
+                # ไม่ต้องใช้ sample ที่เก่ากว่า tolerance ของ T ถัดไป (เก็บตัวล่าสุดไว้บอก stale)
+                cutoff = tick - self.interval_s - self.tolerance_s
+                for samples in series.values():
+                    i = bisect.bisect_left(samples, (cutoff, -math.inf))
+                    if i > 1:
+                        del samples[:i - 1]
+        for record in ready:
+            self.emit(record)
+        return len(ready)
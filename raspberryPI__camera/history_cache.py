@@ -0,0 +1,149 @@
+# history_cache.py
+# Cache ของ /api/history (Dashboard.py)
+#
+# key = (range_s, resolution, fields) -> query Influx เต็มช่วงครั้งเดียว (prime)
+# หลังจากนั้นดึงเฉพาะส่วนใหม่ต่อท้าย (delta) ไม่ถี่กว่า min_refresh_s และตัดข้อมูลที่เก่ากว่าช่วงทิ้ง
+# request พร้อมกันหลายตัวของ key เดียวกันรอ refresh รอบเดียว (single-flight)
+# -> จำนวน query ไป Influx ขึ้นกับจำนวน key ไม่ใช่จำนวนคนเปิดหน้าเว็บ × จำนวนครั้งที่กด Refresh
+#
+# เก็บข้อมูลหลัง aggregateWindow (ก่อน LTTB) แล้วทำ LTTB ตอนอ่าน (จำผลไว้จนกว่าข้อมูลจะเปลี่ยน)
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from downsample import lttb_indices
+
+# ประมาณขนาดต่อ cell (float object + slot ใน list) ใช้คุม max_bytes
+CELL_BYTES = 40
+
+
+class HistoryEntry:
+    __slots__ = ("range_s", "fields", "points", "window_s", "times", "columns",
+                 "primed_at", "refreshed_at", "used_at", "version", "view", "lock")
+
+    def __init__(self, range_s, fields, points, window_s):
+        self.range_s = range_s
+        self.fields = fields
+        self.points = points
+        self.window_s = window_s
+        self.times = None          # epoch ms (เรียงจากเก่าไปใหม่)
+        self.columns = None        # {field: [values]}
+        self.primed_at = 0.0
+        self.refreshed_at = 0.0
+        self.used_at = 0.0
+        self.version = 0
+        self.view = None           # (version, times, columns) หลัง LTTB
+        self.lock = threading.Lock()
+
+    def approx_bytes(self):
+        if self.times is None:
+            return 0
+        return len(self.times) * (len(self.fields) + 1) * CELL_BYTES
+
+    def cut_for(self, ts_ms):
+        """Rows after the returned time may change on the next refresh (partial window)."""
+        if not self.window_s:
+            return ts_ms
+        w = self.window_s * 1000
+        return ts_ms // w * w
+
+
+class HistoryCache:
+    """
+    fetch(range_s, fields, window_s, start_ms) -> (times_ms, {field: values})
+    start_ms=None means the whole range.
+    """
+
+    def __init__(self, fetch, min_refresh_s=5.0, reprime_s=300.0, max_idle_s=600.0, max_bytes=32 * 1024 * 1024):
+        self.fetch = fetch
+        self.min_refresh_s = min_refresh_s
+        self.reprime_s = reprime_s      # prime ใหม่เป็นระยะ เผื่อข้อมูลย้อนหลังมาช้า (spool ของ Pi)
+        self.max_idle_s = max_idle_s
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.queries = 0
+
+    def get(self, range_s, fields, points, window_s, since=None):
+        """
+        Returns (times, columns, delta_from, refreshed).
+        since=None: the whole range downsampled to `points` rows.
+        since=<ms>: only rows after delta_from; the client drops its own rows after delta_from first.
+        """
+        key = (range_s, tuple(fields), points)
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now, keep=key)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = HistoryEntry(range_s, tuple(fields), points, window_s)
+            entry.used_at = now
+
+        refreshed = False
+        with entry.lock:
+            if entry.times is None or now - entry.refreshed_at >= self.min_refresh_s:
+                self._refresh(entry, now)
+                refreshed = True
+            times, columns = entry.times, entry.columns
+
+            if since is not None:
+                cut = entry.cut_for(since)
+                i = bisect_right(times, cut)
+                return times[i:], {f: col[i:] for f, col in columns.items()}, cut, refreshed
+
+            if entry.view is None or entry.view[0] != entry.version:
+                if len(times) > points:
+                    keep = lttb_indices(times, list(columns.values()), points)
+                    view_t = [times[i] for i in keep]
+                    view_c = {f: [col[i] for i in keep] for f, col in columns.items()}
+                else:
+                    view_t, view_c = times, columns
+                entry.view = (entry.version, view_t, view_c)
+            return entry.view[1], entry.view[2], None, refreshed
+
+    def _refresh(self, entry, now):
+        now_ms = int(time.time() * 1000)
+        try:
+            if entry.times is None or now - entry.primed_at >= self.reprime_s:
+                self.queries += 1
+                times, columns = self.fetch(entry.range_s, entry.fields, entry.window_s, None)
+                entry.primed_at = now
+            else:
+                last = entry.times[-1] if entry.times else now_ms - entry.range_s * 1000
+                cut = entry.cut_for(last)
+                # window สุดท้ายอาจยังไม่ครบ -> ทิ้งแล้วดึงใหม่ตั้งแต่ต้น window
+                start = cut if entry.window_s else cut + 1
+                self.queries += 1
+                new_t, new_c = self.fetch(entry.range_s, entry.fields, entry.window_s, start)
+                keep = bisect_right(entry.times, cut)
+                times = entry.times[:keep] + new_t
+                columns = {f: entry.columns[f][:keep] + new_c[f] for f in entry.fields}
+        except Exception as e:
+            entry.refreshed_at = now   # Influx ล่ม: ไม่ยิงซ้ำทุก request
+            if entry.times is None:
+                raise
+            print(f"⚠️ History refresh failed, serving cached data: {e}")
+            return
+
+        lo = bisect_left(times, now_ms - entry.range_s * 1000)
+        if lo:
+            times = times[lo:]
+            columns = {f: col[lo:] for f, col in columns.items()}
+        # แทนที่ทั้งก้อน reader ที่ถือ reference เดิมอยู่ไม่กระทบ
+        entry.times, entry.columns = times, columns
+        entry.refreshed_at = now
+        entry.version += 1
+
+    def _evict(self, now, keep=None):
+        for key in [k for k, e in self._entries.items() if now - e.used_at > self.max_idle_s and k != keep]:
+            del self._entries[key]
+        total = sum(e.approx_bytes() for e in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        for key, e in sorted(self._entries.items(), key=lambda kv: kv[1].used_at):
+            if key == keep:
+                continue
+            total -= e.approx_bytes()
+            del self._entries[key]
+            if total <= self.max_bytes:
+                break
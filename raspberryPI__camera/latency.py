@@ -0,0 +1,264 @@
+# latency.py
+# วัดเวลาแต่ละช่วง (hop) ของ pipeline และนับ message ที่หายจาก seq ที่กระโดด
+#
+# payload ทุกชนิดมี (ไม่มีก็ได้ ผู้รับใช้เวลาที่รับแทน):
+#   seq      ตัวนับต่อ publisher เริ่ม 0 ทุกครั้งที่ process เริ่ม
+#   ts       เวลาที่อ่าน sensor / ถ่ายภาพ (epoch s)   Pi JSON ใช้ <field>_ts ต่อ field
+#   sent_ts  เวลาที่ publisher ส่ง (epoch s)
+#
+# hop (ms) ที่แต่ละ process บันทึก:
+#   inference   ถ่ายภาพ -> YOLO เสร็จ (กล้อง)
+#   publish     อ่าน sensor -> ส่ง (publisher: รอรอบ publish, YOLO, spool)
+#   broker      sent_ts -> รับ (network + mosquitto) ต่างเครื่องต้อง sync นาฬิกา (NTP)
+#   queue       รับ -> worker เริ่มทำ (subscriber)
+#   decode      รับ -> decode เสร็จ
+#   storage     ส่งให้ write_api -> Influx ตอบสำเร็จ / SQLite commit
+#   push        รับ -> ส่ง SSE event ออกไป (Dashboard)
+#   end_to_end  อ่าน sensor -> storage / push
+# ค่าติดลบ (นาฬิกาต่างเครื่องไม่ตรงกัน) นับเป็น 0 และนับใน "negative"
+import bisect
+import json
+import threading
+import time
+
+# ขอบบนของแต่ละ bucket (ms) ช่องสุดท้าย = เกิน 1 ชม. (เช่นของค้างใน spool)
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+              10_000, 30_000, 60_000, 300_000, 3_600_000)
+
+SEQ_REORDER_WINDOW = 64   # seq ย้อนหลังไม่เกินนี้ = ซ้ำ/สลับลำดับ, มากกว่านี้ = publisher เริ่มใหม่
+
+
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "total", "max", "negative")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.negative = 0
+
+    def observe(self, ms):
+        if ms < 0:
+            self.negative += 1
+            ms = 0.0
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (capped at the max seen)."""
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                value = min(BUCKETS_MS[i], self.max) if i < len(BUCKETS_MS) else self.max
+                return round(value, 3)
+        return round(self.max, 3)
+
+    def snapshot(self):
+        if not self.count:
+            return {"count": 0}
+        buckets = {str(b): n for b, n in zip(BUCKETS_MS, self.counts) if n}
+        if self.counts[-1]:
+            buckets["+Inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3),
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max, 3),
+            "negative": self.negative,
+            "buckets": buckets,
+        }
+
+
+class SequenceTracker:
+    """Gaps, duplicates and restarts in the seq numbers of one publisher."""
+    __slots__ = ("last", "received", "lost", "duplicates", "restarts")
+
+    def __init__(self):
+        self.last = None
+        self.received = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.restarts = 0
+
+    def add(self, seq):
+        self.received += 1
+        if self.last is None:
+            self.last = seq
+            return
+        expected = self.last + 1
+        if seq >= expected:
+            self.lost += seq - expected
+            self.last = seq
+        elif seq == 0 or seq < self.last - SEQ_REORDER_WINDOW:
+            self.restarts += 1
+            self.last = seq
+        else:
+            # QoS 1 ส่งซ้ำ หรือมาช้ากว่าตัวถัดไป (ไม่นับว่าหาย)
+            self.duplicates += 1
+
+    def snapshot(self):
+        return {"last": self.last, "received": self.received, "lost": self.lost,
+                "duplicates": self.duplicates, "restarts": self.restarts}
+
+
+class LatencyRecorder:
+    """
+    Per-process hop histograms, counters and sequence trackers.
+    snapshot() has the totals since start and the last complete `interval_s`
+    (the recent one shows where lag is building up right now).
+    """
+
+    def __init__(self, proc, interval_s=60.0, track_seq=True):
+        self.proc = proc
+        self.interval_s = interval_s
+        self.track_seq = track_seq
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._total = {}
+        self._current = {}
+        self._previous = None
+        self._rotate_at = time.monotonic() + interval_s
+        self.counters = {}
+        self.sequences = {}
+
+    def _rotate(self):
+        now = time.monotonic()
+        if now >= self._rotate_at:
+            # ไม่มีข้อมูลเลยทั้ง interval ก่อนหน้า -> ช่วงล่าสุดว่าง
+            self._previous = self._current if now < self._rotate_at + self.interval_s else {}
+            self._current = {}
+            self._rotate_at = now + self.interval_s
+
+    def observe(self, hop, ms):
+        with self._lock:
+            self._rotate()
+            for table in (self._total, self._current):
+                h = table.get(hop)
+                if h is None:
+                    h = table[hop] = LatencyHistogram()
+                h.observe(ms)
+
+    def observe_since(self, hop, start_ts, now=None):
+        """Record `hop` as the time from `start_ts` (epoch s) until now."""
+        if start_ts is None:
+            return
+        now = time.time() if now is None else now
+        self.observe(hop, (now - start_ts) * 1000.0)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def sequence(self, source, seq):
+        if not self.track_seq or seq is None:
+            return
+        with self._lock:
+            tracker = self.sequences.get(source)
+            if tracker is None:
+                tracker = self.sequences[source] = SequenceTracker()
+            tracker.add(int(seq))
+
+    def received(self, source, seq=None, sent_ts=None, rx_ts=None):
+        """One decoded message: broker + decode hops and the seq check."""
+        now = time.time()
+        if rx_ts is not None:
+            self.observe_since("broker", sent_ts, rx_ts)
+            self.observe_since("decode", rx_ts, now)
+        self.sequence(source, seq)
+
+    def snapshot(self):
+        with self._lock:
+            self._rotate()
+            hops = {}
+            for hop, h in self._total.items():
+                recent = None if self._previous is None else self._previous.get(hop)
+                hops[hop] = {"total": h.snapshot(),
+                             "last_interval": recent.snapshot() if recent is not None else None}
+            return {
+                "proc": self.proc,
+                "at": time.time(),
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "interval_s": self.interval_s,
+                "hops": hops,
+                "counters": dict(self.counters),
+                "sequences": {src: t.snapshot() for src, t in self.sequences.items()},
+            }
+
+
+class CommitTimer:
+    """
+    Match Influx batch callbacks back to the time each point was handed to write_api
+    (by the point timestamp in the line protocol) -> "storage" and "end_to_end" hops.
+    """
+
+    def __init__(self, recorder, end_to_end_measurements=(), max_pending=100_000):
+        self.recorder = recorder
+        self.prefixes = tuple(f"{m}," for m in end_to_end_measurements)
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = {}   # point time (ns) -> เวลาที่ส่งให้ write_api
+
+    def queued(self, times_ns):
+        now = time.time()
+        with self._lock:
+            if len(self._pending) > self.max_pending:
+                # callback หาย (เช่น write_api ถูกปิด) ไม่ให้ dict โตไม่หยุด
+                self.recorder.count("storage_untracked", len(self._pending))
+                self._pending.clear()
+            for t in times_ns:
+                self._pending.setdefault(t, now)
+
+    def _lines(self, data):
+        if isinstance(data, bytes):
+            data = data.decode("utf-8", "replace")
+        for line in data.splitlines():
+            head, _, ts = line.rpartition(" ")
+            if head and ts.isdigit():
+                yield line, int(ts)
+
+    def committed(self, data):
+        now = time.time()
+        for line, t in self._lines(data):
+            with self._lock:
+                queued = self._pending.pop(t, None)
+            if queued is not None:
+                self.recorder.observe("storage", (now - queued) * 1000.0)
+            if line.startswith(self.prefixes):
+                self.recorder.observe("end_to_end", (now - t / 1e9) * 1000.0)
+
+    def failed(self, data):
+        n = 0
+        for _, t in self._lines(data):
+            with self._lock:
+                self._pending.pop(t, None)
+            n += 1
+        self.recorder.count("storage_failed_points", n)
+
+
+def start_metrics_publisher(publish, topic, recorder, period=10.0, serialize=True):
+    """
+    Call publish(topic, json) with recorder.snapshot() every `period` s on a daemon thread
+    (serialize=False: the snapshot dict itself, for the in-process bus of edge_runtime.py).
+    """
+    def loop():
+        while True:
+            time.sleep(period)
+            try:
+                snapshot = recorder.snapshot()
+                publish(topic, json.dumps(snapshot, separators=(",", ":")) if serialize else snapshot)
+            except Exception as e:
+                print("Metrics publish error:", e)
+
+    thread = threading.Thread(target=loop, name="metrics", daemon=True)
+    thread.start()
+    return thread
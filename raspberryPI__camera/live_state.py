@@ -0,0 +1,140 @@
+# live_state.py
+# ค่าล่าสุด (JSON) + latency metrics (JSON) + ภาพล่าสุด (JPEG) ใน shared memory ให้ Dashboard หลาย process ใช้ร่วมกัน
+# ingest process เดียวรับ MQTT แล้วเขียน, web worker กี่ process ก็ได้อ่านโดยไม่ต้อง lock
+#
+# แต่ละ slot ป้องกันด้วย seqlock:
+#   [seq u64][len u32][crc32 u32][data ...]
+#   writer: seq -> คี่ (กำลังเขียน), เขียน data/len/crc, seq -> คู่
+#   reader: อ่าน seq (คู่), copy data, อ่าน seq อีกครั้ง; ต้องเท่ากันและ crc ตรง ไม่งั้นอ่านใหม่
+# crc กันกรณี CPU เรียงลำดับการเขียน memory ไม่ตรงกับโปรแกรม (Python ไม่มี memory barrier)
+#
+# segment อยู่ที่ /dev/shm/<name> และไม่ถูกลบตอน process จบ (ingest restart แล้วใช้ต่อได้)
+import json
+import struct
+import time
+import zlib
+from multiprocessing import resource_tracker, shared_memory
+
+_SLOT_HEADER = struct.Struct("<QII")
+_SEQ = struct.Struct("<Q")
+_FRAME_HEADER = struct.Struct("<Q")   # frame seq ของ Dashboard นำหน้า JPEG
+
+
+class SeqlockSlot:
+    """One single-writer, many-reader record inside a shared buffer."""
+
+    def __init__(self, buf, offset, capacity):
+        self.buf = buf
+        self.offset = offset
+        self.capacity = capacity
+
+    def version(self):
+        return _SEQ.unpack_from(self.buf, self.offset)[0]
+
+    def write(self, data):
+        if len(data) > self.capacity:
+            raise ValueError(f"record too large ({len(data)} > {self.capacity} bytes)")
+        seq = self.version()
+        start = self.offset + _SLOT_HEADER.size
+        _SEQ.pack_into(self.buf, self.offset, seq + 1)
+        self.buf[start:start + len(data)] = data
+        _SLOT_HEADER.pack_into(self.buf, self.offset, seq + 1, len(data), zlib.crc32(data))
+        _SEQ.pack_into(self.buf, self.offset, seq + 2)
+
+    def read(self, retries=100):
+        """(version, bytes) of a consistent snapshot, or None if the writer kept interfering."""
+        start = self.offset + _SLOT_HEADER.size
+        for attempt in range(retries):
+            seq, length, crc = _SLOT_HEADER.unpack_from(self.buf, self.offset)
+            if seq & 1 or length > self.capacity:
+                time.sleep(0 if attempt < 10 else 0.001)
+                continue
+            data = bytes(self.buf[start:start + length])
+            if self.version() == seq and zlib.crc32(data) == crc:
+                return seq, data
+        return None
+
+
+def _attach(name, create, size):
+    shm = None
+    if create:
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # ingest restart: ใช้ segment เดิม ถ้าเล็กกว่าที่ต้องการ (config / version เก่า) สร้างใหม่
+            old = shared_memory.SharedMemory(name=name)
+            if old.size >= size:
+                shm = old
+            else:
+                old.unlink()
+                old.close()
+                shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=name)
+    # Python < 3.13 ลบ segment ตอน process ที่เปิดมันจบ -> ยกเลิกเพื่อให้ segment อยู่ต่อ
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+class SharedLiveState:
+    """Latest dashboard values and camera frame in one shared-memory segment."""
+
+    def __init__(self, name, create=False, state_size=64 * 1024, metrics_size=64 * 1024,
+                 frame_size=4 * 1024 * 1024):
+        header = _SLOT_HEADER.size
+        size = 3 * header + state_size + metrics_size + frame_size
+        self.shm = _attach(name, create, size)
+        if self.shm.size < size:
+            raise ValueError(f"shared memory '{name}' is smaller than configured")
+        buf = self.shm.buf
+        self.state = SeqlockSlot(buf, 0, state_size)
+        self.metrics = SeqlockSlot(buf, header + state_size, metrics_size)
+        self.frame = SeqlockSlot(buf, 2 * header + state_size + metrics_size, frame_size)
+        self._frame_cache = (None, None)   # (slot version, frame)
+
+    # ---- writer (ingest process) ----
+    def write_state(self, data):
+        self.state.write(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+    def write_metrics(self, data):
+        self.metrics.write(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+    def write_frame(self, seq, jpg):
+        self.frame.write(_FRAME_HEADER.pack(seq) + jpg)
+
+    # ---- readers (web workers) ----
+    def state_version(self):
+        return self.state.version()
+
+    def read_state(self):
+        snap = self.state.read()
+        if snap is None or not snap[1]:
+            return None
+        return json.loads(snap[1])
+
+    def read_metrics(self):
+        snap = self.metrics.read()
+        if snap is None or not snap[1]:
+            return None
+        return json.loads(snap[1])
+
+    def read_frame(self):
+        """(seq, etag, jpg) like Dashboard.latest_frame, or None."""
+        version = self.frame.version()
+        if version == self._frame_cache[0]:
+            return self._frame_cache[1]
+        snap = self.frame.read()
+        if snap is None or len(snap[1]) < _FRAME_HEADER.size:
+            return None
+        (seq,) = _FRAME_HEADER.unpack_from(snap[1])
+        jpg = snap[1][_FRAME_HEADER.size:]
+        frame = (seq, f"{seq}-{zlib.crc32(jpg):08x}", jpg)
+        self._frame_cache = (snap[0], frame)
+        return frame
+
+    def close(self):
+        self.state.buf = self.metrics.buf = self.frame.buf = None
+        self.shm.close()
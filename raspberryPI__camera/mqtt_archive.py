@@ -0,0 +1,225 @@
+# mqtt_archive.py
+# เก็บ MQTT message ดิบที่ subscriber รับ (topic, เวลาที่รับ, payload) ไว้ประมวลผลใหม่ด้วย replay.py
+#
+# segment file <dir>/<YYYYmmddTHHMMSS>-<writer>.seg  (writer = host-pid, หลาย process เขียนคนละไฟล์)
+#   header  MAGIC (8 byte) + เวลาเริ่ม segment (float64)
+#   record  rx_ts float64 | len(topic) uint16 | len(payload) uint32 | crc32(topic + payload) uint32 | topic | payload
+#           (little-endian, ต่อท้ายอย่างเดียว) record ท้ายไฟล์ที่เขียนไม่ครบ (ไฟดับ) ถูกข้ามตอนอ่าน
+# index   <segment>.idx  (rx_ts float64, offset uint64) ทุก ARCHIVE_INDEX_EVERY_S -> replay เริ่มกลางไฟล์ได้
+#
+# ขึ้น segment ใหม่ทุก segment_s หรือเมื่อใหญ่เกิน segment_bytes, ลบ segment เก่าสุดเมื่อเกิน
+# retention_s / max_bytes (ทุก writer ใน dir) เขียนผ่าน buffer แล้ว flush ทุก flush_s (ไม่ fsync: ถนอม SD card)
+import calendar
+import heapq
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+MAGIC = b"IOTARC1\n"
+_HEADER = struct.Struct("<8sd")
+_RECORD = struct.Struct("<dHII")
+_INDEX = struct.Struct("<dQ")
+
+ARCHIVE_INDEX_EVERY_S = 10.0
+
+
+def segment_name(start_ts, writer):
+    return time.strftime("%Y%m%dT%H%M%S", time.gmtime(start_ts)) + f"-{writer}.seg"
+
+
+class ArchiveWriter:
+    """Append-only writer; append() is called from the MQTT thread, flushing runs on its own thread."""
+
+    def __init__(self, directory, writer, segment_s=3600.0, segment_bytes=64 * 1024 * 1024,
+                 retention_s=35 * 86400.0, max_bytes=4 * 1024 ** 3, flush_s=1.0):
+        self.directory = directory
+        self.writer = writer
+        self.segment_s = segment_s
+        self.segment_bytes = segment_bytes
+        self.retention_s = retention_s
+        self.max_bytes = max_bytes
+        self.flush_s = flush_s
+        self._lock = threading.Lock()
+        self._file = None
+        self._index = None
+        self._path = None
+        self._started = 0.0
+        self._size = 0
+        self._next_index_ts = 0.0
+        self.messages = 0
+        self.bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        threading.Thread(target=self._flush_loop, name="archive-flush", daemon=True).start()
+
+    def append(self, topic, payload, rx_ts):
+        topic_b = topic.encode("utf-8")
+        payload = bytes(payload)
+        crc = zlib.crc32(payload, zlib.crc32(topic_b))
+        record = _RECORD.pack(rx_ts, len(topic_b), len(payload), crc)
+        with self._lock:
+            if (self._file is None or rx_ts - self._started >= self.segment_s
+                    or self._size >= self.segment_bytes):
+                self._rotate(rx_ts)
+            if rx_ts >= self._next_index_ts:
+                self._index.write(_INDEX.pack(rx_ts, self._size))
+                self._next_index_ts = rx_ts + ARCHIVE_INDEX_EVERY_S
+            self._file.write(record)
+            self._file.write(topic_b)
+            self._file.write(payload)
+            n = _RECORD.size + len(topic_b) + len(payload)
+            self._size += n
+            self.messages += 1
+            self.bytes += n
+
+    def _rotate(self, now):
+        self._close_segment()
+        self._path = os.path.join(self.directory, segment_name(now, self.writer))
+        self._file = open(self._path, "ab", buffering=256 * 1024)
+        self._index = open(self._path + ".idx", "ab")
+        if self._file.tell() == 0:
+            self._file.write(_HEADER.pack(MAGIC, now))
+        self._size = self._file.tell()
+        self._started = now
+        self._next_index_ts = 0.0
+        self._prune(now)
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = self._index = None
+
+    def _prune(self, now):
+        """Delete the oldest segments (any writer) past retention_s or beyond max_bytes."""
+        segments = list_segments(self.directory)
+        sizes = {p: os.path.getsize(p) for p in segments}
+        total = sum(sizes.values())
+        for path in segments:
+            if path == self._path:
+                break
+            if total <= self.max_bytes and segment_start(path) >= now - self.retention_s:
+                break
+            total -= sizes[path]
+            for p in (path, path + ".idx"):
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._index.flush()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_s)
+            try:
+                self.flush()
+            except Exception as e:
+                print("Archive flush error:", e)
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+
+# ---------------- reading ----------------
+def list_segments(directory):
+    """Segment paths ordered by start time (name), every writer."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, n) for n in sorted(n for n in names if n.endswith(".seg"))]
+
+
+def segment_start(path):
+    return calendar.timegm(time.strptime(os.path.basename(path)[:15], "%Y%m%dT%H%M%S"))
+
+
+def segment_writer(path):
+    return os.path.basename(path)[16:-len(".seg")]
+
+
+class SegmentReader:
+    """Memory-mapped segment; iterate records from the index entry at or before `start`."""
+
+    def __init__(self, path):
+        self.path = path
+        self.corrupt = 0
+
+    def _start_offset(self, start):
+        offset = _HEADER.size
+        if start is None:
+            return offset
+        try:
+            with open(self.path + ".idx", "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return offset
+        for i in range(len(data) // _INDEX.size):
+            ts, pos = _INDEX.unpack_from(data, i * _INDEX.size)
+            if ts > start:
+                break
+            offset = pos
+        return offset
+
+    def records(self, start=None, end=None):
+        """Yield (rx_ts, topic, payload bytes) with start <= rx_ts < end."""
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if _HEADER.unpack_from(mm, 0)[0] != MAGIC:
+                    raise ValueError(f"not an archive segment: {self.path}")
+                pos = self._start_offset(start)
+                while pos + _RECORD.size <= size:
+                    rx_ts, topic_len, payload_len, crc = _RECORD.unpack_from(mm, pos)
+                    body = pos + _RECORD.size
+                    nxt = body + topic_len + payload_len
+                    if nxt > size:
+                        break      # record สุดท้ายเขียนไม่ครบ
+                    topic = mm[body:body + topic_len]
+                    payload = mm[body + topic_len:nxt]
+                    pos = nxt
+                    if zlib.crc32(payload, zlib.crc32(topic)) != crc:
+                        self.corrupt += 1
+                        continue
+                    if start is not None and rx_ts < start:
+                        continue
+                    if end is not None and rx_ts >= end:
+                        continue
+                    yield rx_ts, topic.decode("utf-8"), payload
+
+
+def iter_archive(directory, start=None, end=None, readers=None):
+    """
+    Every archived message in [start, end) in receive-time order: the segments of each
+    writer are read one after another, writers are merged by rx_ts.
+    readers (list) collects the SegmentReaders opened (corrupt record counts).
+    """
+    by_writer = {}
+    for path in list_segments(directory):
+        by_writer.setdefault(segment_writer(path), []).append(path)
+
+    def chain(paths):
+        for j, path in enumerate(paths):
+            seg_start = segment_start(path)
+            seg_end = segment_start(paths[j + 1]) if j + 1 < len(paths) else float("inf")
+            if (end is not None and seg_start >= end) or (start is not None and seg_end <= start):
+                continue
+            reader = SegmentReader(path)
+            if readers is not None:
+                readers.append(reader)
+            yield from reader.records(start, end)
+
+    streams = [chain(paths) for paths in by_writer.values()]
+    if len(streams) == 1:
+        return streams[0]
+    return heapq.merge(*streams, key=lambda r: r[0])
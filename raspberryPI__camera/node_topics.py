@@ -0,0 +1,101 @@
+# node_topics.py
+# Topic ของแต่ละ node (ใช้ร่วมกันระหว่าง subscriber / Dashboard)
+#
+#   iot/pi/<node_id>/data    Pi JSON
+#   iot/pi/<node_id>/batch   Pi binary batch (sample_batch.py)
+#   iot/esp/<node_id>/data   ESP32 CSV
+#   iot/camera               Camera JSON + image
+#   iot/metrics/<proc>       latency histogram / seq ของแต่ละ process (latency.py)
+#   iot/anomaly/<node_id>    sensor ผิดปกติที่ subscriber ตรวจเจอ (anomaly.py)
+#
+# topic เดิม (/iot/data, iot/esp/data) ยังรับได้ และถูก map เป็น node "raspi" / "esp32"
+
+MQTT_TOPIC_PI     = "/iot/data"        # Pi JSON (legacy)
+MQTT_TOPIC_ESP    = "iot/esp/data"     # ESP32 CSV (legacy)
+MQTT_TOPIC_CAMERA = "iot/camera"       # Camera JSON + image
+
+MQTT_TOPIC_PI_NODES  = "iot/pi/+/data"
+MQTT_TOPIC_ESP_NODES = "iot/esp/+/data"
+MQTT_TOPIC_PI_BATCH  = "iot/pi/+/batch"   # Pi binary batch (sample_batch.py)
+
+# ค่าที่ใช้ตัดสิน relay ที่ subscriber ตัวอื่นส่งต่อให้ตัวที่คุม relay (shared subscription)
+MQTT_TOPIC_RELAY_FORWARD = "iot/internal/relay/+"
+
+# event ของ anomaly.py (fault start / end, spike) ต่อ node
+MQTT_TOPIC_ANOMALY = "iot/anomaly/+"
+
+# snapshot ของ latency.py ที่ทุก process ส่งเป็นระยะ (Dashboard รวมไว้ที่ /api/metrics)
+MQTT_TOPIC_METRICS = "iot/metrics/+"
+
+LEGACY_PI_NODE  = "raspi"
+LEGACY_ESP_NODE = "esp32"
+CAMERA_NODE     = "camera"
+
+SUBSCRIBE_TOPICS = (
+    MQTT_TOPIC_PI,
+    MQTT_TOPIC_ESP,
+    MQTT_TOPIC_PI_NODES,
+    MQTT_TOPIC_ESP_NODES,
+    MQTT_TOPIC_PI_BATCH,
+    MQTT_TOPIC_CAMERA,
+)
+
+
+def pi_topic(node_id):
+    return f"iot/pi/{node_id}/data"
+
+
+def pi_batch_topic(node_id):
+    return f"iot/pi/{node_id}/batch"
+
+
+def esp_topic(node_id):
+    return f"iot/esp/{node_id}/data"
+
+
+def relay_forward_topic(node_id):
+    return f"iot/internal/relay/{node_id}"
+
+
+def anomaly_topic(node_id):
+    return f"iot/anomaly/{node_id}"
+
+
+def metrics_topic(proc):
+    return f"iot/metrics/{proc}"
+
+
+def shared_topic(group, topic):
+    """MQTT 5 shared subscription: broker delivers each message to one member of the group."""
+    return f"$share/{group}/{topic}"
+
+
+def parse_topic(topic):
+    """
+    Return (kind, node_id) for a sensor topic, kind in {"pi", "pi_batch", "esp", "camera", "relay", "metrics"}.
+    Unknown topics return (None, None).
+    """
+    if topic == MQTT_TOPIC_PI:
+        return "pi", LEGACY_PI_NODE
+    if topic == MQTT_TOPIC_ESP:
+        return "esp", LEGACY_ESP_NODE
+    if topic == MQTT_TOPIC_CAMERA:
+        return "camera", CAMERA_NODE
+
+    parts = topic.split("/")
+    if len(parts) == 4 and parts[:2] == ["iot", "pi"] and parts[3] == "batch" and parts[2]:
+        return "pi_batch", parts[2]
+
+    if len(parts) == 4 and parts[0] == "iot" and parts[3] == "data" and parts[2]:
+        if parts[1] == "pi":
+            return "pi", parts[2]
+        if parts[1] == "esp":
+            return "esp", parts[2]
+
+    if len(parts) == 4 and parts[:3] == ["iot", "internal", "relay"] and parts[3]:
+        return "relay", parts[3]
+
+    if len(parts) == 3 and parts[:2] == ["iot", "metrics"] and parts[2]:
+        return "metrics", parts[2]
+
+    return None, None
@@ -0,0 +1,219 @@
+# profiling.py
+# ดูว่า process ที่รันอยู่ใช้เวลา / memory ไปกับอะไร โดยไม่ต้องหยุดหรือ deploy ใหม่
+#
+#   sampling profile  ดู stack ของทุก thread ทุก PROFILE_INTERVAL_S เป็นเวลา N วินาที
+#                     -> collapsed stacks (.folded) เปิดด้วย speedscope.app / flamegraph.pl ได้ตรง ๆ
+#   memory            tracemalloc: ครั้งแรกเริ่ม trace, ครั้งต่อไปเขียน diff เทียบกับครั้งก่อน (หา leak)
+#   threads           stack ปัจจุบันของทุก thread (ค้าง / deadlock)
+#
+# สั่งได้ 2 ทาง ผลเขียนเป็นไฟล์ใน PROFILE_DIR:
+#   signal   kill -USR1 <pid>   threads + memory (ทันที)
+#            kill -USR2 <pid>   sampling profile PROFILE_SECONDS วินาที
+#   HTTP     /admin/profile?seconds=30, /admin/memory, /admin/threads (เฉพาะ localhost, ดู register_admin_routes)
+#
+# overhead: ไม่ทำอะไรเลยจนกว่าจะถูกสั่ง; ระหว่าง profile มี thread เดินดู stack ทุก PROFILE_INTERVAL_S
+# (ถือ GIL ช่วงสั้น ๆ ต่อ sample), tracemalloc ทำให้ทุก allocation ช้าลงจนกว่าจะ /admin/memory?stop=1
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter
+
+PROFILE_DIR         = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_SECONDS     = 30.0
+PROFILE_MAX_SECONDS = 600.0
+PROFILE_INTERVAL_S  = 0.01     # 100 Hz
+TRACEMALLOC_FRAMES  = 10
+MEMORY_TOP          = 40       # จำนวนบรรทัดที่โตมากที่สุดใน diff
+
+# frame ของ tracemalloc / importlib เองไม่ใช่ของ app
+_MEMORY_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class Profiler:
+    """On-demand sampling profile, tracemalloc diff and thread dump for one process."""
+
+    def __init__(self, proc, out_dir=PROFILE_DIR, interval_s=PROFILE_INTERVAL_S):
+        self.proc = proc
+        self.out_dir = out_dir
+        self.interval_s = interval_s
+        self._profile_lock = threading.Lock()
+        self._memory_lock = threading.Lock()
+        self._snapshot = None
+
+    def _path(self, kind, ext):
+        os.makedirs(self.out_dir, exist_ok=True)
+        now = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f".{int(now % 1 * 1000):03d}"
+        return os.path.join(self.out_dir, f"{self.proc}-{os.getpid()}-{stamp}-{kind}.{ext}")
+
+    # ---------------- sampling profile ----------------
+    def profile(self, seconds=PROFILE_SECONDS):
+        """Sample every thread for `seconds` (blocking); write collapsed stacks, return the path."""
+        if not self._profile_lock.acquire(blocking=False):
+            raise RuntimeError("a profile is already running")
+        try:
+            return self._sample(seconds)
+        finally:
+            self._profile_lock.release()
+
+    def start_profile(self, seconds=PROFILE_SECONDS):
+        """Run profile() on a background thread; False if one is already running."""
+        if not self._profile_lock.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                self._sample(seconds)
+            except Exception as e:
+                print("Profile error:", e)
+            finally:
+                self._profile_lock.release()
+
+        threading.Thread(target=run, name="profiler", daemon=True).start()
+        return True
+
+    def _sample(self, seconds):
+        seconds = min(float(seconds), PROFILE_MAX_SECONDS)
+        stacks = Counter()
+        me = threading.get_ident()
+        samples = 0
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(labels))] += 1
+            samples += 1
+            time.sleep(self.interval_s)
+
+        path = self._path(f"profile-{int(seconds)}s", "folded")
+        with open(path, "w") as f:
+            for stack, n in stacks.most_common():
+                f.write(f"{stack} {n}\n")
+        print(f"Profile: {samples} samples in {seconds:.0f} s -> {path}")
+        return path
+
+    # ---------------- tracemalloc ----------------
+    def memory(self, top=MEMORY_TOP, stop=False):
+        """
+        First call starts tracemalloc; later calls write the allocations that grew
+        since the previous call. stop=True writes a last diff and stops tracing.
+        """
+        with self._memory_lock:
+            path = self._path("memory", "txt")
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._snapshot = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+                with open(path, "w") as f:
+                    f.write("tracemalloc started; trigger again to get the growth since now\n")
+                print(f"Memory: tracemalloc started -> {path}")
+                return path
+
+            snapshot = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+            current, peak = tracemalloc.get_traced_memory()
+            diff = snapshot.compare_to(self._snapshot, "lineno")
+            with open(path, "w") as f:
+                f.write(f"traced: current={current / 1024:.1f} KiB peak={peak / 1024:.1f} KiB\n")
+                f.write(f"top {top} growth since previous snapshot:\n")
+                for stat in diff[:top]:
+                    f.write(f"{stat}\n")
+                by_traceback = snapshot.compare_to(self._snapshot, "traceback")
+                if by_traceback:
+                    f.write("\ntraceback of the largest growth:\n")
+                    f.write("\n".join(by_traceback[0].traceback.format()) + "\n")
+            self._snapshot = snapshot
+            if stop:
+                tracemalloc.stop()
+                self._snapshot = None
+            print(f"Memory: diff -> {path}")
+            return path
+
+    # ---------------- threads ----------------
+    def threads(self):
+        """Write the current stack of every thread, return the path."""
+        path = self._path("threads", "txt")
+        frames = sys._current_frames()
+        with open(path, "w") as f:
+            for t in sorted(threading.enumerate(), key=lambda t: t.name):
+                frame = frames.get(t.ident)
+                f.write(f'"{t.name}" ident={t.ident} daemon={t.daemon}\n')
+                if frame is not None:
+                    f.write("".join(traceback.format_stack(frame)))
+                f.write("\n")
+        print(f"Threads: {len(frames)} -> {path}")
+        return path
+
+    # ---------------- triggers ----------------
+    def _dump_quietly(self):
+        try:
+            self.threads()
+            self.memory()
+        except Exception as e:
+            print("Profiler dump error:", e)
+
+    def install_signals(self, seconds=PROFILE_SECONDS):
+        """
+        SIGUSR1 = thread dump + memory diff, SIGUSR2 = sampling profile.
+        Must be called from the main thread; the work runs on a helper thread.
+        """
+        signal.signal(signal.SIGUSR1,
+                      lambda signum, frame: threading.Thread(target=self._dump_quietly, daemon=True).start())
+        signal.signal(signal.SIGUSR2, lambda signum, frame: self.start_profile(seconds))
+        print(f"Profiler: kill -USR1 {os.getpid()} (threads + memory), "
+              f"kill -USR2 {os.getpid()} (profile {seconds:.0f} s) -> {os.path.abspath(self.out_dir)}")
+
+
+LOCAL_ADDRS = ("127.0.0.1", "::1")
+
+
+def register_admin_routes(app, profiler):
+    """
+    /admin/profile?seconds=N  (202, background), /admin/memory[?stop=1], /admin/threads
+    on a Flask app. Only requests from localhost are served (ssh -L / curl on the Pi).
+    """
+    from flask import abort, jsonify, request
+
+    def local_only():
+        if request.remote_addr not in LOCAL_ADDRS or request.headers.get("X-Forwarded-For"):
+            abort(403)
+
+    @app.route("/admin/profile", methods=["GET", "POST"])
+    def admin_profile():
+        local_only()
+        try:
+            seconds = min(float(request.args.get("seconds", PROFILE_SECONDS)), PROFILE_MAX_SECONDS)
+        except ValueError:
+            return jsonify({"error": "seconds must be a number"}), 400
+        if not profiler.start_profile(seconds):
+            return jsonify({"error": "a profile is already running"}), 409
+        return jsonify({"started": True, "seconds": seconds, "dir": os.path.abspath(profiler.out_dir)}), 202
+
+    @app.route("/admin/memory", methods=["GET", "POST"])
+    def admin_memory():
+        local_only()
+        return jsonify({"file": profiler.memory(stop=request.args.get("stop") == "1")})
+
+    @app.route("/admin/threads")
+    def admin_threads():
+        local_only()
+        return jsonify({"file": profiler.threads()})
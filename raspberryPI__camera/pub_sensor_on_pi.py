@@ -1,22 +1,97 @@
 import os
 import glob
 import time
+import threading
 import smbus
 import json
 import paho.mqtt.client as mqtt
 
+from node_topics import metrics_topic, pi_batch_topic, pi_topic
+from sample_batch import encode_batch
+from deadband import ReportFilter
+from edge_bus import batch_message
+from latency import LatencyRecorder, start_metrics_publisher
+from profiling import Profiler
+from sensor_spool import SampleSpool, SpoolingPublisher
+
 # ---------------- KY-001 ----------------
 os.system('modprobe w1-gpio')
 os.system('modprobe w1-therm')
 
-base_dir = '/sys/bus/w1/devices/'
-device_folders = glob.glob(base_dir + '28*')
-if not device_folders:
-    raise RuntimeError("ไม่พบ KY-001 (ไม่มีโฟลเดอร์ 28* ใน /sys/bus/w1/devices/)")
-device_folder = device_folders[0]
-device_file = device_folder + '/w1_slave'
+W1_BASE_DIR = os.environ.get("W1_BASE_DIR", "/sys/bus/w1/devices/")
+W1_RESCAN_PERIOD = 30.0   # s, หา probe ที่เสียบเพิ่ม/ถอดออกโดยไม่ต้อง restart
+W1_CONVERT_TIMEOUT = 1.0  # s, DS18B20 12-bit ใช้ ~750 ms
+
+probe_files = {}          # ROM id (เช่น 28-0316a2792fff) -> path ของ w1_slave
+primary_probe = None      # probe ที่ส่งเป็น "temperature" (ตัวแรกตามชื่อ)
+last_scan = 0.0
+
+
+def scan_probes():
+    """Refresh the list of DS18B20 probes on the bus."""
+    global primary_probe, last_scan
+
+    found = {
+        os.path.basename(folder): os.path.join(folder, 'w1_slave')
+        for folder in sorted(glob.glob(os.path.join(W1_BASE_DIR, '28*')))
+    }
+    last_scan = time.monotonic()
+
+    if found.keys() != probe_files.keys():
+        added = sorted(found.keys() - probe_files.keys())
+        removed = sorted(probe_files.keys() - found.keys())
+        if added:
+            print("KY-001: probe added:", ", ".join(added))
+        if removed:
+            print("KY-001: probe removed:", ", ".join(removed))
+        probe_files.clear()
+        probe_files.update(found)
+        primary_probe = next(iter(found), None)
+
+    if not probe_files:
+        print(f"⚠ ไม่พบ KY-001 (ไม่มีโฟลเดอร์ 28* ใน {W1_BASE_DIR})")
+
+
+def bulk_trigger_files():
+    return glob.glob(os.path.join(W1_BASE_DIR, 'w1_bus_master*', 'therm_bulk_read'))
 
-def read_temp_raw():
+
+def bulk_convert():
+    """
+    Start a temperature conversion on every probe at once (w1_therm therm_bulk_read)
+    and wait until it is done, so N probes cost one ~750 ms window instead of N.
+    Returns False if the kernel has no bulk read support.
+    """
+    triggers = bulk_trigger_files()
+    if not triggers:
+        return False
+
+    for path in triggers:
+        try:
+            with open(path, 'w') as f:
+                f.write('trigger\n')
+        except OSError as e:
+            print("KY-001 bulk trigger error:", e)
+            return False
+
+    # therm_bulk_read อ่านได้ -1 ระหว่างแปลงค่า
+    deadline = time.monotonic() + W1_CONVERT_TIMEOUT
+    time.sleep(0.1)
+    while time.monotonic() < deadline:
+        busy = False
+        for path in triggers:
+            try:
+                with open(path) as f:
+                    busy = busy or f.read().strip() == '-1'
+            except OSError:
+                pass
+        if not busy:
+            break
+        time.sleep(0.05)
+    return True
+
+
+def read_temp_raw(device_file):
     try:
         with open(device_file, 'r') as f:
             return f.readlines()
@@ -24,17 +99,24 @@ def read_temp_raw():
         print("KY-001 read_raw error:", e)
         return []
 
-def read_temp():
+def read_temp(device_file=None):
+    if device_file is None:
+        if not probe_files:
+            scan_probes()
+        if primary_probe is None:
+            return None
+        device_file = probe_files[primary_probe]
+
     max_retry = 5
 
-    lines = read_temp_raw()
+    lines = read_temp_raw(device_file)
     retry = 0
 
     # ถ้าไม่มีบรรทัดเลย หรือมีน้อยกว่า 2 บรรทัด → retry
     while (not lines or len(lines) < 2) and retry < max_retry:
         print(f"⚠ KY-001: no data (len={len(lines)}), retry {retry+1}/{max_retry}")
         time.sleep(0.2)
-        lines = read_temp_raw()
+        lines = read_temp_raw(device_file)
         retry += 1
 
     if not lines or len(lines) < 2:
@@ -46,7 +128,7 @@ def read_temp():
     while not lines[0].strip().endswith('YES') and retry < max_retry:
         print(f"KY-001: CRC not YES, retry {retry+1}/{max_retry}")
         time.sleep(0.2)
-        lines = read_temp_raw()
+        lines = read_temp_raw(device_file)
         if not lines or len(lines) < 2:
             print("KY-001: no data while checking CRC, return None")
             return None
@@ -70,65 +152,332 @@ def read_temp():
     print("KY-001: 't=' not found in", lines[1].strip())
     return None
 
+
+def read_all_temps():
+    """
+    Read every probe on the bus: {rom_id: °C or None}.
+    Probes are converted together with one bulk trigger when available.
+    """
+    if not probe_files or time.monotonic() - last_scan > W1_RESCAN_PERIOD:
+        scan_probes()
+
+    if not probe_files:
+        return {}
+
+    bulk_convert()  # ถ้าไม่มี bulk read แต่ละ probe จะแปลงค่าเองตอนอ่าน w1_slave
+    return {rom: read_temp(path) for rom, path in list(probe_files.items())}
+
+
+scan_probes()
+
+
 # ---------------- BH1750 ----------------
 bus = smbus.SMBus(1)
 BH1750_ADDR = 0x23
 CONTINUOUS_HIGH_RES_MODE = 0x10
+bh1750_started = False
 
 def read_light():
     """ อ่านค่าความสว่างจาก BH1750 หน่วย lux """
+    global bh1750_started
     try:
-        bus.write_byte(BH1750_ADDR, CONTINUOUS_HIGH_RES_MODE)
-        time.sleep(0.2)
+        # continuous mode: สั่งครั้งเดียว แล้ว sensor วัดใหม่เองทุก ~120 ms
+        if not bh1750_started:
+            bus.write_byte(BH1750_ADDR, CONTINUOUS_HIGH_RES_MODE)
+            time.sleep(0.2)
+            bh1750_started = True
         data = bus.read_i2c_block_data(BH1750_ADDR, 0x00, 2)
         lux = (data[0] << 8 | data[1]) / 1.2
         return lux
     except Exception as e:
         print("BH1750 read error:", e)
+        bh1750_started = False
         return None
 
 # ---------------- MQTT ----------------
 MQTT_BROKER = "localhost"  # mosquitto รันบน Pi ตัวนี้
 MQTT_PORT = 1883
-MQTT_TOPIC = "/iot/data"
+NODE_ID = "raspi"          # ชื่อ node (ต้องไม่ซ้ำกันในโรงเรือน)
+MQTT_TOPIC = pi_topic(NODE_ID)
+MQTT_TOPIC_BATCH = pi_batch_topic(NODE_ID)
+
+# ---------------- Store-and-forward ----------------
+# ถ้า broker ล่ม เก็บ message ลง SQLite แล้วทยอยส่งต่อเมื่อกลับมา (เวลาเดิมอยู่ใน payload)
+MQTT_QOS          = 1
+SPOOL_PATH        = "pi_sensor_spool.db"
+SPOOL_MAX_ROWS    = 500_000   # เกินนี้ทิ้งของเก่าสุด
+SPOOL_DRAIN_RATE  = 50.0      # msg/s ตอนส่งของค้าง (ไม่ถล่ม broker หลังกลับมา)
+SPOOL_DRAIN_BATCH = 100       # แถวต่อการอ่าน spool 1 ครั้ง
+MAX_INFLIGHT      = 20        # QoS 1 ที่ยังไม่ได้ PUBACK
+
+# ---------------- Sampling ----------------
+# แต่ละเซนเซอร์อ่านใน thread ของตัวเองตามคาบของตัวเอง
+# เซนเซอร์ที่ช้า (DS18B20 ~750 ms + retry) จะไม่หน่วงตัวอื่น
+TEMP_PERIOD    = 2.0   # s
+LIGHT_PERIOD   = 1.0   # s
+PUBLISH_PERIOD = 2.0   # s, ส่ง MQTT ด้วยค่าล่าสุดตามจังหวะคงที่
+STALE_AFTER    = 3     # ค่าที่เก่ากว่า STALE_AFTER × คาบของเซนเซอร์ ส่งเป็น None
+
+# ---------------- Batching ----------------
+# เก็บทุก sample แล้วส่งเป็น binary batch ก้อนเดียว (sample_batch.py) ทุก BATCH_INTERVAL
+# ใช้เมื่อต้องการ sample ถี่ (เช่น 10 Hz) โดยไม่เพิ่มจำนวน message
+BATCH_MODE          = False
+BATCH_INTERVAL      = 5.0   # s
+BATCH_LIGHT_PERIOD  = 0.1   # s, คาบอ่าน BH1750 ในโหมด batch
+
+# ---------------- Report-by-exception ----------------
+# ส่งเฉพาะ field ที่เปลี่ยนเกิน deadband หรือไม่ได้ส่งมานานเกิน MAX_SILENCE (heartbeat)
+DEADBAND_ENABLED = True
+DEADBAND = {
+    "temperature": 0.1,   # °C
+    "probe": 0.1,         # °C (ทุก DS18B20)
+    "light": 5.0,         # lux
+}
+SMOOTHING = {
+    "light": "median",    # None / "median" / "ewma"
+}
+MAX_SILENCE = 60.0        # s
+
+# ---------------- Latency metrics ----------------
+# ทุก message มี seq + sent_ts (ผู้รับใช้หา message ที่หาย / เวลาที่ค้างใน broker)
+# เวลาตั้งแต่อ่าน sensor จนส่ง ส่งเป็น histogram ไปที่ iot/metrics/<METRICS_PROC> (latency.py)
+METRICS_PROC   = f"pi-{NODE_ID}"
+METRICS_PERIOD = 10.0     # s
+
+
+class SensorSampler(threading.Thread):
+    """Read one sensor on its own thread and keep the latest (value, read time)."""
+
+    def __init__(self, name, read_fn, period, on_sample=None):
+        super().__init__(name=f"sample-{name}", daemon=True)
+        self.sensor = name
+        self.read_fn = read_fn
+        self.period = period
+        self.on_sample = on_sample
+        self.stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._value = None
+        self._ts = None
+
+    def run(self):
+        next_t = time.monotonic()
+        while not self.stop_event.is_set():
+            value = self.read_fn()
+            ts = time.time()  # เวลาที่อ่านได้จริง ไม่ใช่เวลาที่ publish
+            with self._lock:
+                self._value, self._ts = value, ts
+            if self.on_sample is not None:
+                self.on_sample(self.sensor, value, ts)
+
+            # นัดรอบถัดไปจากเวลาที่กำหนด (ไม่ drift) ถ้าอ่านช้าจนเลยรอบ ให้ข้ามรอบนั้นไป
+            next_t += self.period
+            now = time.monotonic()
+            if next_t < now:
+                next_t += self.period * (int((now - next_t) / self.period) + 1)
+            self.stop_event.wait(next_t - now)
 
-mqtt_client = mqtt.Client()
-mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-mqtt_client.loop_start()
+    def latest(self):
+        with self._lock:
+            value, ts = self._value, self._ts
+        if ts is not None and time.time() - ts > self.period * STALE_AFTER:
+            return None, ts
+        return value, ts
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class BatchCollector:
+    """Collect every sample (with its read time) until the next batch is sent."""
+
+    def __init__(self, report_filter=None):
+        self._lock = threading.Lock()
+        self._rows = []
+        self.report_filter = report_filter
+
+    def add(self, sensor, value, ts):
+        if value is None:
+            return
+        if sensor == "probes":
+            values = {f"probe:{rom}": v for rom, v in value.items()}
+            values["temperature"] = value.get(primary_probe)
+        else:
+            values = {sensor: value}
+        if self.report_filter is not None:
+            values = self.report_filter.filter(values, ts)
+            if not values:
+                return
+        with self._lock:
+            self._rows.append((ts, values))
+
+    def drain(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+        return rows
+
+
+def build_payload(samplers, report_filter=None):
+    """
+    Latest values as the JSON payload. With a report filter only fields that
+    moved beyond their deadband (or hit the heartbeat) are included;
+    returns None when there is nothing to send.
+    """
+    pi = {}
+    for key, sampler in samplers.items():
+        value, ts = sampler.latest()
+        pi[key] = value
+        pi[f"{key}_ts"] = ts
+
+    # "temperature" = probe หลัก (ให้ subscriber / Dashboard เดิมใช้ต่อได้)
+    probes = pi.get("probes") or {}
+    pi["temperature"] = probes.get(primary_probe)
+    pi["temperature_ts"] = pi.get("probes_ts")
+
+    if report_filter is None:
+        return {"pi": pi}
+
+    values = {"temperature": pi["temperature"], "light": pi["light"]}
+    values.update({f"probe:{rom}": v for rom, v in probes.items()})
+    changed = report_filter.filter(values, time.time())
+    if not changed:
+        return None
+
+    out = {}
+    for field in ("temperature", "light"):
+        if field in changed:
+            out[field] = changed[field]
+            out[f"{field}_ts"] = pi[f"{field}_ts"]
+    changed_probes = {f[len("probe:"):]: v for f, v in changed.items() if f.startswith("probe:")}
+    if changed_probes:
+        out["probes"] = changed_probes
+        out["probes_ts"] = pi["probes_ts"]
+
+    # บอกผู้รับว่า field ที่ไม่มี = ค่าเดิม (ไม่ใช่ค่าหาย)
+    return {"pi": out, "compression": report_filter.describe()}
+
+
+class BusPublisher:
+    """publish() for edge_runtime.py: the payload object goes on the in-process bus as is."""
+
+    def __init__(self, bus):
+        self.bus = bus
+
+    def publish(self, topic, payload):
+        self.bus.publish(topic, payload)
+        return True
+
+    def stop(self):
+        pass
 
-print("Pi sensor publisher (KY001 + BH1750) -> MQTT /iot/data ready...")
 
 # ---------------- Main Loop ----------------
-try:
-    while True:
-        # อ่านเซนเซอร์บน Raspberry Pi
-        pi_temp = read_temp()  # °C
-        lux = read_light()     # lux
-
-        # เตรียม payload ส่ง MQTT
-        payload = {
-            "pi": {
-                "temperature": pi_temp,
-                "light": lux
-            }
-        }
-
-        # ส่ง MQTT
-        try:
-            mqtt_client.publish(MQTT_TOPIC, json.dumps(payload))
-        except Exception as e:
-            print("MQTT publish error:", e)
-
-        
-        temp_str = f"{pi_temp:.2f} °C" if pi_temp is not None else "N/A"
-        lux_str = f"{lux:.2f} lux" if lux is not None else "N/A"
-        print(f"PUB /iot/data | Pi -> Temp: {temp_str} | Light: {lux_str}")
-
-        
-        time.sleep(2.0)
-
-except KeyboardInterrupt:
-    print("\nExiting...")
-finally:
-    mqtt_client.loop_stop()
-    mqtt_client.disconnect()
+def main(bus=None):
+    """bus = EdgeBus of edge_runtime.py: no MQTT client / spool, payloads are not serialized."""
+    recorder = LatencyRecorder(METRICS_PROC, track_seq=False)
+    if bus is None:
+        mqtt_client = mqtt.Client()
+        spool = SampleSpool(SPOOL_PATH, SPOOL_MAX_ROWS)
+        publisher = SpoolingPublisher(
+            mqtt_client, spool,
+            qos=MQTT_QOS,
+            max_inflight=MAX_INFLIGHT,
+            drain_rate=SPOOL_DRAIN_RATE,
+            drain_batch=SPOOL_DRAIN_BATCH,
+        )
+        # connect_async: ถ้า broker ยังไม่ขึ้นก็เริ่มเก็บ sample ได้เลย (paho ต่อใหม่ให้เอง)
+        mqtt_client.reconnect_delay_set(min_delay=1, max_delay=30)
+        mqtt_client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
+        mqtt_client.loop_start()
+
+        start_metrics_publisher(publisher.publish_volatile, metrics_topic(METRICS_PROC), recorder, METRICS_PERIOD)
+        # kill -USR1 / -USR2 <pid> = thread dump + memory / sampling profile (profiling.py)
+        Profiler(METRICS_PROC).install_signals()
+    else:
+        mqtt_client = spool = None
+        publisher = BusPublisher(bus)
+        start_metrics_publisher(bus.publish, metrics_topic(METRICS_PROC), recorder, METRICS_PERIOD,
+                                serialize=False)
+
+    report_filter = ReportFilter(DEADBAND, MAX_SILENCE, SMOOTHING) if DEADBAND_ENABLED else None
+    collector = BatchCollector(report_filter) if BATCH_MODE else None
+    on_sample = collector.add if collector is not None else None
+    light_period = BATCH_LIGHT_PERIOD if BATCH_MODE else LIGHT_PERIOD
+
+    samplers = {
+        "probes": SensorSampler("probes", read_all_temps, TEMP_PERIOD, on_sample),  # {ROM id: °C}
+        "light": SensorSampler("light", read_light, light_period, on_sample),       # lux
+    }
+    for sampler in samplers.values():
+        sampler.start()
+
+    dest = "MQTT" if bus is None else "bus"
+    if BATCH_MODE:
+        print(f"Pi sensor publisher (KY001 + BH1750) -> {dest} {MQTT_TOPIC_BATCH} (batch every {BATCH_INTERVAL}s) ready...")
+    else:
+        print(f"Pi sensor publisher (KY001 + BH1750) -> {dest} {MQTT_TOPIC} ready...")
+
+    period = BATCH_INTERVAL if BATCH_MODE else PUBLISH_PERIOD
+    next_pub = time.monotonic() + period
+    seq = 0   # นับเฉพาะ message ที่ส่งจริง (deadband ไม่ส่ง = ไม่ใช้เลข)
+    try:
+        while True:
+            time.sleep(max(0.0, next_pub - time.monotonic()))
+            next_pub += period
+
+            if BATCH_MODE:
+                rows = collector.drain()
+                if rows:
+                    sent_ts = time.time()
+                    try:
+                        batch = (encode_batch(rows, seq=seq, sent_ts=sent_ts) if bus is None
+                                 else batch_message(rows, seq=seq, sent_ts=sent_ts))
+                        if not publisher.publish(MQTT_TOPIC_BATCH, batch):
+                            recorder.count("spooled")
+                    except Exception as e:
+                        print("MQTT publish error:", e)
+                    seq += 1
+                    for ts, _ in rows:
+                        recorder.observe_since("publish", ts, sent_ts)
+                    print(f"PUB {MQTT_TOPIC_BATCH} | {len(rows)} samples")
+                continue
+
+            # เตรียม payload ส่ง MQTT (ค่าล่าสุดของแต่ละเซนเซอร์ + เวลาที่อ่าน)
+            payload = build_payload(samplers, report_filter)
+            if payload is None:
+                continue  # ไม่มีค่าไหนเปลี่ยนเกิน deadband
+
+            payload["seq"] = seq
+            payload["sent_ts"] = sent_ts = time.time()
+            seq += 1
+            for field in ("temperature", "light", "probes"):
+                if payload["pi"].get(field) is not None:
+                    recorder.observe_since("publish", payload["pi"].get(f"{field}_ts"), sent_ts)
+
+            # ส่ง MQTT
+            try:
+                if not publisher.publish(MQTT_TOPIC, json.dumps(payload) if bus is None else payload):
+                    recorder.count("spooled")
+            except Exception as e:
+                print("MQTT publish error:", e)
+
+            pi_temp = payload["pi"].get("temperature")
+            lux = payload["pi"].get("light")
+            temp_str = f"{pi_temp:.2f} °C" if pi_temp is not None else "-"
+            lux_str = f"{lux:.2f} lux" if lux is not None else "-"
+            print(f"PUB {MQTT_TOPIC} | Pi -> Temp: {temp_str} | Light: {lux_str}"
+                  f" | probes: {len(payload['pi'].get('probes') or {})}")
+
+    except KeyboardInterrupt:
+        print("\nExiting...")
+    finally:
+        for sampler in samplers.values():
+            sampler.stop()
+        publisher.stop()
+        if mqtt_client is not None:
+            mqtt_client.loop_stop()
+            mqtt_client.disconnect()
+            spool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 
 from flask import Flask, Response, render_template_string, jsonify
 import cv2
+import os
 import time
 from datetime import datetime
 from picamera2 import Picamera2
@@ -9,6 +10,10 @@ import json
 import base64
 import paho.mqtt.client as mqtt
 
+from latency import LatencyRecorder, start_metrics_publisher
+from node_topics import metrics_topic
+from profiling import Profiler, register_admin_routes
+
 # ---- YOLO (ตรวจพริก) ----
 from ultralytics import YOLO
 model = YOLO("best.pt")           # วางไฟล์โมเดลไว้โฟลเดอร์เดียวกัน
@@ -25,19 +30,41 @@ LAST_H = 0
 LAST_MQTT_AT = None  # เวลา ISO ล่าสุดที่ส่ง MQTT สำเร็จ
 
 # ---- MQTT CONFIG (ส่งข้อมูลกล้อง + รูปภาพ) ----
-MQTT_BROKER = "localhost"   # ถ้า Mosquitto รันบน Pi ตัวนี้
-MQTT_PORT = 1883
+MQTT_BROKER = os.environ.get("MQTT_BROKER", "localhost")   # ถ้า Mosquitto รันบน Pi ตัวนี้
+MQTT_PORT = int(os.environ.get("MQTT_PORT", 1883))
 MQTT_TOPIC = "iot/camera"   # topic ที่ใช้ส่ง
 MQTT_INTERVAL = 10.0        # ✅ ส่ง MQTT ทุก 10 วินาที
 
-mqtt_client = mqtt.Client()
-try:
-    mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-    mqtt_client.loop_start()
-    print(f"✅ MQTT connected to {MQTT_BROKER}:{MQTT_PORT}, topic '{MQTT_TOPIC}'")
-except Exception as e:
-    print("❌ MQTT connect error:", e)
-    mqtt_client = None  # กัน error ถ้าต่อไม่ได้
+# ---- Latency metrics (latency.py) ----
+# payload มี seq, ts (เวลาถ่าย) และ sent_ts; เวลาถ่าย -> YOLO เสร็จ -> ส่ง เก็บเป็น histogram
+# ดูได้ที่ /metrics และส่งไป iot/metrics/camera ทุก METRICS_PERIOD
+METRICS_PROC   = "camera"
+METRICS_PERIOD = 10.0
+recorder = LatencyRecorder(METRICS_PROC, track_seq=False)
+MQTT_SEQ = 0
+
+# ส่งผลทุก MQTT_INTERVAL: publish_frame(payload, jpg_bytes) ตั้งโดย start_mqtt()
+# หรือ edge_runtime.py (ส่ง dict + JPEG bytes เข้า in-process bus ไม่ต้อง base64 / JSON)
+# None = ไม่ส่ง
+publish_frame = None
+mqtt_client = None
+
+def publish_mqtt(payload, frame_bytes):
+    payload["image"] = base64.b64encode(frame_bytes).decode("ascii")
+    mqtt_client.publish(MQTT_TOPIC, json.dumps(payload))
+
+def start_mqtt():
+    global mqtt_client, publish_frame
+    mqtt_client = mqtt.Client()
+    try:
+        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        mqtt_client.loop_start()
+        print(f"✅ MQTT connected to {MQTT_BROKER}:{MQTT_PORT}, topic '{MQTT_TOPIC}'")
+        start_metrics_publisher(mqtt_client.publish, metrics_topic(METRICS_PROC), recorder, METRICS_PERIOD)
+        publish_frame = publish_mqtt
+    except Exception as e:
+        print("❌ MQTT connect error:", e)
+        mqtt_client = None  # กัน error ถ้าต่อไม่ได้
 
 # ------------ YOLO ตรวจพริก ------------
 def process_img(img):
@@ -66,7 +93,7 @@ def process_img(img):
 
 # ------------ สตรีมกล้อง + ส่ง MQTT (data + image) ------------
 def generate_frames():
-    global LAST_FPS, LAST_W, LAST_H, LAST_MQTT_AT
+    global LAST_FPS, LAST_W, LAST_H, LAST_MQTT_AT, MQTT_SEQ
 
     prev_time = time.time()
     picam2 = Picamera2()
@@ -79,6 +106,7 @@ def generate_frames():
 
     while True:
         frame = picam2.capture_array()
+        captured = time.time()
         height, width, channels = frame.shape
         LAST_W, LAST_H = width, height
 
@@ -91,6 +119,7 @@ def generate_frames():
 
         # ตรวจพริก
         frame, per_frame_count = process_img(frame)
+        recorder.observe_since("inference", captured)
 
         # overlay ขนาด + FPS
         text = f"{width}x{height} | fps:{fps_text}"
@@ -103,9 +132,8 @@ def generate_frames():
         frame_bytes = buffer.tobytes()
 
         # ✅ ส่งข้อมูล + รูปภาพขึ้น MQTT (จำกัดทุก 10 วินาที)
-        if mqtt_client is not None and (now - last_mqtt) >= MQTT_INTERVAL:
+        if publish_frame is not None and (now - last_mqtt) >= MQTT_INTERVAL:
             try:
-                img_b64 = base64.b64encode(frame_bytes).decode("ascii")
                 payload = {
                     "camera": {
                         "chili_count": int(per_frame_count),
@@ -113,9 +141,13 @@ def generate_frames():
                         "width": int(width),
                         "height": int(height),
                     },
-                    "image": img_b64
+                    "seq": MQTT_SEQ,
+                    "ts": captured,
+                    "sent_ts": time.time(),
                 }
-                mqtt_client.publish(MQTT_TOPIC, json.dumps(payload))
+                MQTT_SEQ += 1
+                publish_frame(payload, frame_bytes)
+                recorder.observe_since("publish", captured, payload["sent_ts"])
                 LAST_MQTT_AT = datetime.utcnow().isoformat(timespec="seconds") + "Z"
                 # print("MQTT sent", LAST_MQTT_AT)
             except Exception as e:
@@ -203,11 +235,23 @@ def stats():
         "last_mqtt_at": LAST_MQTT_AT
     })
 
+@app.route('/metrics')
+def metrics():
+    return jsonify(recorder.snapshot())
+
 @app.route('/video_feed')
 def video_feed():
     return Response(generate_frames(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+# ---- Profiling (profiling.py) ----
+# /admin/profile?seconds=30, /admin/memory, /admin/threads จาก localhost เท่านั้น
+# หรือ kill -USR1 (threads + memory) / kill -USR2 (profile) ผลอยู่ใน PROFILE_DIR
+profiler = Profiler(METRICS_PROC)
+register_admin_routes(app, profiler)
+
 # ------------------------ Main ------------------------
 if __name__ == '__main__':
+    profiler.install_signals()
+    start_mqtt()
     app.run(host='0.0.0.0', port=5000, threaded=True)
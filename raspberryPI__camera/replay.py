@@ -0,0 +1,171 @@
+# replay.py
+# ป้อน message ที่ subscriber เก็บไว้ (--archive, mqtt_archive.py) เข้า handler ของ subscriber อีกครั้ง
+# ใช้หลังแก้ decode / rollup / fusion / anomaly แล้วอยากคำนวณข้อมูลย้อนหลังใหม่
+#
+#   python replay.py mqtt_archive --start 2026-09-01 --end 2026-10-01       # เร็วที่สุด
+#   python replay.py mqtt_archive --start 6h --speed 10                       # เร็วกว่าเวลาจริง 10 เท่า
+#   python replay.py mqtt_archive --start 1d --dry-run                        # ไม่เขียน Influx (ดูจำนวน / anomaly)
+#
+# - segment ถูก mmap อ่านตามลำดับเวลาที่รับ (หลาย writer รวมกันด้วย rx_ts), เริ่มกลางไฟล์ผ่าน index
+# - เวลาของ pipeline (rollup ตัดสิน sample ช้า, flush rollup / fusion) = rx_ts ของ message ที่ replay
+#   -> ผลเหมือนตอนรับจริง ไม่ขึ้นกับว่า replay เร็วแค่ไหน
+# - point ใน Influx ใช้ timestamp เดิม: series + เวลาเดียวกันถูกเขียนทับ ไม่เกิดข้อมูลซ้ำ
+# - rollup window ที่ช่วง replay ครอบไม่เต็ม (ต้น / ท้ายช่วง, window ที่ยังไม่ปิด) ไม่ถูกเขียน
+#   ไม่ให้ค่าครึ่ง window ทับ record ที่ครบอยู่แล้ว
+# - relay ไม่ทำงาน (ไม่แตะ GPIO), ไม่ต่อ MQTT, Influx ตาม INFLUX_URL ของ subscriber (--dry-run ไม่เปิดทั้ง Influx และ camera_frames.db)
+# - ทำงาน thread เดียว: ลำดับ message ตรงกับ archive และ handler ไม่ต้องรอ queue
+import argparse
+import sys
+import time
+from collections import Counter
+
+from export import parse_time
+from mqtt_archive import iter_archive
+from node_topics import parse_topic
+
+REPLAY_FLUSH_S    = 5.0      # flush rollup / fusion ทุกเท่านี้ของเวลาใน archive
+REPLAY_PROGRESS_S = 10.0     # พิมพ์ความคืบหน้าทุกเท่านี้ของเวลาจริง
+REPLAY_KINDS      = ("pi", "pi_batch", "esp")
+
+
+def load_subscriber(dry_run=False, rollups=True, fusion=True, anomaly=True, camera=False):
+    """
+    Import the subscriber with relays off and its clocks driven by replay(). Only the
+    sinks replay writes to are opened: InfluxDB unless dry_run, camera_frames.db if camera.
+    """
+    import subscriber_main_on_pi as sub
+
+    sub.LOG_MESSAGES = False
+    sub.ANOMALY_ENABLED = anomaly
+    if dry_run:
+        sub.influx_write = lambda record, times_ns: None
+        sub.save_camera_image = lambda *args, **kwargs: None
+    else:
+        sub.open_influx()
+        if camera:
+            sub.init_camera_db()
+    if rollups and sub.ROLLUPS_ENABLED:
+        sub.start_rollups(flush_thread=False)
+    if fusion and sub.FUSION_ENABLED:
+        sub.start_fusion(flush_thread=False)
+    else:
+        sub.fusion.history = False
+    return sub
+
+
+def replay(sub, messages, speed=0.0, kinds=REPLAY_KINDS, progress=None):
+    """
+    Feed (rx_ts, topic, payload) through sub.handle_message. speed 0 = as fast as
+    possible, N = N times real time. Returns a Counter of messages per kind
+    ("skipped" = other kinds / unknown topics).
+    """
+    counts = Counter()
+    now = [0.0]
+    sub.clock = lambda: now[0]
+    first_ts = None
+    next_flush = 0.0
+    wall0 = time.monotonic()
+    next_progress = wall0 + REPLAY_PROGRESS_S
+
+    def flush(ts, force=False):
+        for r in sub.rollups:
+            r.flush(ts)          # window ที่ยังไม่ปิดตอนจบ replay มีแค่บางส่วน -> ไม่เขียน
+        if sub.fusion_started:
+            sub.fusion.flush(ts, force)
+
+    for rx_ts, topic, payload in messages:
+        kind, node_id = parse_topic(topic)
+        if kind not in kinds:
+            counts["skipped"] += 1
+            continue
+        if first_ts is None:
+            first_ts = rx_ts
+            next_flush = rx_ts + REPLAY_FLUSH_S
+            for r in sub.rollups:
+                r.min_start = rx_ts  # window ที่เริ่มก่อน message แรกไม่ครบ
+        if speed > 0:
+            delay = (rx_ts - first_ts) / speed - (time.monotonic() - wall0)
+            if delay > 0:
+                time.sleep(delay)
+
+        now[0] = rx_ts
+        try:
+            sub.handle_message(kind, node_id, payload, rx_ts)
+        except Exception as e:
+            counts["error"] += 1
+            print(f"Replay error ({topic} @ {rx_ts:.3f}):", e)
+        counts[kind] += 1
+
+        if rx_ts >= next_flush:
+            flush(rx_ts)
+            next_flush = rx_ts + REPLAY_FLUSH_S
+            if progress is not None and time.monotonic() >= next_progress:
+                progress(rx_ts, counts)
+                next_progress = time.monotonic() + REPLAY_PROGRESS_S
+
+    if first_ts is not None:
+        flush(now[0], force=True)
+        unwritten = sum(r.open_windows(now[0]) for r in sub.rollups)
+        if unwritten:
+            print(f"Rollups: {unwritten} windows still open at the end of the range (not written)")
+    sub.clock = time.time
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay archived MQTT messages through the subscriber")
+    parser.add_argument("archive", help="directory written by subscriber_main_on_pi.py --archive")
+    parser.add_argument("--start", help="'7d' (ago) or ISO-8601 (UTC if no zone); default = oldest")
+    parser.add_argument("--end", help="same formats; default = newest")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="0 = as fast as possible (default), N = N times real time")
+    parser.add_argument("--kinds", default=",".join(REPLAY_KINDS),
+                        help=f"message kinds to replay (default {','.join(REPLAY_KINDS)})")
+    parser.add_argument("--dry-run", action="store_true", help="run the handlers but do not write to InfluxDB")
+    parser.add_argument("--no-rollups", action="store_true", help="do not rebuild the rollup measurements")
+    parser.add_argument("--no-fusion", action="store_true", help="do not rebuild the fused records")
+    parser.add_argument("--no-anomaly", action="store_true", help="do not run the anomaly detector")
+    parser.add_argument("--quiet", action="store_true", help="no progress lines")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = parse_time(args.start).timestamp() if args.start else None
+    end = parse_time(args.end).timestamp() if args.end else None
+    kinds = tuple(k.strip() for k in args.kinds.split(",") if k.strip())
+
+    sub = load_subscriber(dry_run=args.dry_run, rollups=not args.no_rollups,
+                          fusion=not args.no_fusion, anomaly=not args.no_anomaly, camera="camera" in kinds)
+    readers = []
+
+    def print_progress(ts, counts):
+        done = sum(v for k, v in counts.items() if k not in ("skipped", "error"))
+        at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+        print(f"  {at} UTC  {done} messages  {done / (time.perf_counter() - t0):.0f} msg/s", flush=True)
+
+    t0 = time.perf_counter()
+    try:
+        counts = replay(sub, iter_archive(args.archive, start, end, readers), args.speed, kinds,
+                        None if args.quiet else print_progress)
+    finally:
+        sub.close_influx()
+    elapsed = time.perf_counter() - t0
+
+    done = sum(v for k, v in counts.items() if k not in ("skipped", "error"))
+    per_kind = ", ".join(f"{k} {v}" for k, v in sorted(counts.items()))
+    print(f"Replayed {done} messages in {elapsed:.1f} s ({done / max(elapsed, 1e-9):.0f} msg/s)"
+          f" from {len(readers)} segments: {per_kind or 'nothing in range'}")
+    corrupt = sum(r.corrupt for r in readers)
+    if corrupt:
+        print(f"Skipped {corrupt} corrupt records (CRC mismatch)")
+    skipped = sum(r.partial_skipped for r in sub.rollups)
+    if skipped:
+        print(f"Rollups: skipped {skipped} samples of windows begun before the range")
+    if sub.fusion_started and sub.fusion.late:
+        print(f"Fusion dropped {sub.fusion.late} late samples")
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
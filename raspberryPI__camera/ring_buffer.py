@@ -0,0 +1,185 @@
+# ring_buffer.py
+# เก็บ time series ล่าสุดไว้ใน RAM (NumPy, จองพื้นที่ครั้งเดียว) ต่อ node × field
+# Dashboard ใช้ตอบ /api/history ช่วงล่าสุดโดยไม่ต้องถาม InfluxDB และยังมีกราฟให้ดูตอน Influx ล่ม
+#
+# 1 series = float64 timestamp + float32 value = 12 bytes/sample
+# ค่าเริ่มต้น 86,400 samples (24 ชม. ที่ 1 Hz) ≈ 1 MiB ต่อ series
+import threading
+
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed-capacity, time-ordered (ts, value) buffer; the oldest samples are overwritten."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.t = np.zeros(capacity, dtype=np.float64)
+        self.v = np.zeros(capacity, dtype=np.float32)
+        self.head = 0          # ตำแหน่งที่จะเขียนถัดไป
+        self.size = 0
+        self.dropped = 0       # sample ที่เวลาย้อนหลัง (ไม่รับ เพื่อให้ searchsorted ใช้ได้)
+        self._lock = threading.Lock()
+
+    def append(self, ts, value):
+        with self._lock:
+            if self.size and ts < self.t[self.head - 1]:
+                self.dropped += 1
+                return
+            self.t[self.head] = ts
+            self.v[self.head] = value
+            self.head = (self.head + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+
+    def extend(self, ts, values):
+        """Append many samples at once (ts ascending)."""
+        ts = np.asarray(ts, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float32)
+        with self._lock:
+            if self.size:
+                ok = ts >= self.t[self.head - 1]
+                self.dropped += int((~ok).sum())
+                ts, values = ts[ok], values[ok]
+            n = len(ts)
+            if n >= self.capacity:
+                ts, values, n = ts[-self.capacity:], values[-self.capacity:], self.capacity
+            idx = (self.head + np.arange(n)) % self.capacity
+            self.t[idx] = ts
+            self.v[idx] = values
+            self.head = (self.head + n) % self.capacity
+            self.size = min(self.size + n, self.capacity)
+
+    def oldest(self):
+        """Timestamp of the oldest sample held, or None when empty."""
+        with self._lock:
+            if not self.size:
+                return None
+            return float(self.t[(self.head - self.size) % self.capacity])
+
+    def full(self):
+        return self.size == self.capacity
+
+    def window(self, start, end):
+        """Copies of (ts, values) with start <= ts < end, oldest first."""
+        with self._lock:
+            if self.size < self.capacity:
+                segments = ((self.t[:self.size], self.v[:self.size]),)
+            else:
+                segments = ((self.t[self.head:], self.v[self.head:]), (self.t[:self.head], self.v[:self.head]))
+            ts, vs = [], []
+            for t, v in segments:
+                lo, hi = np.searchsorted(t, (start, end), side="left")
+                if hi > lo:
+                    ts.append(t[lo:hi].copy())
+                    vs.append(v[lo:hi].copy())
+        if not ts:
+            return np.empty(0, np.float64), np.empty(0, np.float32)
+        return np.concatenate(ts), np.concatenate(vs)
+
+
+def downsample(t, v, start, window_s, how="mean"):
+    """
+    Bucket (t, v) into windows of window_s seconds aligned to `start`.
+    Returns (window_end_ts, values) for non-empty windows only (like aggregateWindow createEmpty:false).
+    how: "mean", "min" or "max"
+    """
+    if len(t) == 0:
+        return np.empty(0, np.float64), np.empty(0, np.float64)
+    b = ((t - start) // window_s).astype(np.int64)
+    n = int(b.max()) + 1
+    count = np.bincount(b, minlength=n)
+    if how == "mean":
+        out = np.bincount(b, weights=v, minlength=n) / np.maximum(count, 1)
+    elif how == "min":
+        out = np.full(n, np.inf)
+        np.minimum.at(out, b, v)
+    elif how == "max":
+        out = np.full(n, -np.inf)
+        np.maximum.at(out, b, v)
+    else:
+        raise ValueError(f"unknown aggregate: {how}")
+    nz = np.nonzero(count)[0]
+    return start + (nz + 1) * window_s, out[nz]
+
+
+class SeriesStore:
+    """RingBuffer per (node, field), created on first sample."""
+
+    def __init__(self, capacity=86_400):
+        self.capacity = capacity
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self.started_at = None     # sample แรกที่รับ: ก่อนหน้านี้ต้องถาม Influx
+
+    def buffer(self, node, field):
+        key = (node, field)
+        buf = self._buffers.get(key)
+        if buf is None:
+            with self._lock:
+                buf = self._buffers.get(key)
+                if buf is None:
+                    buf = self._buffers[key] = RingBuffer(self.capacity)
+        return buf
+
+    def append(self, node, field, ts, value):
+        if value is None:
+            return
+        if self.started_at is None:
+            self.started_at = ts
+        self.buffer(node, field).append(ts, value)
+
+    def extend(self, node, field, ts, values):
+        if len(ts) == 0:
+            return
+        if self.started_at is None:
+            self.started_at = float(ts[0])
+        self.buffer(node, field).extend(ts, values)
+
+    def covered_since(self):
+        """Earliest time from which every series is complete in memory (None = nothing yet)."""
+        if self.started_at is None:
+            return None
+        since = self.started_at
+        with self._lock:
+            buffers = list(self._buffers.values())
+        for buf in buffers:
+            if buf.full():
+                since = max(since, buf.oldest())
+        return since
+
+    def series(self, field, start, end):
+        """All nodes of one field merged, sorted by time."""
+        with self._lock:
+            buffers = [buf for (_, f), buf in self._buffers.items() if f == field]
+        parts = [buf.window(start, end) for buf in buffers]
+        parts = [p for p in parts if len(p[0])]
+        if not parts:
+            return np.empty(0, np.float64), np.empty(0, np.float32)
+        if len(parts) == 1:
+            return parts[0]
+        t = np.concatenate([p[0] for p in parts])
+        v = np.concatenate([p[1] for p in parts])
+        order = np.argsort(t, kind="stable")
+        return t[order], v[order]
+
+    def table(self, fields, start, end, window_s=0, how="mean"):
+        """
+        Fields on one shared time axis: (times, {field: values with None}).
+        window_s=0 keeps raw samples; otherwise windows aligned to multiples of window_s.
+        """
+        cols = {}
+        for f in fields:
+            t, v = self.series(f, start, end)
+            if window_s:
+                aligned = start // window_s * window_s
+                t, v = downsample(t, v, aligned, window_s, how)
+                t = np.minimum(t, end)   # window สุดท้ายยังไม่ครบ: เวลา = end (เหมือน Influx)
+            cols[f] = (t, v)
+
+        times = np.unique(np.concatenate([t for t, _ in cols.values()])) if cols else np.empty(0)
+        out = {}
+        for f, (t, v) in cols.items():
+            col = np.full(len(times), np.nan)
+            col[np.searchsorted(times, t)] = v
+            out[f] = [None if np.isnan(x) else float(x) for x in col]
+        return times, out
@@ -0,0 +1,152 @@
+# rollup.py
+# สรุปข้อมูลแบบต่อเนื่อง (continuous rollup) ระหว่างรับข้อมูล
+# ต่อ node × field × window เก็บแค่ count / sum / min / max (O(1) ต่อ sample, ไม่เก็บค่าดิบ)
+# window ที่ปิดแล้วถูกส่งออกเป็น 1 record ต่อ node × window ผ่าน emit()
+#
+# measurement เดียวกันมี field:
+#   <field>        ค่าเฉลี่ย (ชื่อเดียวกับ raw -> query เดิมเปลี่ยนแค่ measurement ก็ใช้ได้)
+#   <field>_min, <field>_max, <field>_count
+#
+# ข้อมูลที่มาช้า (เช่น Pi ส่ง spool ที่ค้างไว้หลังเน็ตกลับมา):
+#   late_policy="drop"    window ปิดแล้ว (เลย end + grace) -> ทิ้ง sample
+#   late_policy="update"  รวมเข้า window เดิมแล้วเขียนทับ (Influx: series + timestamp เดียวกัน = แทนที่)
+#                         ได้จนถึง late_retention_s หลัง window ปิด
+#
+# window ที่บางส่วนอยู่นอกช่วงที่ process นี้เห็น ห้ามเขียน: point ใหม่จะเขียนทับ record ที่ครบอยู่แล้ว
+#   dump() / restore()  เก็บ window ที่ยังอยู่ในหน่วยความจำตอนปิด แล้วรวมต่อหลัง restart
+#   min_start           ไม่เปิด window ที่เริ่มก่อนเวลานี้ (restart โดยไม่มี state, replay กลาง window)
+import threading
+import time
+
+
+class FieldStats:
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+
+class Window:
+    __slots__ = ("node_id", "zone", "start", "fields", "dirty")
+
+    def __init__(self, node_id, zone, start):
+        self.node_id = node_id
+        self.zone = zone
+        self.start = start
+        self.fields = {}
+        self.dirty = True
+
+
+class RollupAggregator:
+    """
+    emit(measurement, node_id, zone, start, stats) is called from flush() for every
+    closed (or late-updated) window; stats = {field: (count, mean, min, max)}.
+    """
+
+    LATE_POLICIES = ("drop", "update")
+
+    def __init__(self, measurement, window_s, emit, grace_s=10.0, late_policy="drop", late_retention_s=6 * 3600):
+        if late_policy not in self.LATE_POLICIES:
+            raise ValueError(f"unknown late policy: {late_policy}")
+        self.measurement = measurement
+        self.window_s = window_s
+        self.emit = emit
+        self.grace_s = grace_s
+        self.late_policy = late_policy
+        self.late_retention_s = late_retention_s
+        self._windows = {}           # (node_id, start) -> Window
+        self._lock = threading.Lock()
+        self.late_dropped = 0
+        self.min_start = None        # None = เปิดได้ทุก window
+        self.partial_skipped = 0
+
+    def add(self, node_id, zone, values, ts=None, now=None):
+        """values: {field: float or None}; ts = sample time (epoch s)."""
+        now = time.time() if now is None else now
+        ts = now if ts is None else ts
+        start = ts - ts % self.window_s
+        closes_at = start + self.window_s + self.grace_s
+
+        with self._lock:
+            key = (node_id, start)
+            w = self._windows.get(key)
+            if w is None:
+                if self.min_start is not None and start < self.min_start:
+                    self.partial_skipped += 1
+                    return
+                late = closes_at <= now
+                if late and (self.late_policy == "drop" or closes_at + self.late_retention_s <= now):
+                    self.late_dropped += 1
+                    return
+                w = self._windows[key] = Window(node_id, zone, start)
+            elif closes_at <= now and self.late_policy == "drop":
+                self.late_dropped += 1
+                return
+
+            for field, value in values.items():
+                if value is None:
+                    continue
+                stats = w.fields.get(field)
+                if stats is None:
+                    stats = w.fields[field] = FieldStats()
+                stats.add(float(value))
+            w.dirty = True
+
+    def flush(self, now=None, force=False):
+        """
+        Emit windows that have closed; force=True emits open windows too, which
+        then hold only part of their samples (use dump() / restore() across restarts).
+        """
+        now = time.time() if now is None else now
+        ready = []
+        with self._lock:
+            for key, w in list(self._windows.items()):
+                closes_at = w.start + self.window_s + self.grace_s
+                if not (force or closes_at <= now):
+                    continue
+                if w.dirty and w.fields:
+                    stats = {f: (st.count, st.total / st.count, st.min, st.max) for f, st in w.fields.items()}
+                    ready.append((w.node_id, w.zone, w.start, stats))
+                    w.dirty = False
+                # drop: ปิดแล้วไม่ต้องเก็บ, update: เก็บไว้รับข้อมูลช้าจนหมด retention
+                if force or self.late_policy == "drop" or closes_at + self.late_retention_s <= now:
+                    del self._windows[key]
+        for node_id, zone, start, stats in ready:
+            self.emit(self.measurement, node_id, zone, start, stats)
+        return len(ready)
+
+    def open_windows(self, now=None):
+        """Number of windows that have not closed yet (not emitted unless flush(force=True))."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return sum(1 for w in self._windows.values() if w.start + self.window_s + self.grace_s > now)
+
+    def dump(self):
+        """Every window still held (open or kept for late samples) as JSON-able lists."""
+        with self._lock:
+            return [
+                [w.node_id, w.zone, w.start, w.dirty,
+                 {f: [st.count, st.total, st.min, st.max] for f, st in w.fields.items()}]
+                for w in self._windows.values()
+            ]
+
+    def restore(self, windows):
+        """Take back the windows of dump() (before any add()); they emit when they close as usual."""
+        with self._lock:
+            for node_id, zone, start, dirty, fields in windows:
+                w = self._windows[(node_id, start)] = Window(node_id, zone, start)
+                w.dirty = dirty
+                for field, (count, total, vmin, vmax) in fields.items():
+                    st = w.fields[field] = FieldStats()
+                    st.count, st.total, st.min, st.max = count, total, vmin, vmax
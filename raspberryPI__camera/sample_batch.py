@@ -0,0 +1,101 @@
+# sample_batch.py
+# Binary batch ของ sample หลายค่าใน 1 MQTT message (ใช้ระหว่าง pub_sensor_on_pi -> subscriber)
+#
+# little-endian:
+#   header   "PB" | version u8 | n_fields u8 | n_rows u16 | base_ts f64 (epoch s)
+#            v2 เพิ่ม: seq u32 | sent_ts f64 (epoch s)   (latency.py)
+#   fields   n_fields × (len u8 + utf-8 name)
+#   rows     n_rows × (delta_ms u32 + n_fields × f32)   ค่าที่ไม่มีใน row นั้น = NaN
+#
+# 10 Hz × 2 field × 5 s = 50 rows ≈ 0.6 KB แทน 50 JSON message
+import math
+import struct
+import time
+
+MAGIC = b"PB"
+VERSION = 2
+
+_HEADER = struct.Struct("<2sBBHd")
+_HEADER_V2 = struct.Struct("<Id")    # ต่อท้าย _HEADER ตั้งแต่ version 2
+
+NAN = float("nan")
+
+
+def encode_batch(rows, fields=None, seq=0, sent_ts=None):
+    """
+    rows: list of (ts, {field: value}) in any order.
+    Returns the packed batch as bytes.
+    """
+    if fields is None:
+        names = set()
+        for _, values in rows:
+            names.update(values)
+        fields = sorted(names)
+
+    if len(fields) > 255:
+        raise ValueError("too many fields in one batch")
+    if len(rows) > 0xFFFF:
+        raise ValueError("too many rows in one batch")
+
+    rows = sorted(rows, key=lambda r: r[0])
+    base_ts = rows[0][0] if rows else 0.0
+
+    out = bytearray(_HEADER.pack(MAGIC, VERSION, len(fields), len(rows), base_ts))
+    out += _HEADER_V2.pack(seq & 0xFFFFFFFF, time.time() if sent_ts is None else sent_ts)
+    for name in fields:
+        raw = name.encode("utf-8")
+        out.append(len(raw))
+        out += raw
+
+    flat = []
+    for ts, values in rows:
+        flat.append(int(round((ts - base_ts) * 1000)))
+        for name in fields:
+            v = values.get(name)
+            flat.append(NAN if v is None else float(v))
+
+    out += struct.pack("<" + ("I" + "f" * len(fields)) * len(rows), *flat)
+    return bytes(out)
+
+
+def _header(data):
+    magic, version, n_fields, n_rows, base_ts = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version not in (1, VERSION):
+        raise ValueError(f"not a sample batch (magic={magic!r}, version={version})")
+    return version, n_fields, n_rows, base_ts
+
+
+def batch_meta(data):
+    """(seq, sent_ts) of a batch; (None, None) for version 1 batches."""
+    version = _header(data)[0]
+    if version < 2:
+        return None, None
+    return _HEADER_V2.unpack_from(data, _HEADER.size)
+
+
+def decode_batch(data):
+    """
+    Decode a batch in one pass.
+    Returns (fields, [(ts, (v0, v1, ...)), ...]) with None for missing values.
+    """
+    version, n_fields, n_rows, base_ts = _header(data)
+
+    pos = _HEADER.size + (_HEADER_V2.size if version >= 2 else 0)
+    fields = []
+    for _ in range(n_fields):
+        n = data[pos]
+        fields.append(bytes(data[pos + 1:pos + 1 + n]).decode("utf-8"))
+        pos += 1 + n
+
+    row = struct.Struct("<I" + "f" * n_fields)
+    end = pos + row.size * n_rows
+    if end != len(data):
+        raise ValueError(f"batch size mismatch ({len(data)} bytes, expected {end})")
+
+    rows = []
+    for delta_ms, *values in row.iter_unpack(memoryview(data)[pos:end]):
+        rows.append((
+            base_ts + delta_ms / 1000.0,
+            tuple(None if math.isnan(v) else v for v in values),
+        ))
+    return fields, rows
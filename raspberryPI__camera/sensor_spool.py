@@ -0,0 +1,221 @@
+# sensor_spool.py
+# Store-and-forward: เก็บ message ที่ส่งไม่ได้ (broker ล่ม / ต่อไม่ติด) ลง SQLite
+# แล้วทยอยส่งต่อเมื่อเชื่อมต่อได้อีกครั้ง (QoS 1, จำกัดจำนวน in-flight และอัตราการส่ง)
+import sqlite3
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+
+class SampleSpool:
+    """Append-only on-disk queue of (topic, payload) that the broker has not acknowledged."""
+
+    def __init__(self, path, max_rows=500_000):
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS spool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            topic TEXT NOT NULL,
+            payload BLOB NOT NULL
+        )
+        """)
+        self._conn.commit()
+        self.pending = self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def append(self, topic, payload):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO spool (created_at, topic, payload) VALUES (?, ?, ?)",
+                (time.time(), topic, sqlite3.Binary(payload)),
+            )
+            self.pending += 1
+            if self.pending > self.max_rows:
+                # เต็ม -> ทิ้งของเก่าสุด
+                drop = self.pending - self.max_rows
+                self._conn.execute(
+                    "DELETE FROM spool WHERE id IN (SELECT id FROM spool ORDER BY id LIMIT ?)", (drop,)
+                )
+                self.pending -= drop
+            self._conn.commit()
+
+    def peek(self, after_id, limit):
+        """Oldest rows with id > after_id: [(id, topic, payload), ...]"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, topic, payload FROM spool WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+            ).fetchall()
+
+    def delete(self, row_ids):
+        if not row_ids:
+            return
+        with self._lock:
+            cur = self._conn.executemany("DELETE FROM spool WHERE id = ?", [(i,) for i in row_ids])
+            self.pending = max(0, self.pending - cur.rowcount)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SpoolingPublisher:
+    """
+    Publish at QoS 1 directly while the broker is reachable and the spool is empty;
+    otherwise append to the spool. A drain thread replays the spool in order
+    at `drain_rate` msg/s with at most `max_inflight` unacknowledged messages.
+    """
+
+    def __init__(self, client, spool, qos=1, max_inflight=20, drain_rate=50.0, drain_batch=100):
+        self.client = client
+        self.spool = spool
+        self.qos = qos
+        self.max_inflight = max_inflight
+        self.drain_rate = drain_rate
+        self.drain_batch = drain_batch
+
+        self.connected = threading.Event()
+        self._stop = threading.Event()
+        self._wake = threading.Event()   # มีของลง spool / ต่อ broker ได้ / stop -> drain thread ตื่น
+        self._lock = threading.Condition()
+        self._inflight = {}       # mid -> spool row id (None = publish ตรง)
+        self._last_sent_id = 0    # row id ล่าสุดที่ส่งจาก spool แล้ว (รอ PUBACK)
+        self._acked = []
+        self._early_acks = set()  # PUBACK ที่มาถึงก่อนบันทึก mid (localhost เร็วมาก)
+        self._volatile = set()    # mid ของ publish_volatile (QoS 0) ไม่เกี่ยวกับ spool
+
+        client.max_inflight_messages_set(max_inflight)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_publish = self._on_publish
+
+        self._thread = threading.Thread(target=self._drain_loop, name="spool-drain", daemon=True)
+        self._thread.start()
+
+    # ---- paho callbacks ----
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            print(f"MQTT connected (spool pending={self.spool.pending})")
+            self.connected.set()
+            self._wake.set()
+        else:
+            print("MQTT connect failed:", rc)
+
+    def _on_disconnect(self, client, userdata, rc):
+        if rc != 0:
+            print("MQTT disconnected, spooling samples to disk")
+        self.connected.clear()
+        with self._lock:
+            self._volatile.clear()   # QoS 0 ที่ยังไม่ได้ส่งถูกทิ้ง ไม่มี callback ตามมา
+
+    def _on_publish(self, client, userdata, mid):
+        # paho เรียก callback นี้ขณะถือ lock ของตัวเอง จึงห้ามเรียก client.* ในขณะถือ self._lock
+        with self._lock:
+            if mid in self._volatile:
+                self._volatile.discard(mid)
+            elif mid in self._inflight:
+                row_id = self._inflight.pop(mid)
+                if row_id is not None:
+                    self._acked.append(row_id)
+            else:
+                self._early_acks.add(mid)
+            self._lock.notify_all()
+
+    def _track(self, mid, row_id):
+        with self._lock:
+            if mid in self._early_acks:
+                self._early_acks.discard(mid)
+                if row_id is not None:
+                    self._acked.append(row_id)
+            else:
+                self._inflight[mid] = row_id
+
+    # ---- public ----
+    def publish(self, topic, payload):
+        """Send now if possible, else keep it on disk. Never blocks on the network."""
+        if self.connected.is_set() and self.spool.pending == 0:
+            with self._lock:
+                window_full = len(self._inflight) >= self.max_inflight
+            if not window_full:
+                info = self.client.publish(topic, payload, qos=self.qos)
+                if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                    if self.qos > 0:
+                        self._track(info.mid, None)
+                    return True
+        self.spool.append(topic, payload)
+        self._wake.set()
+        return False
+
+    def publish_volatile(self, topic, payload):
+        """QoS 0 status message (metrics): never spooled, dropped while disconnected."""
+        if not self.connected.is_set():
+            return False
+        info = self.client.publish(topic, payload, qos=0)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            return False
+        with self._lock:
+            if info.mid in self._early_acks:
+                self._early_acks.discard(info.mid)
+            else:
+                self._volatile.add(info.mid)
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            self._lock.notify_all()
+        self._thread.join(timeout=2)
+        self._flush_acked()
+
+    # ---- drain ----
+    def _flush_acked(self):
+        with self._lock:
+            acked, self._acked = self._acked, []
+        self.spool.delete(acked)
+
+    def _drain_loop(self):
+        interval = 1.0 / self.drain_rate if self.drain_rate > 0 else 0.0
+        while not self._stop.is_set():
+            self._flush_acked()
+
+            if not self.connected.wait(timeout=1.0):
+                continue
+            if self.spool.pending == 0:
+                # ไม่มีอะไรค้าง: หลับจนกว่า publish() ลง spool (pending เพิ่มก่อน set เสมอ)
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            rows = self.spool.peek(self._last_sent_id, self.drain_batch)
+            if not rows:
+                self._stop.wait(0.2)  # ทุกแถวส่งแล้ว รอ PUBACK
+                continue
+
+            print(f"Draining spool: {self.spool.pending} pending")
+            for row_id, topic, payload in rows:
+                with self._lock:
+                    while len(self._inflight) >= self.max_inflight and not self._stop.is_set():
+                        self._lock.wait(timeout=1.0)
+                if self._stop.is_set() or not self.connected.is_set():
+                    break
+
+                info = self.client.publish(topic, bytes(payload), qos=self.qos)
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    break
+                if self.qos > 0:
+                    self._track(info.mid, row_id)
+                else:
+                    with self._lock:
+                        self._acked.append(row_id)
+                self._last_sent_id = row_id
+
+                if interval:
+                    time.sleep(interval)
@@ -1,34 +1,100 @@
-# (write only /iot/data and iot/esp/data to InfluxDB)
+# (write only Pi / ESP32 node data to InfluxDB)
+import argparse
+import fcntl
 import json
+import os
 import base64
 import binascii
+import queue
 import sqlite3
+import threading
+import time
+import zlib
 from datetime import datetime, timezone
 from time import sleep
 
 import paho.mqtt.client as mqtt
 
-from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client import InfluxDBClient, Point, WritePrecision
+from influxdb_client.client.write_api import WriteOptions
 
 import RPi.GPIO as GPIO
 
+from anomaly import AnomalyDetector
+from chili_trend import backfill_chili_counts, init_chili_table, record_chili_count
+from edge_bus import EspReading, PiBatch, encode_message, parse_esp_csv
+from fusion import FusionJoiner
+from latency import CommitTimer, LatencyRecorder, start_metrics_publisher
+from mqtt_archive import ArchiveWriter
+from node_topics import (
+    MQTT_TOPIC_RELAY_FORWARD,
+    SUBSCRIBE_TOPICS,
+    anomaly_topic,
+    metrics_topic,
+    parse_topic,
+    relay_forward_topic,
+    shared_topic,
+)
+from profiling import Profiler
+from rollup import RollupAggregator
+from sample_batch import batch_meta, decode_batch
+
 
 # -------------------- MQTT --------------------
-MQTT_BROKER = "localhost"
-MQTT_PORT   = 1883
+MQTT_BROKER = os.environ.get("MQTT_BROKER", "localhost")
+MQTT_PORT   = int(os.environ.get("MQTT_PORT", 1883))
 
-MQTT_TOPIC_PI     = "/iot/data"        # Pi JSON
-MQTT_TOPIC_ESP    = "iot/esp/data"     # ESP32 CSV
-MQTT_TOPIC_CAMERA = "iot/camera"       # Camera JSON + image
+# ตั้งชื่อกลุ่มเพื่อรันหลาย process แบ่งโหลดกัน (MQTT 5 shared subscription)
+# None = รับทุกข้อความแบบเดิม
+MQTT_SHARE_GROUP = None
 
 
 # -------------------- InfluxDB ----------------
-INFLUX_URL    = "http://localhost:8086"
+INFLUX_URL    = os.environ.get("INFLUX_URL", "http://localhost:8086")
 INFLUX_ORG    = "Student"
 INFLUX_BUCKET = "iot_data"
 INFLUX_TOKEN  = ""
 
+INFLUX_BATCH_SIZE = 500      # จำนวน point ต่อ 1 HTTP write
+INFLUX_FLUSH_MS   = 1000     # flush อย่างน้อยทุก 1 วินาที
+
+
+# -------------------- Rollups --------------------
+# สรุป min/max/mean/count ต่อ node × field ระหว่างรับข้อมูล แล้วเขียนเป็น measurement แยก
+# (ผ่าน write_api batching เดียวกับ raw) ให้ query ช่วงยาว ๆ ไม่ต้อง aggregate raw ทุกครั้ง
+ROLLUPS_ENABLED = True
+ROLLUP_WINDOWS = {
+    "mqtt_data_1m": 60,
+    "mqtt_data_1h": 3600,
+}
+ROLLUP_GRACE_S          = 10.0       # รอ sample ที่มาช้านิดหน่อยก่อนปิด window
+ROLLUP_LATE_POLICY      = "update"   # "drop" = ทิ้ง sample ของ window ที่ปิดแล้ว, "update" = เขียน window นั้นใหม่
+ROLLUP_LATE_RETENTION_S = 6 * 3600   # "update": รับ sample ช้าได้นานสุดเท่านี้หลัง window ปิด
+ROLLUP_FLUSH_PERIOD     = 5.0
+ROLLUP_WRITER           = f"{os.uname().nodename}-{os.getpid()}"   # tag ตอนใช้ shared subscription
+# ปิด process: window ที่ยังไม่ปิด (และที่เก็บไว้รับ sample ช้า) ลงไฟล์นี้ ไม่เขียน Influx ตอนนั้น
+# เปิดใหม่: รวมต่อจากไฟล์แล้วลบทิ้ง ถ้าไม่มีไฟล์ (process ตาย / ครั้งแรก) window ที่เริ่มก่อนเปิด process
+# ถูกข้าม -> rollup ของ window ที่คร่อมตอน restart หายไป แต่ไม่เขียนทับ record ที่ครบแล้วด้วยค่าครึ่งเดียว
+# shared subscription: ไม่ใช้ (series แยกตาม writer = host-pid อยู่แล้ว)
+ROLLUP_STATE_PATH       = "rollup_state.json"
+
+
+# -------------------- Latency metrics --------------------
+# จุดใน Influx ใช้เวลาที่อ่าน sensor จาก payload (ts / <field>_ts) ไม่ใช่เวลาที่เขียน
+# เวลาแต่ละ hop (broker / queue / decode / storage / end_to_end) + seq ที่หายต่อ node (latency.py)
+# ส่งไปที่ iot/metrics/<proc> ทุก METRICS_PERIOD (Dashboard รวมไว้ที่ /api/metrics)
+# shared subscription: แต่ละ process เห็นแค่บาง message ของ node -> ไม่ตรวจ seq (ดูที่ Dashboard แทน)
+METRICS_PERIOD   = 10.0
+RAW_MEASUREMENTS = ("mqtt_data", "ds18b20")   # end_to_end นับเฉพาะค่าดิบ (rollup ใช้เวลาต้น window)
+
+recorder = LatencyRecorder("subscriber")
+commit_timer = CommitTimer(recorder, RAW_MEASUREMENTS)
+
+# -------------------- Profiling --------------------
+# kill -USR1 <pid> = thread dump + tracemalloc diff, kill -USR2 <pid> = sampling profile (profiling.py)
+# ผลอยู่ใน PROFILE_DIR (env, ค่าเริ่มต้น ./profiles)
+profiler = Profiler("subscriber")
+
 
 # -------------------- SQLite สำหรับ camera --------------------
 CAMERA_DB_PATH = "camera_frames.db"
@@ -39,6 +105,97 @@ BUZZER_PIN = 18
 RELAY_PIN  = 27
 RELAY_ACTIVE_LOW = True
 
+# มีแค่ process เดียวที่คุม relay/buzzer (ถือ lock ไฟล์นี้ได้)
+RELAY_LOCK_PATH     = "/tmp/iot_relay_owner.lock"
+RELAY_LEASE_RETRY_S = 5.0
+
+
+# -------------------- Node / Zone --------------------
+# node_id -> zone, zone -> relay pin
+# node ที่ไม่อยู่ใน NODE_ZONES จะใช้ DEFAULT_ZONE
+DEFAULT_ZONE = "lab1"
+
+NODE_ZONES = {
+    "raspi": "lab1",
+    "esp32": "lab1",
+}
+
+ZONE_RELAY_PINS = {
+    "lab1": RELAY_PIN,
+}
+
+
+# -------------------- Sensor fusion --------------------
+# as-of join ของ Pi / ESP32 / กล้องในโซนเดียวกัน (fusion.py)
+#   relay ตัดสินจากค่าที่อายุไม่เกิน FUSION_TOLERANCE_S เท่านั้น (ค่าค้างของ node ที่เงียบไปไม่ถูกใช้)
+#   ทุก FUSION_INTERVAL เขียน 1 point ต่อโซนลง FUSION_MEASUREMENT: ทุก field ที่ยังสด + max_age_s
+#   + "stale" (ชื่อ field ที่เก่าเกิน tolerance, ไม่เขียนค่า)
+# tolerance ต้องมากกว่า heartbeat ของ deadband (MAX_SILENCE 60 s ทั้ง Pi และ ESP32)
+# shared subscription: ทุก process ส่ง sample ต่อให้ตัวที่คุม relay ซึ่งเขียน fused point ตัวเดียว
+FUSION_ENABLED      = True
+FUSION_MEASUREMENT  = "mqtt_fused"
+FUSION_INTERVAL     = 10.0
+FUSION_TOLERANCE_S  = 75.0
+FUSION_GRACE_S      = 5.0     # รอ sample ที่มาช้าก่อนเขียน record ของเวลานั้น
+FUSION_FLUSH_PERIOD = 2.0
+CAMERA_ZONE         = DEFAULT_ZONE   # topic ของกล้องไม่มี node_id
+
+# point ต่อ node ลง "mqtt_data" (แบบเดิม) False = เขียนแค่ fused + rollup (+ ds18b20)
+# sample ที่มาช้ากว่า FUSION_GRACE_S (เช่น spool ของ Pi หลังเน็ตกลับมา) จะมีแค่ใน rollup
+WRITE_RAW_POINTS = True
+
+
+# -------------------- Anomaly detection --------------------
+# ตรวจทุก sample ต่อ node × field (anomaly.py) ส่ง event ไป iot/anomaly/<node_id> และ ANOMALY_MEASUREMENT
+# field ที่มี fault (range / rate / flatline) ของ node นั้นไม่ถูกใช้ตัดสิน relay จนกว่า fault จะหาย
+# shared subscription: ตรวจที่ตัวที่คุม relay ตัวเดียว (ได้ sample ของทุก node ผ่าน fusion forward)
+ANOMALY_ENABLED          = True
+ANOMALY_MEASUREMENT      = "sensor_anomaly"
+ANOMALY_TAU_S            = 900.0    # mean / variance ลืมค่าที่เก่ากว่า ~15 นาที
+ANOMALY_Z                = 6.0
+ANOMALY_WARMUP           = 30       # จำนวน sample ก่อนเริ่มตรวจ spike
+ANOMALY_SPIKE_INTERVAL_S = 60.0     # spike ของ node × field เดียวกันส่งไม่ถี่กว่านี้
+
+# field: (ต่ำสุด, สูงสุด, เปลี่ยนได้เร็วสุดต่อวินาที, ค่าเดิมนานสุด s, std ขั้นต่ำ)  None = ไม่ตรวจ
+# heartbeat ของ deadband (60 s) ส่งค่าเดิมซ้ำได้ -> flat-line ต้องนานกว่านั้นมาก
+# light กลางคืน = 0 ทั้งคืน -> ไม่ตรวจ flat-line
+# humidity DHT11 ละเอียดแค่ 1 % + deadband -> ห้องที่นิ่งได้ค่าเดิม (heartbeat) หลายชั่วโมงจริง -> ไม่ตรวจ flat-line
+# co2 / soil จาก ESP32 เป็นค่า analogRead ดิบ (12 bit, 0-4095) ไม่ใช่ ppm / %:
+#   0 = สายหลุด / ลัดลง GND, 4095 = ADC อิ่มตัว -> ช่วงที่รับได้คือ 1-4094
+# DHT11 อ่านไม่ได้ (NaN) ESP32 ไม่ส่งทั้ง message -> node เงียบ, fusion ไม่ใช้ค่าที่เก่าเกิน FUSION_TOLERANCE_S
+ANOMALY_LIMITS = {
+    "temperature": (-10.0, 60.0, 1.0, 3600.0, 0.2),
+    "humidity":    (5.0, 100.0, 5.0, None, 1.0),        # DHT11
+    "co2":         (1.0, 4094.0, 200.0, 900.0, 20.0),   # MQ135 (ADC): ค่า analog ไม่นิ่งเป๊ะ 15 นาที
+    "soil":        (1.0, 4094.0, 150.0, 3600.0, 15.0),  # soil moisture (ADC), deadband 20
+    "light":       (0.0, 65535.0, None, None, 5.0),      # BH1750 เปิด / ปิดไฟเปลี่ยนทันทีได้
+}
+
+
+# -------------------- Raw message archive --------------------
+# เก็บทุก message ที่รับ (topic, เวลาที่รับ, payload) ลง segment file (mqtt_archive.py) ไว้ประมวลผลใหม่
+# ด้วย replay.py หลังแก้ decode / rollup / anomaly  เปิดด้วย --archive [DIR]
+# ไม่เก็บภาพกล้อง (~100 KB ต่อ message, อยู่ใน camera_frames.db แล้ว) และ relay forward (ซ้ำกับ process ต้นทาง)
+ARCHIVE_DIR         = "mqtt_archive"
+ARCHIVE_KINDS       = ("pi", "pi_batch", "esp")
+ARCHIVE_SEGMENT_S   = 3600.0
+ARCHIVE_RETENTION_S = 35 * 86400.0
+ARCHIVE_MAX_BYTES   = 4 * 1024 ** 3
+
+archiver = None
+
+# เวลาปัจจุบันของ pipeline (rollup ใช้ตัดสินว่า sample มาช้า) replay.py แทนด้วยเวลาที่รับ message เดิม
+clock = time.time
+
+
+# -------------------- Ingest workers --------------------
+# node ถูกแบ่งไปแต่ละ worker ตาม hash ของ node_id
+# (node เดียวกันอยู่ worker เดิมเสมอ -> ลำดับข้อความของ node ไม่สลับกัน)
+INGEST_WORKERS   = 4
+INGEST_QUEUE_MAX = 10000
+
+LOG_MESSAGES = True
+
 
 # -------------------- Threshold --------------------
 TEMP_ON  = 21.0
@@ -51,21 +208,102 @@ CO2_ON   = 400.0
 CO2_OFF  = 800.0
 
 
-# -------------------- GLOBAL SENSOR CACHE --------------------
-last_temp = None
-last_hum  = None
-last_co2  = None
+# -------------------- NODE STATE --------------------
+class NodeState:
+    """Latest readings of one node (Pi or ESP32)."""
+    __slots__ = ("node_id", "zone", "temp", "light", "hum", "co2", "soil", "updated_at")
+
+    def __init__(self, node_id, zone):
+        self.node_id = node_id
+        self.zone = zone
+        self.temp = None
+        self.light = None
+        self.hum = None
+        self.co2 = None
+        self.soil = None
+        self.updated_at = None
+
+
+nodes = {}          # node_id -> NodeState
+zone_nodes = {}     # zone -> [NodeState, ...]
+nodes_lock = threading.Lock()
+
+zone_locks = {zone: threading.Lock() for zone in ZONE_RELAY_PINS}
+
+
+def zone_of(node_id):
+    return NODE_ZONES.get(node_id, DEFAULT_ZONE)
+
+
+def get_node(node_id):
+    state = nodes.get(node_id)
+    if state is not None:
+        return state
+
+    with nodes_lock:
+        state = nodes.get(node_id)
+        if state is None:
+            state = NodeState(node_id, zone_of(node_id))
+            zone_nodes.setdefault(state.zone, []).append(state)
+            nodes[node_id] = state
+            print(f"New node '{node_id}' -> zone '{state.zone}'")
+    return state
 
 
 # -------------------- Setup GPIO --------------------
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(RELAY_PIN, GPIO.OUT)
-GPIO.setup(BUZZER_PIN, GPIO.OUT)
-GPIO.output(BUZZER_PIN, GPIO.LOW)
+def setup_gpio():
+    GPIO.setmode(GPIO.BCM)
+    for pin in ZONE_RELAY_PINS.values():
+        GPIO.setup(pin, GPIO.OUT)
+    GPIO.setup(BUZZER_PIN, GPIO.OUT)
+    GPIO.output(BUZZER_PIN, GPIO.LOW)
+
+
+# -------------------- Relay ownership --------------------
+relay_owner = False
+relay_lock_file = None
+mqtt_client = None
+
+
+def try_acquire_relay():
+    """
+    Take the relay lock without blocking. Only the owner drives GPIO;
+    the lock is released by the OS when the owning process exits.
+    """
+    global relay_owner, relay_lock_file
+
+    if relay_owner:
+        return True
+
+    f = open(RELAY_LOCK_PATH, "a+")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+
+    f.seek(0)
+    f.truncate()
+    f.write(str(os.getpid()))
+    f.flush()
+
+    relay_lock_file = f
+    setup_gpio()
+    relay_owner = True
+    print(f"Relay owner: this process (pid={os.getpid()})")
+
+    if MQTT_SHARE_GROUP and mqtt_client is not None:
+        mqtt_client.subscribe(MQTT_TOPIC_RELAY_FORWARD)
+    return True
+
+
+def relay_lease_loop():
+    while not try_acquire_relay():
+        sleep(RELAY_LEASE_RETRY_S)
 
 
 # -------------------- Relay Logic --------------------
-def update_relay_by_conditions(temp=None, hum=None, co2=None):
+def update_relay_by_conditions(temp=None, hum=None, co2=None, relay_pin=RELAY_PIN):
     relay_on = False
 
     if temp is not None and not (TEMP_ON <= temp <= TEMP_OFF):
@@ -78,11 +316,11 @@ def update_relay_by_conditions(temp=None, hum=None, co2=None):
         relay_on = True
 
     should_state = GPIO.HIGH if relay_on else GPIO.LOW
-    current = GPIO.input(RELAY_PIN)
+    current = GPIO.input(relay_pin)
 
     if current != should_state:
-        GPIO.output(RELAY_PIN, should_state)
-        print(f"Relay {'ON' if relay_on else 'OFF'} (Temp={temp}, Hum={hum}, CO2={co2})")
+        GPIO.output(relay_pin, should_state)
+        print(f"Relay {relay_pin} {'ON' if relay_on else 'OFF'} (Temp={temp}, Hum={hum}, CO2={co2})")
 
         if relay_on:
             pwm = GPIO.PWM(BUZZER_PIN, 1000)
@@ -92,9 +330,48 @@ def update_relay_by_conditions(temp=None, hum=None, co2=None):
             GPIO.output(BUZZER_PIN, GPIO.LOW)
 
 
+def update_zone_relay(zone):
+    """
+    Evaluate the relay of one zone from its fused record as of now.
+    Only inputs younger than FUSION_TOLERANCE_S count; the relay turns on
+    if any of them is out of range.
+    """
+    relay_pin = ZONE_RELAY_PINS.get(zone)
+    if relay_pin is None or not relay_owner:
+        return
+
+    limits = {"temperature": (TEMP_ON, TEMP_OFF), "humidity": (HUM_ON, HUM_OFF), "co2": (CO2_ON, CO2_OFF)}
+    record = fusion.asof(zone, fields=limits)
+    picked = {}
+    faulted = []
+    for field, (low, high) in limits.items():
+        # เลือกค่าที่ "หลุดช่วง" ก่อน เพื่อให้ relay ติดถ้า node ใด node หนึ่งผิดปกติ
+        # ยกเว้น sensor ที่ anomaly detector บอกว่าเสีย (ค่าหลุดช่วงเพราะ sensor ไม่ใช่เพราะอากาศ)
+        value = None
+        for source, v, _ in record.inputs.get(field, ()):
+            if anomalies.faulted(source, field):
+                faulted.append(f"{source}/{field}")
+                continue
+            if value is None or not (low <= v <= high):
+                value = v
+        picked[field] = value
+
+    if faulted and LOG_MESSAGES:
+        print(f"Zone {zone}: ignoring faulted sensors ({', '.join(faulted)})")
+
+    if record.stale and LOG_MESSAGES:
+        ages = ", ".join(f"{f} {age:.0f}s" for f, age in sorted(record.stale.items()))
+        print(f"Zone {zone}: ignoring stale inputs ({ages})")
+
+    with zone_locks[zone]:
+        update_relay_by_conditions(picked["temperature"], picked["humidity"], picked["co2"], relay_pin=relay_pin)
+
+
 # -------------------- Camera DB --------------------
 def init_camera_db():
     conn = sqlite3.connect(CAMERA_DB_PATH)
+    # WAL: Dashboard อ่าน gallery ได้พร้อมกับที่ subscriber เขียน
+    conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("""
     CREATE TABLE IF NOT EXISTS images (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -106,17 +383,32 @@ def init_camera_db():
         jpg BLOB NOT NULL
     )
     """)
+    # gallery (Dashboard) แบ่งหน้าแบบ keyset ตาม id และกรองตามเวลา / chili_count
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_images_created_at ON images (created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_images_chili_count ON images (chili_count, id)")
+    conn.commit()
+
+    # จำนวนพริกต่อชั่วโมง (chili_trend.py) ให้ Dashboard ดู trend โดยไม่ต้อง scan images
+    # ตารางยังว่างแต่มีภาพเก่า -> สร้างจาก images ครั้งเดียว (lock ไว้กันภาพใหม่แทรกระหว่างสร้าง)
+    init_chili_table(conn)
+    conn.execute("BEGIN IMMEDIATE")
+    if (conn.execute("SELECT NOT EXISTS (SELECT 1 FROM chili_hourly)").fetchone()[0]
+            and conn.execute("SELECT EXISTS (SELECT 1 FROM images)").fetchone()[0]):
+        print(f"Chili trend: backfilled {backfill_chili_counts(conn)} hours from images")
     conn.commit()
     conn.close()
     print("Camera SQLite DB ready")
 
 
-def save_camera_image(jpg_bytes, width, height, fps, chili_count):
+def save_camera_image(jpg_bytes, width, height, fps, chili_count, captured_at=None):
+    """captured_at = เวลาถ่ายภาพ (epoch s) จาก payload, ไม่มี = เวลาที่บันทึก"""
+    started = time.time()
+    created = datetime.fromtimestamp(captured_at or started, timezone.utc)
     conn = sqlite3.connect(CAMERA_DB_PATH)
     conn.execute(
         "INSERT INTO images (created_at, width, height, fps, chili_count, jpg) VALUES (?, ?, ?, ?, ?, ?)",
         (
-            datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            created.isoformat(timespec="seconds"),
             width,
             height,
             fps,
@@ -124,490 +416,711 @@ def save_camera_image(jpg_bytes, width, height, fps, chili_count):
             sqlite3.Binary(jpg_bytes),
         )
     )
+    record_chili_count(conn, created.timestamp(), chili_count)
     conn.commit()
     conn.close()
+    committed = time.time()
+    recorder.observe_since("storage", started, committed)
+    recorder.observe_since("end_to_end", captured_at, committed)
 
-    print(f"Saved camera frame size={width}x{height}, fps={fps}, chili={chili_count}")
+    if LOG_MESSAGES:
+        print(f"Saved camera frame size={width}x{height}, fps={fps}, chili={chili_count}")
 
 
 # -------------------- InfluxDB Setup --------------------
-try:
-    influx_client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
-    write_api = influx_client.write_api(write_options=SYNCHRONOUS)
-    print("Connected to InfluxDB")
-except Exception as e:
-    print("InfluxDB connect error:", e)
-    GPIO.cleanup()
-    raise SystemExit(1)
+def on_influx_success(conf, data):
+    commit_timer.committed(data)
+    if LOG_MESSAGES:
+        print(f"Written batch to InfluxDB ({len(data.splitlines())} points)")
+
+
+def on_influx_error(conf, data, exception):
+    commit_timer.failed(data)
+    print("Error writing batch to InfluxDB:", exception)
+
+
+# สร้างตอน start_pipeline() (หรือ replay.py เมื่อจะเขียนจริง) ไม่ใช่ตอน import
+# -> import เพื่อใช้ handler / --help ไม่เปิด client ไป Influx และไม่สร้าง camera_frames.db
+influx_client = None
+write_api = None
 
-init_camera_db()
+
+def open_influx():
+    """Create the batching write_api once."""
+    global influx_client, write_api
+    if write_api is not None:
+        return
+    try:
+        influx_client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
+        write_api = influx_client.write_api(
+            write_options=WriteOptions(batch_size=INFLUX_BATCH_SIZE, flush_interval=INFLUX_FLUSH_MS),
+            success_callback=on_influx_success,
+            error_callback=on_influx_error,
+        )
+        print("Connected to InfluxDB")
+    except Exception as e:
+        print("InfluxDB connect error:", e)
+        raise SystemExit(1)
+
+
+def close_influx():
+    if write_api is not None:
+        write_api.close()
 
 
 # -------------------- Helper: write functions --------------------
-def write_pi_to_influx(temperature=None, light=None):
+def influx_write(record, times_ns):
+    """Hand points to the batching write_api; times_ns = their timestamps (storage latency)."""
+    commit_timer.queued(times_ns)
+    write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=record)
+
+
+def write_pi_to_influx(temperature=None, light=None, node_id="raspi", zone=DEFAULT_ZONE, ts=None):
     """
-    Write Pi data to measurement 'mqtt_data' with tag node='raspi'
+    Write Pi data to measurement 'mqtt_data' with tag node=<node_id> at time ts (epoch s)
     """
     try:
-        p = Point("mqtt_data").tag("location", "lab1").tag("node", "raspi")
+        t_ns = int((ts or time.time()) * 1e9)
+        p = Point("mqtt_data").tag("location", zone).tag("node", node_id).time(t_ns, WritePrecision.NS)
         if temperature is not None:
             p = p.field("temperature", float(temperature))
         if light is not None:
             p = p.field("light", float(light))
-        write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=p)
-        print("Written Pi data to InfluxDB:", {"temperature": temperature, "light": light})
+        influx_write(p, (t_ns,))
     except Exception as e:
         print("Error writing Pi data to InfluxDB:", e)
 
 
-def write_esp_to_influx(co2=None, humidity=None, soil=None):
+def write_probes_to_influx(probes, node_id="raspi", zone=DEFAULT_ZONE, ts=None):
     """
-    Write ESP32 data to measurement 'mqtt_data' with tag node='esp32'
+    Write every DS18B20 probe of a Pi to measurement 'ds18b20' with tag probe=<ROM id>
     """
     try:
-        p = Point("mqtt_data").tag("location", "lab1").tag("node", "esp32")
+        t_ns = int((ts or time.time()) * 1e9)
+        points = [
+            Point("ds18b20").tag("location", zone).tag("node", node_id).tag("probe", rom)
+            .field("temperature", float(value)).time(t_ns, WritePrecision.NS)
+            for rom, value in probes.items()
+            if value is not None
+        ]
+        if points:
+            influx_write(points, (t_ns,))
+    except Exception as e:
+        print("Error writing DS18B20 probes to InfluxDB:", e)
+
+
+def write_esp_to_influx(co2=None, humidity=None, soil=None, node_id="esp32", zone=DEFAULT_ZONE, ts=None):
+    """
+    Write ESP32 data to measurement 'mqtt_data' with tag node=<node_id> at time ts (epoch s)
+    """
+    try:
+        t_ns = int((ts or time.time()) * 1e9)
+        p = Point("mqtt_data").tag("location", zone).tag("node", node_id).time(t_ns, WritePrecision.NS)
         if co2 is not None:
             p = p.field("co2", float(co2))
         if humidity is not None:
             p = p.field("humidity", float(humidity))
         if soil is not None:
             p = p.field("soil", float(soil))
-        write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=p)
-        print("Written ESP32 data to InfluxDB:", {"co2": co2, "humidity": humidity, "soil": soil})
+        influx_write(p, (t_ns,))
     except Exception as e:
         print("Error writing ESP32 data to InfluxDB:", e)
 
 
-# -------------------- MQTT CALLBACK --------------------
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        print("MQTT connected")
-        client.subscribe(MQTT_TOPIC_PI)
-        client.subscribe(MQTT_TOPIC_ESP)
-        client.subscribe(MQTT_TOPIC_CAMERA)
-    else:
-        print("MQTT connect failed:", rc)
-
-
-def on_message(client, userdata, msg):
-    global last_temp, last_hum, last_co2
+# -------------------- Rollups --------------------
+rollups = []
 
-    print("\n=== MQTT MESSAGE ===")
-    print("Topic:", msg.topic)
 
-    # ---------------- Camera (do NOT write to Influx) ----------------
-    if msg.topic == MQTT_TOPIC_CAMERA:
-        try:
-            payload = json.loads(msg.payload.decode("utf-8"))
-        except Exception as e:
-            print("JSON decode error (Camera):", e)
-            print("Raw payload (truncated):", msg.payload[:200], "...")
-            return
+def emit_rollup(measurement, node_id, zone, start, stats):
+    p = Point(measurement).tag("location", zone).tag("node", node_id)
+    if MQTT_SHARE_GROUP:
+        # แต่ละ process เห็นแค่บาง message ของ node -> แยก series กันไม่ให้เขียนทับกัน
+        p = p.tag("writer", ROLLUP_WRITER)
+    for field, (count, mean, vmin, vmax) in stats.items():
+        p = (p.field(field, mean).field(f"{field}_min", vmin)
+             .field(f"{field}_max", vmax).field(f"{field}_count", count))
+    t_ns = int(start * 1e9)
+    p = p.time(t_ns, WritePrecision.NS)
+    try:
+        influx_write(p, (t_ns,))
+    except Exception as e:
+        print(f"Error writing {measurement} rollup to InfluxDB:", e)
 
-        cam = payload.get("camera", {}) or {}
-        img_b64 = payload.get("image") or payload.get("img")  # support both names
 
-        if not img_b64:
-            print("⚠ Camera message has no 'image' field, skip saving image.")
-            return
+def record_rollup(node_id, zone, values, ts=None):
+    now = clock()
+    for r in rollups:
+        r.add(node_id, zone, values, ts, now)
 
-        try:
-            decoded = base64.b64decode(img_b64.strip(), validate=True)
-        except Exception as e:
-            print("⚠ base64 decode error (Camera):", e)
-            return
 
-        width  = cam.get("width")
-        height = cam.get("height")
-        fps    = cam.get("fps")
-        chili_count = cam.get("chili_count")
+def rollup_loop():
+    while True:
+        sleep(ROLLUP_FLUSH_PERIOD)
+        for r in rollups:
+            r.flush()
 
-        print(f"Camera -> chili_count={chili_count}, fps={fps}, size={width}x{height}")
 
+def start_rollups(late_policy=ROLLUP_LATE_POLICY, flush_thread=True, state_path=None):
+    """
+    flush_thread=False: the caller flushes (replay.py, on the replayed clock).
+    state_path: resume the windows saved by save_rollups(); without the file, skip
+    the windows that started before now instead of overwriting them.
+    """
+    rollups[:] = [
+        RollupAggregator(measurement, window_s, emit_rollup, grace_s=ROLLUP_GRACE_S,
+                         late_policy=late_policy, late_retention_s=ROLLUP_LATE_RETENTION_S)
+        for measurement, window_s in ROLLUP_WINDOWS.items()
+    ]
+    if state_path is not None:
         try:
-            save_camera_image(decoded, width, height, fps, chili_count)
-        except Exception as e:
-            print(" Error saving camera image to SQLite:", e)
-
-        # Do NOT write camera metadata to Influx — per request
+            with open(state_path) as f:
+                state = json.load(f)
+            os.remove(state_path)    # ใช้ครั้งเดียว: ตายรอบหน้าต้องไม่กลับไปรวมจาก state เก่า
+        except FileNotFoundError:
+            state = None
+        except (OSError, ValueError) as e:
+            print("Rollup state unreadable, starting fresh:", e)
+            state = None
+        for r in rollups:
+            if state is not None and r.measurement in state:
+                r.restore(state[r.measurement])
+            else:
+                r.min_start = clock()
+        if state is not None:
+            print(f"Rollups resumed {sum(len(w) for w in state.values())} windows from {state_path}")
+    if flush_thread:
+        threading.Thread(target=rollup_loop, name="rollup-flush", daemon=True).start()
+
+
+def save_rollups(state_path):
+    """Shutdown: write closed windows, keep the rest in state_path for the next start."""
+    if not rollups:
         return
+    for r in rollups:
+        r.flush(clock())
+    state = {r.measurement: r.dump() for r in rollups}
+    tmp = state_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_path)
+
+
+# -------------------- Sensor fusion --------------------
+fusion_started = False
+
+
+def emit_fused(record):
+    if MQTT_SHARE_GROUP and not relay_owner:
+        return   # ตัวที่คุม relay ได้ sample ของทุก node (ส่งต่อมา) -> เขียนตัวเดียว
+    t_ns = int(record.ts * 1e9)
+    p = Point(FUSION_MEASUREMENT).tag("location", record.zone).time(t_ns, WritePrecision.NS)
+    for field, value in record.values().items():
+        p = p.field(field, float(value))
+    p = p.field("max_age_s", round(record.max_age(), 3))
+    if record.stale:
+        p = p.field("stale", ",".join(sorted(record.stale)))
+    try:
+        influx_write(p, (t_ns,))
+    except Exception as e:
+        print("Error writing fused record to InfluxDB:", e)
 
-    # ---------------- Pi JSON ----------------
-    if msg.topic == MQTT_TOPIC_PI:
-        try:
-            data = json.loads(msg.payload.decode("utf-8"))
-        except Exception as e:
-            print("Pi JSON decode error:", e)
-            return
 
-        pi = data.get("pi", {}) or {}
-        temp = pi.get("temperature")
-        light = pi.get("light")
+fusion = FusionJoiner(FUSION_INTERVAL, FUSION_TOLERANCE_S, emit_fused, grace_s=FUSION_GRACE_S)
 
-        # update cache for relay
-        try:
-            last_temp = float(temp) if temp is not None else None
-        except Exception:
-            last_temp = None
 
-        try:
-            last_light = float(light) if light is not None else None
-        except Exception:
-            last_light = None
+def fuse(node_id, zone, samples):
+    """
+    samples = [(ts, {field: value}), ...]: feed the as-of joiner and the anomaly detector,
+    and pass them on to the relay owner.
+    """
+    detect = anomaly_checks_here()
+    for ts, values in samples:
+        fusion.add(zone, node_id, values, ts)
+        if detect:
+            anomalies.add(node_id, zone, values, ts)
+    forward_to_relay_owner(node_id, zone, samples)
+
+
+def fusion_loop():
+    reported = 0
+    while True:
+        sleep(FUSION_FLUSH_PERIOD)
+        fusion.flush()
+        late = fusion.late
+        if late > reported:
+            recorder.count("fusion_late", late - reported)
+            reported = late
+
+
+def start_fusion(flush_thread=True):
+    global fusion_started
+    fusion_started = True
+    if flush_thread:
+        threading.Thread(target=fusion_loop, name="fusion-flush", daemon=True).start()
+
+
+def flush_fusion():
+    """Write the records up to now (shutdown)."""
+    if fusion_started:
+        fusion.flush(force=True)
+
+
+# -------------------- Anomaly detection --------------------
+def emit_anomaly(event):
+    recorder.count(f"anomaly_{event.kind}")
+    if event.state != "event" or LOG_MESSAGES:
+        print(f"Anomaly {event.state}: {event.node_id}/{event.field} {event.kind} value={event.value} {event.detail}")
+
+    if mqtt_client is not None:
+        mqtt_client.publish(anomaly_topic(event.node_id), json.dumps(event.to_dict()), qos=1)
+
+    t_ns = int(event.ts * 1e9)
+    p = (Point(ANOMALY_MEASUREMENT).tag("location", event.zone).tag("node", event.node_id)
+         .tag("field", event.field).tag("kind", event.kind).field("state", event.state)
+         .time(t_ns, WritePrecision.NS))
+    for key, value in (("value", event.value), *event.detail.items()):
+        p = p.field(key, float(value))   # NaN ถูกข้ามตอนเขียน
+    try:
+        influx_write(p, (t_ns,))
+    except Exception as e:
+        print("Error writing anomaly to InfluxDB:", e)
 
-        print(f"Pi -> Temp={last_temp}, Light={last_light}")
 
-        # write ONLY Pi fields to Influx (same measurement "mqtt_data")
-        write_pi_to_influx(temperature=last_temp, light=last_light)
+anomalies = AnomalyDetector(ANOMALY_LIMITS, emit_anomaly, tau_s=ANOMALY_TAU_S, z=ANOMALY_Z,
+                            warmup=ANOMALY_WARMUP, spike_interval_s=ANOMALY_SPIKE_INTERVAL_S)
 
-        # update relay with freshest values (use cached last_hum/last_co2)
-        update_relay_by_conditions(last_temp, last_hum, last_co2)
-        return
 
-    # ---------------- ESP32 CSV ----------------
-    if msg.topic == MQTT_TOPIC_ESP:
+def anomaly_checks_here():
+    # shared subscription: แต่ละ process เห็นแค่บาง message ของ node -> ตรวจที่ relay owner ตัวเดียว
+    return ANOMALY_ENABLED and (not MQTT_SHARE_GROUP or relay_owner)
+
+
+# -------------------- Message handlers --------------------
+def handle_camera(payload_bytes, rx_ts=None):
+    if isinstance(payload_bytes, dict):
+        payload = payload_bytes    # edge_bus: ภาพเป็น bytes อยู่แล้วใน "jpg"
+        decoded = payload.get("jpg")
+        if not decoded:
+            print("⚠ Camera message has no image, skip saving image.")
+            return
+    else:
         try:
-            parts = msg.payload.decode("utf-8").strip().split(',')
-            if len(parts) != 3:
-                print("ESP32 CSV format error:", parts)
-                return
-            co2_val = float(parts[0])
-            hum_val = float(parts[1])
-            soil_val = float(parts[2])
-            last_co2 = co2_val
-            last_hum = hum_val
-            last_soil = soil_val
+            payload = json.loads(payload_bytes.decode("utf-8"))
         except Exception as e:
-            print("❌ ESP32 CSV parse error:", e, "payload:", msg.payload)
+            print("JSON decode error (Camera):", e)
+            print("Raw payload (truncated):", payload_bytes[:200], "...")
             return
 
-        print(f"ESP32 -> CO2={last_co2}, Hum={last_hum}, Soil={last_soil}")
+        img_b64 = payload.get("image") or payload.get("img")  # support both names
 
-        # write ONLY ESP32 fields to Influx (same measurement "mqtt_data")
-        write_esp_to_influx(co2=last_co2, humidity=last_hum, soil=last_soil)
+        if not img_b64:
+            print("⚠ Camera message has no 'image' field, skip saving image.")
+            return
 
-        # update relay with freshest values (use cached last_temp)
-        update_relay_by_conditions(last_temp, last_hum, last_co2)
-        return
+        try:
+            decoded = base64.b64decode(img_b64.strip(), validate=True)
+        except (binascii.Error, ValueError) as e:
+            print("⚠ base64 decode error (Camera):", e)
+            return
 
+    cam = payload.get("camera", {}) or {}
 
-# -------------------- MAIN --------------------
-def main():
-    client = mqtt.Client()
-    client.on_connect = on_connect
-    client.on_message = on_message
+    recorder.received("camera", payload.get("seq"), payload.get("sent_ts"), rx_ts)
 
-    print("Connecting to MQTT broker...")
-    client.connect(MQTT_BROKER, MQTT_PORT, 60)
-    client.loop_forever()
+    width  = cam.get("width")
+    height = cam.get("height")
+    fps    = cam.get("fps")
+    chili_count = cam.get("chili_count")
 
+    if LOG_MESSAGES:
+        print(f"Camera -> chili_count={chili_count}, fps={fps}, size={width}x{height}")
 
-if __name__ == "__main__":
     try:
-        main()
-    except KeyboardInterrupt:
-        pass
-    finally:
-        GPIO.output(BUZZER_PIN, GPIO.LOW)
-        GPIO.cleanup()
-        print("GPIO cleaned up.")# subscriber_all.py  (write only /iot/data and iot/esp/data to InfluxDB)
-import json
-import base64
-import binascii
-import sqlite3
-from datetime import datetime, timezone
-from time import sleep
-
-import paho.mqtt.client as mqtt
-
-from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS
-
-import RPi.GPIO as GPIO
-
-
-# -------------------- MQTT --------------------
-MQTT_BROKER = "localhost"
-MQTT_PORT   = 1883
-
-MQTT_TOPIC_PI     = "/iot/data"        # Pi JSON
-MQTT_TOPIC_ESP    = "iot/esp/data"     # ESP32 CSV
-MQTT_TOPIC_CAMERA = "iot/camera"       # Camera JSON + image
-
-
-# -------------------- InfluxDB ----------------
-INFLUX_URL    = "http://localhost:8086"
-INFLUX_ORG    = "Student"
-INFLUX_BUCKET = "iot_data"
-INFLUX_TOKEN  = "vbcRlrUlawg5-2BrLG4gmWIwuaITSvb_96aANkH4CWUDzgiWSEioSs0pd9UbgsjJkHf8PdaUVRa_xLTKbvOwow=="
-
-
-# -------------------- SQLite สำหรับ camera --------------------
-CAMERA_DB_PATH = "camera_frames.db"
-
-
-# -------------------- GPIO --------------------
-BUZZER_PIN = 18
-RELAY_PIN  = 27
-RELAY_ACTIVE_LOW = True
+        save_camera_image(decoded, width, height, fps, chili_count, captured_at=payload.get("ts"))
+    except Exception as e:
+        print(" Error saving camera image to SQLite:", e)
 
+    fuse("camera", CAMERA_ZONE, [(payload.get("ts") or rx_ts, {"chili_count": chili_count})])
 
-# -------------------- Threshold --------------------
-TEMP_ON  = 21.0
-TEMP_OFF = 26.0
+    # Do NOT write camera metadata to Influx — per request
 
-HUM_ON   = 50.0
-HUM_OFF  = 80.0
-
-CO2_ON   = 400.0
-CO2_OFF  = 800.0
 
+def handle_pi(node_id, payload_bytes, rx_ts=None):
+    try:
+        data = payload_bytes if isinstance(payload_bytes, dict) else json.loads(payload_bytes.decode("utf-8"))
+    except Exception as e:
+        print(f"Pi JSON decode error ({node_id}):", e)
+        return
+    recorder.received(f"pi/{node_id}", data.get("seq"), data.get("sent_ts"), rx_ts)
 
-# -------------------- GLOBAL SENSOR CACHE --------------------
-last_temp = None
-last_hum  = None
-last_co2  = None
+    pi = data.get("pi", {}) or {}
+    temp = pi.get("temperature")
+    light = pi.get("light")
 
+    state = get_node(node_id)
 
-# -------------------- Setup GPIO --------------------
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(RELAY_PIN, GPIO.OUT)
-GPIO.setup(BUZZER_PIN, GPIO.OUT)
-GPIO.output(BUZZER_PIN, GPIO.LOW)
+    # update cache for relay
+    # deadband-compressed payload ("compression" in data) ส่งเฉพาะ field ที่เปลี่ยน
+    # field ที่ไม่มีใน payload = ค่าเดิม จึงไม่ล้าง cache
+    if "temperature" in pi:
+        try:
+            state.temp = float(temp) if temp is not None else None
+        except Exception:
+            state.temp = None
+    else:
+        temp = None
 
+    if "light" in pi:
+        try:
+            state.light = float(light) if light is not None else None
+        except Exception:
+            state.light = None
+    else:
+        light = None
 
-# -------------------- Relay Logic --------------------
-def update_relay_by_conditions(temp=None, hum=None, co2=None):
-    relay_on = False
+    state.updated_at = datetime.now(timezone.utc)
 
-    if temp is not None and not (TEMP_ON <= temp <= TEMP_OFF):
-        relay_on = True
+    if LOG_MESSAGES:
+        print(f"Pi[{node_id}] -> Temp={state.temp}, Light={state.light}")
 
-    if hum is not None and not (HUM_ON <= hum <= HUM_OFF):
-        relay_on = True
+    # write ONLY Pi fields to Influx (same measurement "mqtt_data")
+    # แต่ละ field ใช้เวลาที่อ่าน sensor (<field>_ts) อ่านคนละเวลา = คนละ point
+    by_ts = {}
+    for field, value in (("temperature", state.temp if temp is not None else None),
+                         ("light", state.light if light is not None else None)):
+        if value is not None:
+            by_ts.setdefault(pi.get(f"{field}_ts") or rx_ts, {})[field] = value
+    for ts, values in by_ts.items():
+        if WRITE_RAW_POINTS:
+            write_pi_to_influx(**values, node_id=node_id, zone=state.zone, ts=ts)
+        record_rollup(node_id, state.zone, values, ts)
+    fuse(node_id, state.zone, list(by_ts.items()))
 
-    if co2 is not None and not (CO2_ON <= co2 <= CO2_OFF):
-        relay_on = True
+    # ทุก probe ของ node นี้ (ดิน/อากาศหลายระดับ)
+    probes = pi.get("probes")
+    if isinstance(probes, dict):
+        write_probes_to_influx(probes, node_id=node_id, zone=state.zone, ts=pi.get("probes_ts") or rx_ts)
 
-    should_state = GPIO.HIGH if relay_on else GPIO.LOW
-    current = GPIO.input(RELAY_PIN)
+    # update relay of this node's zone
+    update_zone_relay(state.zone)
 
-    if current != should_state:
-        GPIO.output(RELAY_PIN, should_state)
-        print(f"Relay {'ON' if relay_on else 'OFF'} (Temp={temp}, Hum={hum}, CO2={co2})")
 
-        if relay_on:
-            pwm = GPIO.PWM(BUZZER_PIN, 1000)
-            pwm.start(50)
-            sleep(1)
-            pwm.stop()
-            GPIO.output(BUZZER_PIN, GPIO.LOW)
+def handle_pi_batch(node_id, payload_bytes, rx_ts=None):
+    """
+    Decode a binary sample batch in one pass and write it as one Influx batch
+    (points keep the time each sample was read).
+    """
+    try:
+        if isinstance(payload_bytes, PiBatch):
+            fields, rows, seq, sent_ts = payload_bytes
+        else:
+            fields, rows = decode_batch(payload_bytes)
+            seq, sent_ts = batch_meta(payload_bytes)
+    except Exception as e:
+        print(f"Pi batch decode error ({node_id}):", e)
+        return
+    recorder.received(f"pi_batch/{node_id}", seq, sent_ts, rx_ts)
+    if not rows:
+        return
 
+    state = get_node(node_id)
+    idx_temp = fields.index("temperature") if "temperature" in fields else None
+    idx_light = fields.index("light") if "light" in fields else None
+    probe_cols = [(i, f[len("probe:"):]) for i, f in enumerate(fields) if f.startswith("probe:")]
+
+    points = []
+    samples = []
+    for ts, values in rows:
+        t_ns = int(ts * 1e9)
+        p = Point("mqtt_data").tag("location", state.zone).tag("node", node_id).time(t_ns, WritePrecision.NS)
+        has_field = False
+        if idx_temp is not None and values[idx_temp] is not None:
+            p = p.field("temperature", values[idx_temp])
+            state.temp = values[idx_temp]
+            has_field = True
+        if idx_light is not None and values[idx_light] is not None:
+            p = p.field("light", values[idx_light])
+            state.light = values[idx_light]
+            has_field = True
+        if has_field:
+            if WRITE_RAW_POINTS:
+                points.append(p)
+            sample = {
+                "temperature": values[idx_temp] if idx_temp is not None else None,
+                "light": values[idx_light] if idx_light is not None else None,
+            }
+            record_rollup(node_id, state.zone, sample, ts)
+            samples.append((ts, sample))
+
+        for i, rom in probe_cols:
+            if values[i] is not None:
+                points.append(
+                    Point("ds18b20").tag("location", state.zone).tag("node", node_id).tag("probe", rom)
+                    .field("temperature", values[i]).time(t_ns, WritePrecision.NS)
+                )
+
+    state.updated_at = datetime.now(timezone.utc)
+
+    if LOG_MESSAGES:
+        print(f"Pi[{node_id}] batch -> {len(rows)} samples, {len(points)} points")
+
+    if points:
+        try:
+            influx_write(points, [int(ts * 1e9) for ts, _ in rows])
+        except Exception as e:
+            print("Error writing Pi batch to InfluxDB:", e)
+    fuse(node_id, state.zone, samples)
 
-# -------------------- Camera DB --------------------
-def init_camera_db():
-    conn = sqlite3.connect(CAMERA_DB_PATH)
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS images (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        created_at TEXT NOT NULL,
-        width INTEGER,
-        height INTEGER,
-        fps REAL,
-        chili_count INTEGER,
-        jpg BLOB NOT NULL
-    )
-    """)
-    conn.commit()
-    conn.close()
-    print("Camera SQLite DB ready")
+    # relay ใช้ค่าล่าสุดของ batch ครั้งเดียว
+    update_zone_relay(state.zone)
 
 
-def save_camera_image(jpg_bytes, width, height, fps, chili_count):
-    conn = sqlite3.connect(CAMERA_DB_PATH)
-    conn.execute(
-        "INSERT INTO images (created_at, width, height, fps, chili_count, jpg) VALUES (?, ?, ?, ?, ?, ?)",
-        (
-            datetime.now(timezone.utc).isoformat(timespec="seconds"),
-            width,
-            height,
-            fps,
-            chili_count,
-            sqlite3.Binary(jpg_bytes),
-        )
-    )
-    conn.commit()
-    conn.close()
+def handle_esp(node_id, payload_bytes, rx_ts=None):
+    # co2,humidity,soil[,seq[,ts]]   ts ว่างได้ (ESP32 ยังไม่ได้เวลาจาก NTP)
+    try:
+        reading = payload_bytes if isinstance(payload_bytes, EspReading) else parse_esp_csv(payload_bytes)
+    except Exception as e:
+        print(f"ESP32 CSV parse error ({node_id}):", e, "payload:", payload_bytes)
+        return
+    co2_val, hum_val, soil_val, seq, read_ts = reading
+    # ESP32 ส่งทันทีที่อ่าน -> เวลาอ่าน = เวลาส่ง
+    recorder.received(f"esp/{node_id}", seq, read_ts, rx_ts)
+    ts = read_ts or rx_ts
 
-    print(f"Saved camera frame size={width}x{height}, fps={fps}, chili={chili_count}")
+    state = get_node(node_id)
+    state.co2 = co2_val
+    state.hum = hum_val
+    state.soil = soil_val
+    state.updated_at = datetime.now(timezone.utc)
 
+    if LOG_MESSAGES:
+        print(f"ESP32[{node_id}] -> CO2={co2_val}, Hum={hum_val}, Soil={soil_val}")
 
-# -------------------- InfluxDB Setup --------------------
-try:
-    influx_client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
-    write_api = influx_client.write_api(write_options=SYNCHRONOUS)
-    print("Connected to InfluxDB")
-except Exception as e:
-    print("InfluxDB connect error:", e)
-    GPIO.cleanup()
-    raise SystemExit(1)
+    # write ONLY ESP32 fields to Influx (same measurement "mqtt_data")
+    values = {"co2": co2_val, "humidity": hum_val, "soil": soil_val}
+    if WRITE_RAW_POINTS:
+        write_esp_to_influx(**values, node_id=node_id, zone=state.zone, ts=ts)
+    record_rollup(node_id, state.zone, values, ts)
+    fuse(node_id, state.zone, [(ts, values)])
 
-init_camera_db()
+    # update relay of this node's zone
+    update_zone_relay(state.zone)
 
 
-# -------------------- Helper: write functions --------------------
-def write_pi_to_influx(temperature=None, light=None):
+def forward_to_relay_owner(node_id, zone, samples):
     """
-    Write Pi data to measurement 'mqtt_data' with tag node='raspi'
+    With shared subscriptions each process only sees part of the nodes,
+    so non-owners pass their samples on to the process that owns the relay
+    (its fusion stage then sees every node).
     """
-    try:
-        p = Point("mqtt_data").tag("location", "lab1").tag("node", "raspi")
-        if temperature is not None:
-            p = p.field("temperature", float(temperature))
-        if light is not None:
-            p = p.field("light", float(light))
-        write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=p)
-        print("Written Pi data to InfluxDB:", {"temperature": temperature, "light": light})
-    except Exception as e:
-        print("Error writing Pi data to InfluxDB:", e)
+    if not MQTT_SHARE_GROUP or relay_owner or mqtt_client is None or not samples:
+        return
+    msg = {"zone": zone, "samples": samples}
+    mqtt_client.publish(relay_forward_topic(node_id), json.dumps(msg))
 
 
-def write_esp_to_influx(co2=None, humidity=None, soil=None):
-    """
-    Write ESP32 data to measurement 'mqtt_data' with tag node='esp32'
-    """
+def handle_relay_forward(node_id, payload_bytes):
     try:
-        p = Point("mqtt_data").tag("location", "lab1").tag("node", "esp32")
-        if co2 is not None:
-            p = p.field("co2", float(co2))
-        if humidity is not None:
-            p = p.field("humidity", float(humidity))
-        if soil is not None:
-            p = p.field("soil", float(soil))
-        write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=p)
-        print("Written ESP32 data to InfluxDB:", {"co2": co2, "humidity": humidity, "soil": soil})
+        data = json.loads(payload_bytes.decode("utf-8"))
+        zone = data.get("zone") or zone_of(node_id)
+        samples = data.get("samples") or []
     except Exception as e:
-        print("Error writing ESP32 data to InfluxDB:", e)
+        print(f"Relay forward decode error ({node_id}):", e)
+        return
 
+    detect = anomaly_checks_here()
+    for ts, values in samples:
+        fusion.add(zone, node_id, values, ts)
+        if detect:
+            anomalies.add(node_id, zone, values, ts)
+    update_zone_relay(zone)
 
-# -------------------- MQTT CALLBACK --------------------
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        print("MQTT connected")
-        client.subscribe(MQTT_TOPIC_PI)
-        client.subscribe(MQTT_TOPIC_ESP)
-        client.subscribe(MQTT_TOPIC_CAMERA)
+
+def handle_message(kind, node_id, payload_bytes, rx_ts=None):
+    """
+    rx_ts = เวลาที่รับจาก broker (epoch s); None = ตอนนี้
+    payload_bytes = payload MQTT หรือ message ที่ decode แล้วจาก edge_bus (edge_runtime.py)
+    """
+    if rx_ts is None:
+        rx_ts = time.time()
     else:
-        print("MQTT connect failed:", rc)
+        recorder.observe_since("queue", rx_ts)
 
+    if kind == "pi":
+        handle_pi(node_id, payload_bytes, rx_ts)
+    elif kind == "pi_batch":
+        handle_pi_batch(node_id, payload_bytes, rx_ts)
+    elif kind == "esp":
+        handle_esp(node_id, payload_bytes, rx_ts)
+    elif kind == "camera":
+        handle_camera(payload_bytes, rx_ts)
+    elif kind == "relay":
+        handle_relay_forward(node_id, payload_bytes)
 
-def on_message(client, userdata, msg):
-    global last_temp, last_hum, last_co2
 
-    print("\n=== MQTT MESSAGE ===")
-    print("Topic:", msg.topic)
+# -------------------- Ingest workers --------------------
+worker_queues = []
 
-    # ---------------- Camera (do NOT write to Influx) ----------------
-    if msg.topic == MQTT_TOPIC_CAMERA:
-        try:
-            payload = json.loads(msg.payload.decode("utf-8"))
-        except Exception as e:
-            print("JSON decode error (Camera):", e)
-            print("Raw payload (truncated):", msg.payload[:200], "...")
-            return
 
-        cam = payload.get("camera", {}) or {}
-        img_b64 = payload.get("image") or payload.get("img")  # support both names
+def shard_for(node_id):
+    return zlib.crc32(node_id.encode("utf-8")) % len(worker_queues)
 
-        if not img_b64:
-            print("⚠ Camera message has no 'image' field, skip saving image.")
-            return
 
+def ingest_worker(q):
+    while True:
+        item = q.get()
+        if item is None:
+            break
         try:
-            decoded = base64.b64decode(img_b64.strip(), validate=True)
+            handle_message(*item)
         except Exception as e:
-            print("⚠ base64 decode error (Camera):", e)
-            return
+            print("Ingest worker error:", e)
 
-        width  = cam.get("width")
-        height = cam.get("height")
-        fps    = cam.get("fps")
-        chili_count = cam.get("chili_count")
 
-        print(f"Camera -> chili_count={chili_count}, fps={fps}, size={width}x{height}")
+def start_workers(n=INGEST_WORKERS):
+    worker_queues[:] = [queue.Queue(maxsize=INGEST_QUEUE_MAX) for _ in range(n)]
+    for i, q in enumerate(worker_queues):
+        threading.Thread(target=ingest_worker, args=(q,), name=f"ingest-{i}", daemon=True).start()
 
-        try:
-            save_camera_image(decoded, width, height, fps, chili_count)
-        except Exception as e:
-            print(" Error saving camera image to SQLite:", e)
 
-        # Do NOT write camera metadata to Influx — per request
+def dispatch(topic, payload_bytes, rx_ts=None):
+    """Route one MQTT message (or edge_bus message) to the worker that owns its node."""
+    kind, node_id = parse_topic(topic)
+    if kind is None:
+        print("Unknown topic:", topic)
         return
-
-    # ---------------- Pi JSON ----------------
-    if msg.topic == MQTT_TOPIC_PI:
+    rx_ts = rx_ts or time.time()
+    if archiver is not None and kind in ARCHIVE_KINDS:
         try:
-            data = json.loads(msg.payload.decode("utf-8"))
-        except Exception as e:
-            print("Pi JSON decode error:", e)
-            return
+            archiver.append(topic, encode_message(kind, payload_bytes), rx_ts)
+        except OSError as e:
+            print("Archive write error:", e)
+    worker_queues[shard_for(node_id)].put((kind, node_id, payload_bytes, rx_ts))
 
-        pi = data.get("pi", {}) or {}
-        temp = pi.get("temperature")
-        light = pi.get("light")
 
-        # update cache for relay
-        try:
-            last_temp = float(temp) if temp is not None else None
-        except Exception:
-            last_temp = None
+# -------------------- MQTT CALLBACK --------------------
+def on_connect(client, userdata, flags, rc, properties=None):
+    if rc == 0:
+        print("MQTT connected")
+        for topic in SUBSCRIBE_TOPICS:
+            if MQTT_SHARE_GROUP:
+                client.subscribe(shared_topic(MQTT_SHARE_GROUP, topic))
+            else:
+                client.subscribe(topic)
+        if MQTT_SHARE_GROUP and relay_owner:
+            client.subscribe(MQTT_TOPIC_RELAY_FORWARD)
+    else:
+        print("MQTT connect failed:", rc)
 
-        try:
-            last_light = float(light) if light is not None else None
-        except Exception:
-            last_light = None
 
-        print(f"Pi -> Temp={last_temp}, Light={last_light}")
+def on_message(client, userdata, msg):
+    if LOG_MESSAGES:
+        print("\n=== MQTT MESSAGE ===")
+        print("Topic:", msg.topic)
 
-        # write ONLY Pi fields to Influx (same measurement "mqtt_data")
-        write_pi_to_influx(temperature=last_temp, light=last_light)
+    dispatch(msg.topic, msg.payload, time.time())
 
-        # update relay with freshest values (use cached last_hum/last_co2)
-        update_relay_by_conditions(last_temp, last_hum, last_co2)
-        return
 
-    # ---------------- ESP32 CSV ----------------
-    if msg.topic == MQTT_TOPIC_ESP:
-        try:
-            parts = msg.payload.decode("utf-8").strip().split(',')
-            if len(parts) != 3:
-                print("ESP32 CSV format error:", parts)
-                return
-            co2_val = float(parts[0])
-            hum_val = float(parts[1])
-            soil_val = float(parts[2])
-            last_co2 = co2_val
-            last_hum = hum_val
-            last_soil = soil_val
-        except Exception as e:
-            print("ESP32 CSV parse error:", e, "payload:", msg.payload)
-            return
+# -------------------- MAIN --------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pi / ESP32 / camera MQTT subscriber")
+    parser.add_argument("--share-group", default=MQTT_SHARE_GROUP,
+                        help="join MQTT 5 shared subscription group (run N processes to split the load)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                        help="ingest worker threads in this process")
+    parser.add_argument("--quiet", action="store_true",
+                        help="do not print every message (benchmarks / many nodes)")
+    parser.add_argument("--no-relay", action="store_true",
+                        help="never take relay ownership (benchmarks / replay)")
+    parser.add_argument("--no-rollups", action="store_true",
+                        help="do not write the 1 min / 1 h rollup measurements")
+    parser.add_argument("--no-fusion", action="store_true",
+                        help="do not write fused records (relay still uses the fusion stage)")
+    parser.add_argument("--no-raw-points", action="store_true",
+                        help="write only fused records and rollups instead of one point per node")
+    parser.add_argument("--no-anomaly", action="store_true",
+                        help="do not run the anomaly detector (relay uses every sensor)")
+    parser.add_argument("--archive", nargs="?", const=ARCHIVE_DIR, default=None, metavar="DIR",
+                        help=f"keep every received message for replay.py (default dir: {ARCHIVE_DIR})")
+    parser.add_argument("--rollup-late", choices=RollupAggregator.LATE_POLICIES, default=ROLLUP_LATE_POLICY,
+                        help="what to do with samples for a rollup window that has already been written")
+    return parser.parse_args(argv)
+
+
+def start_pipeline(args):
+    """Sinks, workers, archive, rollups, fusion and relay ownership: everything except the MQTT client."""
+    global LOG_MESSAGES, WRITE_RAW_POINTS, ANOMALY_ENABLED, archiver
+
+    if args.quiet:
+        LOG_MESSAGES = False
+    if args.no_anomaly:
+        ANOMALY_ENABLED = False
+
+    open_influx()
+    init_camera_db()
+    start_workers(args.workers)
+    if args.archive:
+        archiver = ArchiveWriter(args.archive, ROLLUP_WRITER, segment_s=ARCHIVE_SEGMENT_S,
+                                 retention_s=ARCHIVE_RETENTION_S, max_bytes=ARCHIVE_MAX_BYTES)
+        print(f"Archiving {', '.join(ARCHIVE_KINDS)} messages to {os.path.abspath(args.archive)}")
+    if ROLLUPS_ENABLED and not args.no_rollups:
+        start_rollups(args.rollup_late, state_path=None if MQTT_SHARE_GROUP else ROLLUP_STATE_PATH)
+    if FUSION_ENABLED and not args.no_fusion:
+        start_fusion()
+    else:
+        fusion.history = False   # ไม่มี fused record: relay ใช้แค่ค่าล่าสุด
+    if args.no_raw_points:
+        if not fusion_started:
+            raise SystemExit("--no-raw-points needs the fused records (remove --no-fusion)")
+        WRITE_RAW_POINTS = False
+
+    # ได้ lock ทันทีถ้าเป็น process แรก ไม่งั้นรอรับช่วงต่อเมื่อ owner ตาย
+    if args.no_relay:
+        print("Relay disabled (--no-relay)")
+    elif not try_acquire_relay():
+        print("Relay owned by another process, waiting for lease...")
+        threading.Thread(target=relay_lease_loop, name="relay-lease", daemon=True).start()
+
+
+def shutdown():
+    """Write what is still buffered and release the GPIO."""
+    if archiver is not None:
+        archiver.close()
+    if MQTT_SHARE_GROUP:
+        for r in rollups:
+            r.flush(force=True)
+    else:
+        save_rollups(ROLLUP_STATE_PATH)
+    flush_fusion()
+    close_influx()
+    if relay_owner:
+        GPIO.output(BUZZER_PIN, GPIO.LOW)
+        GPIO.cleanup()
+        print("GPIO cleaned up.")
 
-        print(f"ESP32 -> CO2={last_co2}, Hum={last_hum}, Soil={last_soil}")
 
-        # write ONLY ESP32 fields to Influx (same measurement "mqtt_data")
-        write_esp_to_influx(co2=last_co2, humidity=last_hum, soil=last_soil)
+def main():
+    global MQTT_SHARE_GROUP, mqtt_client
 
-        # update relay with freshest values (use cached last_temp)
-        update_relay_by_conditions(last_temp, last_hum, last_co2)
-        return
+    args = parse_args()
+    MQTT_SHARE_GROUP = args.share_group
+    if MQTT_SHARE_GROUP:
+        recorder.proc = f"subscriber-{ROLLUP_WRITER}"
+        recorder.track_seq = False
+    profiler.install_signals()
 
+    start_pipeline(args)
 
-# -------------------- MAIN --------------------
-def main():
-    client = mqtt.Client()
+    if MQTT_SHARE_GROUP:
+        # shared subscription ต้องใช้ MQTT 5
+        client = mqtt.Client(protocol=mqtt.MQTTv5)
+        print(f"Shared subscription group '{MQTT_SHARE_GROUP}'")
+    else:
+        client = mqtt.Client()
+    mqtt_client = client
     client.on_connect = on_connect
     client.on_message = on_message
+    start_metrics_publisher(client.publish, metrics_topic(recorder.proc), recorder, METRICS_PERIOD)
 
     print("Connecting to MQTT broker...")
     client.connect(MQTT_BROKER, MQTT_PORT, 60)
@@ -620,6 +1133,4 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         pass
     finally:
-        GPIO.output(BUZZER_PIN, GPIO.LOW)
-        GPIO.cleanup()
-        print("GPIO cleaned up.")
+        shutdown()
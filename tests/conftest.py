@@ -0,0 +1,19 @@
+# ให้ test import โมดูลใน raspberryPI__camera/ ได้ตรง ๆ (เหมือนรันสคริปต์ในโฟลเดอร์นั้น)
+# entry point ที่ต้องใช้ GPIO / Influx โหลดผ่าน fixture `shim` (bench/hw_shim.py)
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "raspberryPI__camera"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+
+@pytest.fixture(scope="session")
+def shim():
+    from hw_shim import HardwareShim
+
+    shim = HardwareShim()
+    yield shim
+    shim.close()
@@ -0,0 +1,52 @@
+import pytest
+
+from node_topics import esp_topic, parse_topic
+
+T0 = 1_790_000_000.0
+
+
+def esp_payload(co2, humidity, soil, seq, ts):
+    """Same CSV as ESP32/pub_esp32.cpp: raw ADC ints, String(float) humidity, ts with 3 decimals."""
+    return f"{co2},{humidity:.2f},{soil},{seq},{ts:.3f}".encode()
+
+
+@pytest.fixture
+def sub(shim):
+    sub = shim.load("subscriber_main_on_pi")
+    sub.LOG_MESSAGES = False
+    sub.open_influx()
+    return sub
+
+
+def feed(sub, node_id, readings, start_seq=0, interval_s=5.0):
+    kind, node_id = parse_topic(esp_topic(node_id))
+    for i, (co2, humidity, soil) in enumerate(readings):
+        ts = T0 + (start_seq + i) * interval_s
+        sub.handle_message(kind, node_id, esp_payload(co2, humidity, soil, start_seq + i, ts), ts + 0.05)
+
+
+def test_realistic_esp32_readings_are_not_faulted(sub):
+    readings = [(1650 + i % 7, 62.0 + (i % 3), 1843 + (i % 5) * 4) for i in range(60)]
+    feed(sub, "esp-ok", readings)
+    assert not sub.anomalies.faulted("esp-ok", "soil")
+    assert not sub.anomalies.faulted("esp-ok", "co2")
+    assert not sub.anomalies.faulted("esp-ok", "humidity")
+
+
+def test_stable_humidity_at_dht11_resolution_is_not_flatlined(sub):
+    # DHT11 ละเอียด 1 %: ห้องนิ่ง ๆ ได้ 62.00 ทุก heartbeat (60 s) ต่อกัน 4 ชั่วโมง
+    readings = [(1650 + i % 7, 62.0, 1843 + (i % 5) * 4) for i in range(4 * 60)]
+    feed(sub, "esp-stable", readings, interval_s=60.0)
+    assert not sub.anomalies.faulted("esp-stable", "humidity")
+    assert not sub.anomalies.faulted("esp-stable", "soil")
+
+
+@pytest.mark.parametrize("rail", [0, 4095])
+def test_soil_stuck_at_adc_rail_is_faulted_until_it_recovers(sub, rail):
+    node = f"esp-rail-{rail}"
+    feed(sub, node, [(1650, 62.0, 1843)] * 3)
+    feed(sub, node, [(1650, 62.0, rail)], start_seq=3)
+    assert sub.anomalies.faulted(node, "soil")
+    assert not sub.anomalies.faulted(node, "co2")
+    feed(sub, node, [(1650, 62.0, 1843)], start_seq=4)
+    assert not sub.anomalies.faulted(node, "soil")
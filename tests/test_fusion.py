@@ -0,0 +1,142 @@
+import threading
+import time
+
+import pytest
+
+from fusion import FusionJoiner
+
+T = 1_790_000_000.0       # ขอบ interval 10 s
+
+
+def make(tolerance_s=75.0, interval_s=10.0, grace_s=5.0, max_samples=4096):
+    emitted = []
+    return FusionJoiner(interval_s, tolerance_s, emitted.append, grace_s=grace_s, max_samples=max_samples), emitted
+
+
+def test_asof_uses_newest_sample_at_or_before_time():
+    j, _ = make()
+    j.add("z", "pi", {"temperature": 20.0}, T)
+    j.add("z", "pi", {"temperature": 21.0}, T + 30)
+    record = j.asof("z", at=T + 29)
+    assert record.inputs == {"temperature": [("pi", 20.0, T)]}
+    assert j.asof("z", at=T + 30).values() == {"temperature": 21.0}
+    assert j.asof("z", at=T - 1).inputs == {}     # ยังไม่มี sample ณ เวลานั้น
+
+
+def test_asof_marks_sensor_older_than_tolerance_stale():
+    j, _ = make(tolerance_s=75.0)
+    j.add("z", "esp", {"humidity": 60.0}, T)
+    assert j.asof("z", at=T + 75).inputs == {"humidity": [("esp", 60.0, T)]}
+    record = j.asof("z", at=T + 76)
+    assert record.inputs == {}
+    assert record.stale == {"humidity": 76.0}
+
+
+def test_stale_source_does_not_hide_fresh_one():
+    j, _ = make(tolerance_s=75.0)
+    j.add("z", "esp-old", {"humidity": 95.0}, T)
+    j.add("z", "esp-new", {"humidity": 60.0}, T + 100)
+    record = j.asof("z", at=T + 110)
+    assert record.inputs == {"humidity": [("esp-new", 60.0, T + 100)]}
+    assert record.stale == {}
+
+
+def test_missing_sensor_is_neither_input_nor_stale():
+    j, _ = make()
+    j.add("z", "pi", {"temperature": 22.0, "light": None}, T)
+    record = j.asof("z", at=T + 1, fields=("temperature", "humidity", "light"))
+    assert set(record.inputs) == {"temperature"}
+    assert record.stale == {}
+    assert j.asof("other", at=T + 1).inputs == {}
+
+
+def test_asof_latest_measures_age_from_now():
+    j, _ = make(tolerance_s=75.0)
+    now = time.time()
+    j.add("z", "pi", {"temperature": 22.0}, now - 200)
+    j.add("z", "esp", {"co2": 700.0}, now - 1)
+    record = j.asof("z")
+    assert set(record.inputs) == {"co2"}
+    assert set(record.stale) == {"temperature"}
+
+
+def test_flush_emits_each_interval_after_grace():
+    j, emitted = make(interval_s=10.0, grace_s=5.0)
+    j.add("z", "pi", {"temperature": 20.0}, T + 1)
+    assert j.flush(now=T + 10 + 4.9) == 0
+    assert j.flush(now=T + 10 + 5) == 1
+    assert emitted[0].ts == T + 10 and emitted[0].values() == {"temperature": 20.0}
+    assert j.flush(now=T + 30 + 5) == 2                 # record ต่อ interval แม้ไม่มี sample ใหม่
+    assert [r.ts for r in emitted] == [T + 10, T + 20, T + 30]
+
+
+def test_sample_after_its_record_was_emitted_is_late():
+    j, emitted = make(interval_s=10.0, grace_s=5.0)
+    j.add("z", "pi", {"temperature": 20.0}, T + 1)
+    j.flush(now=T + 15)
+    j.add("z", "pi", {"temperature": 30.0}, T + 9)
+    assert j.late == 1
+    assert emitted[0].values() == {"temperature": 20.0}
+
+
+def test_force_flush_emits_up_to_now():
+    j, emitted = make(interval_s=10.0, grace_s=5.0)
+    j.add("z", "pi", {"temperature": 20.0}, T + 1)
+    assert j.flush(now=T + 11) == 0
+    assert j.flush(now=T + 11, force=True) == 1
+
+
+def test_flush_trims_samples_no_longer_needed():
+    j, _ = make(tolerance_s=20.0, interval_s=10.0, grace_s=0.0)
+    for i in range(100):
+        j.add("z", "pi", {"temperature": float(i)}, T + i)
+    j.flush(now=T + 100)
+    assert len(j._series["z"][("pi", "temperature")]) <= 22
+
+
+def test_without_history_only_newest_sample_is_kept():
+    j, _ = make()
+    j.history = False
+    now = time.time()
+    for i in range(10_000):
+        j.add("z", "pi", {"temperature": float(i)}, now - 10_000 + i)
+    j.add("z", "pi", {"temperature": -1.0}, now - 20_000)    # เก่ากว่าค่าล่าสุด
+    assert len(j._series["z"][("pi", "temperature")]) == 1
+    assert j.asof("z").values() == {"temperature": 9999.0}
+
+
+# -------------------- relay ผ่าน as-of join --------------------
+@pytest.fixture
+def relay(shim, monkeypatch):
+    sub = shim.load("subscriber_main_on_pi")
+    import RPi.GPIO as GPIO
+
+    sub.setup_gpio()
+    monkeypatch.setattr(sub, "LOG_MESSAGES", False)
+    monkeypatch.setattr(sub, "sleep", lambda s: None)      # buzzer ตอน relay ติด
+    monkeypatch.setattr(sub, "relay_owner", True)
+    monkeypatch.setattr(sub, "ZONE_RELAY_PINS", {"ztest": sub.RELAY_PIN})
+    monkeypatch.setattr(sub, "zone_locks", {"ztest": threading.Lock()})
+    monkeypatch.setattr(sub, "fusion", FusionJoiner(sub.FUSION_INTERVAL, sub.FUSION_TOLERANCE_S, lambda r: None))
+    GPIO.output(sub.RELAY_PIN, GPIO.LOW)
+    return sub, lambda: GPIO.input(sub.RELAY_PIN) == GPIO.HIGH
+
+
+def test_relay_follows_fresh_inputs_only(relay):
+    sub, relay_on = relay
+    now = time.time()
+    sub.fusion.add("ztest", "pi-a", {"temperature": 35.0}, now - sub.FUSION_TOLERANCE_S - 10)
+    sub.fusion.add("ztest", "pi-b", {"temperature": 23.0}, now - 5)
+    sub.update_zone_relay("ztest")
+    assert not relay_on()                                   # 35 °C เก่าเกิน tolerance
+
+    sub.fusion.add("ztest", "pi-a", {"temperature": 35.0}, now)
+    sub.update_zone_relay("ztest")
+    assert relay_on()
+
+
+def test_relay_ignores_missing_sensors(relay):
+    sub, relay_on = relay
+    sub.fusion.add("ztest", "pi-b", {"temperature": 23.0}, time.time())
+    sub.update_zone_relay("ztest")                          # ไม่มี humidity / co2: ไม่ทำให้ relay ติด
+    assert not relay_on()
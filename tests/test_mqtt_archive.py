@@ -0,0 +1,127 @@
+import os
+
+import pytest
+
+import mqtt_archive as ma
+from node_topics import esp_topic, pi_topic
+
+T0 = 1_790_000_000.0
+
+
+def write_archive(directory, n=100, writer="host-1", step=1.0, start=T0, **kwargs):
+    w = ma.ArchiveWriter(str(directory), writer, **kwargs)
+    sent = []
+    for i in range(n):
+        topic = esp_topic(f"esp{i % 3}")
+        payload = f"600,60.0,1800,{i},{start + i * step}".encode()
+        w.append(topic, payload, start + i * step)
+        sent.append((start + i * step, topic, payload))
+    w.close()
+    return sent
+
+
+def test_segment_round_trip(tmp_path):
+    sent = write_archive(tmp_path)
+    assert [(ts, topic, bytes(p)) for ts, topic, p in ma.iter_archive(str(tmp_path))] == sent
+
+
+def test_segments_rotate_and_read_back_in_order(tmp_path):
+    sent = write_archive(tmp_path, n=100, step=60.0, segment_s=3600.0)
+    assert len(ma.list_segments(str(tmp_path))) == 2
+    assert [r[0] for r in ma.iter_archive(str(tmp_path))] == [s[0] for s in sent]
+
+
+def test_writers_are_merged_by_receive_time(tmp_path):
+    a = write_archive(tmp_path, n=50, writer="host-1", step=2.0)
+    b = write_archive(tmp_path, n=50, writer="host-2", step=2.0, start=T0 + 1)
+    assert [r[0] for r in ma.iter_archive(str(tmp_path))] == sorted(s[0] for s in a + b)
+
+
+def test_time_range_seeks_through_the_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(ma, "ARCHIVE_INDEX_EVERY_S", 10.0)
+    sent = write_archive(tmp_path, n=1000)
+    path = ma.list_segments(str(tmp_path))[0]
+    reader = ma.SegmentReader(path)
+    # index ทุก 10 s: เริ่มอ่านจาก entry ก่อน start ไม่ใช่ต้นไฟล์
+    assert reader._start_offset(T0 + 505) > reader._start_offset(None)
+    got = [r[0] for r in ma.iter_archive(str(tmp_path), T0 + 505, T0 + 600)]
+    assert got == [s[0] for s in sent if T0 + 505 <= s[0] < T0 + 600]
+
+
+def corrupt_record(path, index):
+    """Flip one payload byte of record `index` (CRC no longer matches)."""
+    with open(path, "r+b") as f:
+        pos = ma._HEADER.size
+        for _ in range(index):
+            f.seek(pos)
+            _, topic_len, payload_len, _ = ma._RECORD.unpack(f.read(ma._RECORD.size))
+            pos += ma._RECORD.size + topic_len + payload_len
+        f.seek(pos)
+        _, topic_len, _, _ = ma._RECORD.unpack(f.read(ma._RECORD.size))
+        f.seek(pos + ma._RECORD.size + topic_len)
+        b = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([b[0] ^ 0xFF]))
+
+
+def test_bad_crc_record_is_skipped_and_reading_resumes(tmp_path):
+    sent = write_archive(tmp_path, n=20)
+    corrupt_record(ma.list_segments(str(tmp_path))[0], 7)
+    readers = []
+    got = [r[0] for r in ma.iter_archive(str(tmp_path), readers=readers)]
+    assert got == [s[0] for i, s in enumerate(sent) if i != 7]
+    assert sum(r.corrupt for r in readers) == 1
+
+
+def test_truncated_tail_record_is_ignored(tmp_path):
+    sent = write_archive(tmp_path, n=20)
+    path = ma.list_segments(str(tmp_path))[0]
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 3)
+    assert [r[0] for r in ma.iter_archive(str(tmp_path))] == [s[0] for s in sent[:-1]]
+
+
+def test_not_a_segment_is_rejected(tmp_path):
+    path = tmp_path / "20260101T000000-x.seg"
+    path.write_bytes(b"garbage!" + bytes(8))
+    with pytest.raises(ValueError):
+        list(ma.SegmentReader(str(path)).records())
+
+
+# -------------------- replay --------------------
+@pytest.fixture
+def sub(shim, monkeypatch):
+    import replay
+
+    sub = shim.load("subscriber_main_on_pi")
+    for name in ("influx_write", "save_camera_image", "LOG_MESSAGES", "ANOMALY_ENABLED"):
+        monkeypatch.setattr(sub, name, getattr(sub, name))     # load_subscriber() แก้ค่าเหล่านี้
+    sub = replay.load_subscriber(dry_run=True, rollups=False, fusion=False, anomaly=False)
+    handled = []
+    monkeypatch.setattr(sub, "handle_message", lambda kind, node_id, payload, rx_ts: handled.append(
+        (kind, node_id, bytes(payload), rx_ts)))
+    yield replay, sub, handled
+    sub.fusion.history = True
+
+
+def test_replay_skips_corrupt_record_and_resumes(tmp_path, sub):
+    replay, sub, handled = sub
+    w = ma.ArchiveWriter(str(tmp_path), "host-1")
+    w.append(esp_topic("esp1"), b"600,60.0,1800,0,", T0)
+    w.append(pi_topic("raspi"), b'{"pi": {"temperature": 22.0}}', T0 + 1)
+    w.append(esp_topic("esp1"), b"601,60.0,1800,1,", T0 + 2)
+    w.append("iot/camera", b"{}", T0 + 3)
+    w.append(esp_topic("esp1"), b"602,60.0,1800,2,", T0 + 4)
+    w.close()
+    corrupt_record(ma.list_segments(str(tmp_path))[0], 2)
+
+    readers = []
+    counts = replay.replay(sub, ma.iter_archive(str(tmp_path), readers=readers))
+    assert [(k, n, p) for k, n, p, _ in handled] == [
+        ("esp", "esp1", b"600,60.0,1800,0,"),
+        ("pi", "raspi", b'{"pi": {"temperature": 22.0}}'),
+        ("esp", "esp1", b"602,60.0,1800,2,"),
+    ]
+    assert [ts for *_, ts in handled] == [T0, T0 + 1, T0 + 4]
+    assert counts["esp"] == 2 and counts["pi"] == 1 and counts["skipped"] == 1
+    assert sum(r.corrupt for r in readers) == 1
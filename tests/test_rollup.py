@@ -0,0 +1,132 @@
+import json
+
+import pytest
+
+from rollup import RollupAggregator
+
+W0 = 1_790_000_040.0     # ต้น window 1 นาที (กลาง window 1 ชั่วโมง)
+T0 = W0 + 25
+
+
+def make(late_policy="drop", window_s=60, grace_s=10.0, late_retention_s=600.0):
+    emitted = []
+    agg = RollupAggregator("m", window_s, lambda *args: emitted.append(args), grace_s=grace_s,
+                           late_policy=late_policy, late_retention_s=late_retention_s)
+    return agg, emitted
+
+
+def test_window_emits_once_it_closes():
+    agg, emitted = make()
+    for i, v in enumerate((1.0, 3.0, 2.0)):
+        agg.add("n1", "z", {"t": v, "h": None}, ts=W0 + i, now=W0 + i)
+    assert agg.flush(now=W0 + 60 + 9.9) == 0       # ยังอยู่ใน grace
+    assert agg.flush(now=W0 + 60 + 10) == 1
+    assert emitted == [("m", "n1", "z", W0, {"t": (3, 2.0, 1.0, 3.0)})]
+    assert agg.flush(now=W0 + 200) == 0            # ไม่เขียนซ้ำ
+
+
+def test_drop_policy_discards_late_samples():
+    agg, emitted = make("drop")
+    agg.add("n1", "z", {"t": 1.0}, ts=W0, now=W0)
+    agg.flush(now=W0 + 70)
+    agg.add("n1", "z", {"t": 5.0}, ts=W0 + 30, now=W0 + 80)
+    assert agg.late_dropped == 1
+    assert agg.flush(now=W0 + 90) == 0
+    assert len(emitted) == 1
+
+
+def test_update_policy_rewrites_window_with_late_samples():
+    agg, emitted = make("update")
+    agg.add("n1", "z", {"t": 1.0}, ts=W0, now=W0)
+    agg.flush(now=W0 + 70)
+    agg.add("n1", "z", {"t": 5.0}, ts=W0 + 30, now=W0 + 80)
+    assert agg.flush(now=W0 + 90) == 1
+    assert emitted[-1] == ("m", "n1", "z", W0, {"t": (2, 3.0, 1.0, 5.0)})
+    assert agg.late_dropped == 0
+
+
+def test_update_policy_forgets_window_after_retention():
+    agg, emitted = make("update", late_retention_s=600.0)
+    agg.add("n1", "z", {"t": 1.0}, ts=W0, now=W0)
+    agg.flush(now=W0 + 70 + 600)
+    assert agg.dump() == []
+    agg.add("n1", "z", {"t": 5.0}, ts=W0 + 30, now=W0 + 70 + 601)
+    assert agg.late_dropped == 1
+    assert agg.flush(now=W0 + 70 + 700) == 0
+    assert len(emitted) == 1
+
+
+def test_force_flush_emits_open_windows():
+    agg, emitted = make("update")
+    agg.add("n1", "z", {"t": 1.0}, ts=W0, now=W0)
+    assert agg.open_windows(now=W0 + 1) == 1
+    assert agg.flush(now=W0 + 1) == 0
+    assert agg.flush(now=W0 + 1, force=True) == 1
+    assert emitted == [("m", "n1", "z", W0, {"t": (1, 1.0, 1.0, 1.0)})]
+    assert agg.dump() == []
+
+
+def test_window_split_across_two_instances_is_written_whole():
+    first, emitted = make("update")
+    first.add("n1", "z", {"t": 1.0}, ts=W0 + 10, now=W0 + 10)
+    first.add("n1", "z", {"t": 2.0}, ts=W0 + 20, now=W0 + 20)
+    state = json.loads(json.dumps(first.dump()))   # ผ่านไฟล์ JSON เหมือน save_rollups()
+    assert emitted == []
+
+    second, emitted = make("update")
+    second.restore(state)
+    second.add("n1", "z", {"t": 6.0}, ts=W0 + 50, now=W0 + 50)
+    assert second.flush(now=W0 + 70) == 1
+    assert emitted == [("m", "n1", "z", W0, {"t": (3, 3.0, 1.0, 6.0)})]
+
+
+def test_min_start_skips_window_begun_before_it():
+    agg, emitted = make("update")
+    agg.min_start = W0 + 40                         # restart กลาง window โดยไม่มี state
+    agg.add("n1", "z", {"t": 1.0}, ts=W0 + 45, now=W0 + 45)
+    agg.add("n1", "z", {"t": 2.0}, ts=W0 + 65, now=W0 + 65)
+    agg.flush(now=W0 + 200)
+    assert agg.partial_skipped == 1
+    assert [e[3] for e in emitted] == [W0 + 60]
+
+
+@pytest.fixture
+def sub(shim, tmp_path, monkeypatch):
+    sub = shim.load("subscriber_main_on_pi")
+    written = []
+    now = [T0]
+    monkeypatch.setattr(sub, "LOG_MESSAGES", False)
+    monkeypatch.setattr(sub, "influx_write", lambda record, times_ns: written.append(record))
+    monkeypatch.setattr(sub, "clock", lambda: now[0])
+    yield sub, written, now, str(tmp_path / "rollup_state.json")
+    sub.rollups[:] = []
+
+
+def test_subscriber_restart_resumes_open_windows(sub):
+    sub, written, now, path = sub
+    now[0] = W0 - 5                                 # เปิดก่อน window 1 นาทีเริ่ม
+    sub.start_rollups("update", flush_thread=False, state_path=path)
+    now[0] = T0
+    sub.record_rollup("n1", "z", {"temperature": 20.0}, T0)
+    sub.save_rollups(path)
+    assert written == []                            # ไม่เขียน window ครึ่งเดียวตอนปิด
+
+    sub.start_rollups("update", flush_thread=False, state_path=path)
+    now[0] = T0 + 10
+    sub.record_rollup("n1", "z", {"temperature": 24.0}, T0 + 10)
+    for r in sub.rollups:
+        r.flush(W0 + 3600 + 60)
+    minute = [p for p in written if p._name == "mqtt_data_1m"]
+    assert len(minute) == 1
+    assert minute[0]._fields["temperature"] == 22.0
+    assert minute[0]._fields["temperature_count"] == 2
+
+
+def test_subscriber_start_without_state_skips_current_window(sub):
+    sub, written, now, path = sub
+    sub.start_rollups("update", flush_thread=False, state_path=path)
+    sub.record_rollup("n1", "z", {"temperature": 20.0}, T0)
+    sub.record_rollup("n1", "z", {"temperature": 21.0}, W0 + 60)
+    for r in sub.rollups:
+        r.flush(W0 + 3600 + 60)
+    assert [p._name for p in written] == ["mqtt_data_1m"]
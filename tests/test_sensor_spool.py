@@ -0,0 +1,67 @@
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from sensor_spool import SampleSpool, SpoolingPublisher
+
+
+class FakeClient:
+    """paho client stand-in: publish() succeeds and records (topic, payload, qos)."""
+
+    def __init__(self):
+        self.sent = []
+        self._mid = 0
+        self._lock = threading.Lock()
+
+    def max_inflight_messages_set(self, n):
+        pass
+
+    def publish(self, topic, payload, qos=0):
+        with self._lock:
+            self._mid += 1
+            self.sent.append((topic, bytes(payload), qos))
+            return mqtt.MQTTMessageInfo(self._mid)
+
+
+def make_publisher(tmp_path, **kwargs):
+    client = FakeClient()
+    spool = SampleSpool(str(tmp_path / "spool.db"))
+    publisher = SpoolingPublisher(client, spool, **kwargs)
+    return client, spool, publisher
+
+
+def test_drain_thread_idle_when_nothing_queued(tmp_path):
+    client, spool, publisher = make_publisher(tmp_path)
+    try:
+        publisher._on_connect(client, None, {}, 0)
+        time.sleep(0.2)
+        cpu0 = time.process_time()
+        time.sleep(1.0)
+        assert time.process_time() - cpu0 < 0.1
+        assert client.sent == []
+    finally:
+        publisher.stop()
+        spool.close()
+
+
+def test_spooled_message_drains_after_reconnect(tmp_path):
+    client, spool, publisher = make_publisher(tmp_path, qos=0, drain_rate=0)
+    try:
+        assert publisher.publish("pi/a", b"offline") is False
+        publisher._on_connect(client, None, {}, 0)
+        deadline = time.monotonic() + 2.0
+        while spool.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # ว่างแล้วหลับอยู่: message ใหม่ที่ลง spool ต้องปลุก drain thread
+        publisher.connected.clear()
+        publisher.publish("pi/a", b"queued")
+        publisher.connected.set()
+        deadline = time.monotonic() + 2.0
+        while spool.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [p for _, p, _ in client.sent] == [b"offline", b"queued"]
+        assert spool.pending == 0
+    finally:
+        publisher.stop()
+        spool.close()
@@ -0,0 +1,195 @@
+# --share-group (MQTT 5 shared subscription) กระจายงานจริงบน mosquitto และ relay มีเจ้าของคนเดียว
+# test ที่ต้องใช้ broker ถูกข้ามถ้าไม่มีคำสั่ง mosquitto (เปิดตัวใหม่บน port ว่างให้เอง)
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from fake_influx import start_server
+from hw_shim import APP_DIR, HERE as BENCH_DIR
+from node_topics import esp_topic
+
+SUBSCRIBER = os.path.join(APP_DIR, "subscriber_main_on_pi.py")
+SCALE_MESSAGES = 30_000
+SCALE_NODES = 50
+SCALE_TIMEOUT_S = 120.0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until(cond, timeout, step=0.05):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(step)
+    return cond()
+
+
+@pytest.fixture
+def mosquitto(tmp_path):
+    exe = shutil.which("mosquitto") or next(
+        (p for p in ("/usr/sbin/mosquitto", "/usr/local/sbin/mosquitto") if os.path.exists(p)), None)
+    if exe is None:
+        pytest.skip("mosquitto not installed")
+    port = free_port()
+    conf = tmp_path / "mosquitto.conf"
+    # max_queued_messages 0: ไม่จำกัดคิวต่อ client -> message ไม่หายเพราะ subscriber รับช้า
+    conf.write_text(f"listener {port} 127.0.0.1\nallow_anonymous true\nmax_queued_messages 0\n")
+    proc = subprocess.Popen([exe, "-c", str(conf)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def accepting():
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return True
+        except OSError:
+            return False
+
+    try:
+        if not wait_until(accepting, 5.0):
+            pytest.skip("mosquitto did not start")
+        yield port
+    finally:
+        proc.terminate()
+        proc.wait(timeout=5)
+
+
+def run_subscribers(n, broker_port, influx_port, workdir):
+    env = dict(os.environ, MQTT_BROKER="127.0.0.1", MQTT_PORT=str(broker_port),
+               INFLUX_URL=f"http://127.0.0.1:{influx_port}", PYTHONUNBUFFERED="1",
+               PYTHONPATH=os.path.join(BENCH_DIR, "fakes"))
+    cmd = [sys.executable, SUBSCRIBER, "--quiet", "--no-relay", "--no-rollups", "--no-fusion",
+           "--no-anomaly", "--share-group", "test"]
+    procs, logs = [], []
+    for i in range(n):
+        log = os.path.join(workdir, f"subscriber-{n}-{i}.log")
+        logs.append(log)
+        with open(log, "w") as f:
+            procs.append(subprocess.Popen(cmd, cwd=workdir, env=env, stdout=f, stderr=subprocess.STDOUT))
+    return procs, logs
+
+
+def connected(log):
+    with open(log) as f:
+        return "MQTT connected" in f.read()
+
+
+def ingest_rate(n, broker_port, tmp_path):
+    """Publish SCALE_MESSAGES ESP32 messages to n subscribers; (msg/s, mqtt_data points written)."""
+    workdir = tmp_path / f"x{n}"
+    workdir.mkdir()
+    server, stats = start_server("127.0.0.1", 0)
+    procs, logs = run_subscribers(n, broker_port, server.server_address[1], str(workdir))
+    pub = mqtt.Client()
+    try:
+        assert wait_until(lambda: all(connected(log) for log in logs), 20.0), "subscriber did not connect"
+        time.sleep(0.5)     # SUBACK
+        pub.connect("127.0.0.1", broker_port)
+        pub.loop_start()
+
+        t0 = time.monotonic()
+        for i in range(SCALE_MESSAGES):
+            # ทุก message ไม่ซ้ำกัน: (node, seq, ts) ต่างกัน
+            node = f"esp{i % SCALE_NODES}"
+            pub.publish(esp_topic(node), f"{600 + i % 400},60.0,{1800 + i % 200},{i},{1_790_000_000 + i}")
+
+        def points():
+            return stats.snapshot()["by_measurement"].get("mqtt_data", 0)
+
+        assert wait_until(lambda: points() >= SCALE_MESSAGES, SCALE_TIMEOUT_S, step=0.01)
+        elapsed = time.monotonic() - t0
+        time.sleep(2.0)     # batch ที่อาจซ้ำมาทีหลัง
+        return SCALE_MESSAGES / elapsed, points()
+    finally:
+        pub.loop_stop()
+        pub.disconnect()
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=10)
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.skipif((os.cpu_count() or 1) < 3, reason="needs a core per subscriber + broker / publisher")
+def test_share_group_processes_each_message_once_and_scales(mosquitto, tmp_path):
+    rate1, points1 = ingest_rate(1, mosquitto, tmp_path)
+    rate2, points2 = ingest_rate(2, mosquitto, tmp_path)
+    print(f"share group: x1 {rate1:.0f} msg/s, x2 {rate2:.0f} msg/s ({rate2 / rate1:.2f}x)")
+    assert points1 == SCALE_MESSAGES
+    assert points2 == SCALE_MESSAGES
+    assert rate2 > rate1 * 1.2
+
+
+# -------------------- relay lease --------------------
+HOLDER = """
+import sys
+sys.path.insert(0, {bench!r})
+from hw_shim import HardwareShim
+shim = HardwareShim()
+sub = shim.load("subscriber_main_on_pi")
+sub.RELAY_LOCK_PATH = {path!r}
+print(sub.try_acquire_relay(), flush=True)
+sys.stdin.read()
+"""
+
+
+@pytest.fixture
+def sub(shim, tmp_path):
+    sub = shim.load("subscriber_main_on_pi")
+    old = sub.RELAY_LOCK_PATH, sub.relay_owner, sub.relay_lock_file
+    sub.RELAY_LOCK_PATH = str(tmp_path / "relay.lock")
+    sub.relay_owner, sub.relay_lock_file = False, None
+    yield sub
+    if sub.relay_lock_file is not None and sub.relay_lock_file is not old[2]:
+        sub.relay_lock_file.close()
+    sub.RELAY_LOCK_PATH, sub.relay_owner, sub.relay_lock_file = old
+
+
+class Holder:
+    """Another process that loads the subscriber and tries to take the relay lock."""
+
+    def __init__(self, path):
+        self.proc = subprocess.Popen([sys.executable, "-c", HOLDER.format(bench=BENCH_DIR, path=path)],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.pid = self.proc.pid
+
+    def acquired(self):
+        for line in self.proc.stdout:
+            if line.strip() in ("True", "False"):
+                return line.strip() == "True"
+        raise AssertionError("holder exited without trying the lock")
+
+    def exit(self):
+        self.proc.stdin.close()     # ออกจาก process -> OS ปล่อย lock
+        self.proc.wait(timeout=10)
+
+
+def test_only_one_process_holds_the_relay_lease(sub):
+    holder = Holder(sub.RELAY_LOCK_PATH)
+    try:
+        assert holder.acquired()
+        assert sub.try_acquire_relay() is False
+        assert sub.relay_owner is False
+        with open(sub.RELAY_LOCK_PATH) as f:
+            assert f.read() == str(holder.pid)
+    finally:
+        holder.exit()
+
+    # เจ้าของเดิมตาย -> lease ย้ายมาที่ process นี้ และ process อื่นเอาไปไม่ได้
+    assert sub.try_acquire_relay() is True
+    assert sub.relay_owner is True
+    second = Holder(sub.RELAY_LOCK_PATH)
+    try:
+        assert second.acquired() is False
+    finally:
+        second.exit()